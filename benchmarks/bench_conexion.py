@@ -0,0 +1,62 @@
+"""
+Benchmark de los métodos más usados de Database
+
+Mide operaciones por segundo de las llamadas que hace el bot en cada mensaje
+(identidad del usuario, resumen, lista) y de la inserción de facturas.
+
+Uso:
+    python -m benchmarks.bench_conexion [--iteraciones 2000] [--facturas 2000]
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+import logging
+from src.database import Database
+
+
+def _medir(nombre: str, funcion, iteraciones: int):
+    """Ejecuta una función N veces e imprime operaciones por segundo"""
+    inicio = time.perf_counter()
+    for i in range(iteraciones):
+        funcion(i)
+    duracion = time.perf_counter() - inicio
+    print(f"{nombre:<28} {iteraciones / duracion:>10.0f} ops/s   {duracion / iteraciones * 1e6:>8.1f} µs/op")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iteraciones', type=int, default=2000)
+    parser.add_argument('--facturas', type=int, default=2000)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        db = Database(os.path.join(carpeta, 'bench.db'))
+        user_id = 1
+        db.registrar_usuario(user_id, 'Usuario Benchmark')
+
+        random.seed(42)
+        for i in range(args.facturas):
+            db.insertar_factura(user_id, f"2025-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+                                str(random.randint(1000000, 9999999)), f'Proveedor {i % 50}', 'A1B2C3D4',
+                                str(i), random.choice(['ALIMENTACIÓN', 'COMBUSTIBLE']),
+                                round(random.uniform(10, 500), 2), 'facturas/x.jpg')
+
+        n = args.iteraciones
+        _medir('usuario_existe', lambda i: db.usuario_existe(user_id), n)
+        _medir('obtener_nombre_usuario', lambda i: db.obtener_nombre_usuario(user_id), n)
+        _medir('contar_facturas_usuario', lambda i: db.contar_facturas_usuario(user_id), n)
+        _medir('obtener_resumen (mes)', lambda i: db.obtener_resumen(user_id, 6, 2025), n)
+        _medir('obtener_facturas', lambda i: db.obtener_facturas(user_id, limit=20), n)
+        _medir('obtener_meses_con_datos', lambda i: db.obtener_meses_con_datos(user_id), n)
+        _medir('insertar_factura', lambda i: db.insertar_factura(
+            user_id, '2025-06-15', '1234567', 'Proveedor', 'A1B2C3D4', str(i),
+            'COMBUSTIBLE', 100.0, 'facturas/x.jpg'), max(n // 4, 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+"""
+Benchmark de escala de Database con datos sintéticos
+
+Genera bases de datos de 10k, 100k y 1M facturas con una distribución parecida
+a la real (pocos usuarios con muchas facturas, proveedores frecuentes, más
+facturas a fin de mes) y mide cada método público con un solo usuario y con
+varios hilos llamando a la vez. Los resultados se guardan en JSON para poder
+compararlos entre commits.
+
+Uso:
+    python -m benchmarks.bench_escala [--filas 10000 100000 1000000] [--hilos 8]
+    python -m benchmarks.bench_escala --filas 10000 --salida antes.json
+    python -m benchmarks.bench_escala --filas 10000 --comparar antes.json
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import sqlite3
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Tuple
+from src.config import TIPOS_GASTO
+from src.database import Database
+
+# Proporción de facturas por tipo de gasto y monto típico (mediana, dispersión lognormal)
+_TIPOS = {
+    'ALIMENTACIÓN': (0.62, 65.0, 0.6),
+    'COMBUSTIBLE': (0.38, 250.0, 0.5),
+}
+_GIROS = ['GASOLINERA', 'RESTAURANTE', 'CAFETERÍA', 'COMEDOR', 'ESTACIÓN DE SERVICIO', 'PANADERÍA']
+_NOMBRES = ['LA ESPERANZA', 'EL SOL', 'SAN JOSÉ', 'LOS ÁNGELES', 'DON PEDRO', 'LA FAMILIA',
+            'EL CRUCE', 'SANTA ANA', 'LA PAZ', 'EL MIRADOR', 'LAS PALMAS', 'CENTRAL']
+
+_ANIOS_HISTORIA = 3
+
+
+def _commit_actual() -> Optional[str]:
+    """Commit de git del código medido (None fuera de un repositorio)"""
+    try:
+        resultado = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                   text=True, check=True)
+        return resultado.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _proveedores(cantidad: int, rng: random.Random) -> List[Tuple[str, str, str]]:
+    """Directorio de proveedores (nit, nombre, tipo) con pesos tipo Zipf"""
+    proveedores = []
+    for i in range(cantidad):
+        tipo = 'COMBUSTIBLE' if rng.random() < _TIPOS['COMBUSTIBLE'][0] else 'ALIMENTACIÓN'
+        nit = f"{rng.randint(100000, 99999999)}-{rng.choice('0123456789K')}"
+        nombre = f"{rng.choice(_GIROS)} {rng.choice(_NOMBRES)} {i}"
+        proveedores.append((nit, nombre, tipo))
+    return proveedores
+
+
+def _fecha(rng: random.Random, hoy: date) -> str:
+    """Fecha en los últimos años, con más facturas a medida que se acerca el cierre de mes"""
+    dias = int(rng.triangular(0, 365 * _ANIOS_HISTORIA, 0))
+    fecha = hoy - timedelta(days=dias)
+    # Corrimiento hacia fin de mes: los viáticos se cargan en la última semana
+    if rng.random() < 0.3 and fecha.day < 22:
+        fecha = fecha.replace(day=rng.randint(22, 28))
+    return fecha.strftime('%Y-%m-%d')
+
+
+def generar_datos(ruta: str, filas: int, semilla: int = 42) -> dict:
+    """
+    Crea una base de datos sintética con el esquema actual
+
+    Los usuarios siguen una distribución de Pareto (unos pocos registran la
+    mayoría de las facturas). La carga se hace en una sola transacción con
+    executemany; los triggers mantienen resumen_mensual y la búsqueda.
+
+    Returns:
+        dict: usuarios, filas, segundos y MB del archivo
+    """
+    inicio = time.perf_counter()
+    rng = random.Random(semilla)
+    hoy = date.today()
+
+    # La primera apertura aplica las migraciones
+    Database(ruta).cerrar()
+
+    usuarios = max(10, filas // 200)
+    pesos_usuarios = [rng.paretovariate(1.2) for _ in range(usuarios)]
+    proveedores = _proveedores(max(50, int(math.sqrt(filas) * 4)), rng)
+    pesos_proveedores = [1 / (i + 1) for i in range(len(proveedores))]
+    ahora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def facturas():
+        ids = rng.choices(range(1, usuarios + 1), weights=pesos_usuarios, k=filas)
+        elegidos = rng.choices(proveedores, weights=pesos_proveedores, k=filas)
+        for i, (user_id, (nit, nombre, tipo)) in enumerate(zip(ids, elegidos)):
+            _, mediana, dispersion = _TIPOS.get(tipo, (0, 100.0, 0.5))
+            centavos = round(rng.lognormvariate(math.log(mediana), dispersion) * 100)
+            yield (user_id, _fecha(rng, hoy), nit, nombre, f"{rng.getrandbits(32):08X}",
+                   str(rng.randint(1, 4294967295)), tipo, centavos, f'facturas/{i}.jpg', ahora)
+
+    conn = sqlite3.connect(ruta)
+    try:
+        with conn:
+            conn.executemany('INSERT INTO usuarios (user_id, nombre, created_at) VALUES (?, ?, ?)',
+                             [(u, f'Usuario {u}', ahora) for u in range(1, usuarios + 1)])
+            conn.executemany('''INSERT INTO facturas
+                                (user_id, fecha, nit_proveedor, nombre_proveedor, serie, numero,
+                                 tipo_gasto, monto_centavos, foto_path, created_at)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', facturas())
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+
+    return {
+        'usuarios': usuarios,
+        'filas': filas,
+        'generacion_s': round(time.perf_counter() - inicio, 2),
+        'tamano_mb': round(os.path.getsize(ruta) / 1e6, 1),
+    }
+
+
+def _estadisticas(duraciones: List[float]) -> dict:
+    """Resumen de latencias en milisegundos"""
+    duraciones = sorted(duraciones)
+    n = len(duraciones)
+    total = sum(duraciones)
+    return {
+        'llamadas': n,
+        'ops_s': round(n / total, 1) if total else None,
+        'promedio_ms': round(total / n * 1000, 4),
+        'p50_ms': round(duraciones[n // 2] * 1000, 4),
+        'p95_ms': round(duraciones[min(n - 1, int(n * 0.95))] * 1000, 4),
+        'max_ms': round(duraciones[-1] * 1000, 4),
+    }
+
+
+def _operaciones(db: Database, anio: int, mes: int) -> Dict[str, Callable[[int, int], object]]:
+    """Métodos medidos: cada uno recibe (user_id, iteración)"""
+    insertadas: Dict[int, List[int]] = {}
+    lock = threading.Lock()
+
+    def insertar(user_id: int, i: int):
+        factura_id = db.insertar_factura(user_id, f'{anio}-{mes:02d}-15', '1234567-8', 'PROVEEDOR BENCHMARK',
+                                         'BENCH', str(i), TIPOS_GASTO[i % len(TIPOS_GASTO)], Decimal('100.00'),
+                                         'facturas/bench.jpg')
+        with lock:
+            insertadas.setdefault(user_id, []).append(factura_id)
+
+    def eliminar(user_id: int, i: int):
+        # Borra las facturas que insertó el propio benchmark para no alterar los datos
+        with lock:
+            pendientes = insertadas.get(user_id)
+            factura_id = pendientes.pop() if pendientes else None
+        if factura_id is not None:
+            db.eliminar_factura(user_id, factura_id)
+
+    return {
+        'obtener_resumen (mes)': lambda u, i: db.obtener_resumen(u, mes, anio),
+        'obtener_resumen (total)': lambda u, i: db.obtener_resumen(u),
+        'obtener_meses_con_datos': lambda u, i: db.obtener_meses_con_datos(u),
+        'obtener_facturas': lambda u, i: db.obtener_facturas(u, limit=20),
+        'obtener_todas_facturas (mes)': lambda u, i: db.obtener_todas_facturas(u, mes, anio),
+        'obtener_todas_facturas': lambda u, i: db.obtener_todas_facturas(u),
+        'iterar_facturas': lambda u, i: sum(1 for _ in db.iterar_facturas(u)),
+        'insertar_factura': insertar,
+        'eliminar_factura': eliminar,
+    }
+
+
+# Las consultas que devuelven todas las facturas de un usuario se repiten menos veces
+_ITERACIONES_REDUCIDAS = ('obtener_todas_facturas', 'iterar_facturas')
+
+
+def _iteraciones(nombre: str, iteraciones: int) -> int:
+    if nombre.startswith(_ITERACIONES_REDUCIDAS):
+        return max(iteraciones // 20, 3)
+    return iteraciones
+
+
+def _usuarios_por_volumen(ruta: str) -> Tuple[int, int]:
+    """Usuario con más facturas y usuario mediano"""
+    conn = sqlite3.connect(ruta)
+    try:
+        filas = conn.execute('''SELECT user_id, SUM(cantidad) AS n FROM resumen_mensual
+                                GROUP BY user_id ORDER BY n DESC''').fetchall()
+    finally:
+        conn.close()
+    return filas[0][0], filas[len(filas) // 2][0]
+
+
+def medir_un_usuario(db: Database, user_id: int, iteraciones: int, anio: int, mes: int) -> dict:
+    """Cada método llamado en secuencia desde un solo hilo"""
+    resultados = {}
+    for nombre, operacion in _operaciones(db, anio, mes).items():
+        duraciones = []
+        for i in range(_iteraciones(nombre, iteraciones)):
+            inicio = time.perf_counter()
+            operacion(user_id, i)
+            duraciones.append(time.perf_counter() - inicio)
+        resultados[nombre] = _estadisticas(duraciones)
+    return resultados
+
+
+def medir_concurrente(db: Database, usuarios: int, hilos: int, iteraciones: int,
+                      anio: int, mes: int, semilla: int) -> dict:
+    """
+    Varios hilos llamando a la vez, cada uno con usuarios al azar
+
+    Cada hilo recorre todos los métodos en orden aleatorio, como hacen los
+    mensajes de distintos usuarios en el bot.
+    """
+    operaciones = _operaciones(db, anio, mes)
+    duraciones: Dict[str, List[float]] = {nombre: [] for nombre in operaciones}
+    errores = []
+    lock = threading.Lock()
+
+    def trabajador(indice: int):
+        rng = random.Random(semilla + indice)
+        user_id = rng.randint(1, usuarios)
+        tareas = [(nombre, i) for nombre in operaciones
+                  for i in range(max(_iteraciones(nombre, iteraciones) // hilos, 1))]
+        rng.shuffle(tareas)
+        # Las inserciones van antes que los borrados del mismo hilo
+        tareas.sort(key=lambda t: t[0] == 'eliminar_factura')
+        propias = {nombre: [] for nombre in operaciones}
+        try:
+            for nombre, i in tareas:
+                inicio = time.perf_counter()
+                operaciones[nombre](user_id, indice * 1_000_000 + i)
+                propias[nombre].append(time.perf_counter() - inicio)
+        except Exception as e:
+            errores.append(repr(e))
+        with lock:
+            for nombre, valores in propias.items():
+                duraciones[nombre].extend(valores)
+
+    inicio = time.perf_counter()
+    trabajadores = [threading.Thread(target=trabajador, args=(i,)) for i in range(hilos)]
+    for hilo in trabajadores:
+        hilo.start()
+    for hilo in trabajadores:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+
+    total = sum(len(v) for v in duraciones.values())
+    return {
+        'hilos': hilos,
+        'duracion_s': round(duracion, 3),
+        'ops_s': round(total / duracion, 1),
+        'errores': errores,
+        'metodos': {nombre: _estadisticas(v) for nombre, v in duraciones.items() if v},
+    }
+
+
+def ejecutar(filas: int, carpeta: str, iteraciones: int, hilos: int, semilla: int) -> dict:
+    """Genera (o reutiliza) la base de datos de un tamaño y ejecuta las mediciones"""
+    ruta = os.path.join(carpeta, f'escala-{filas}-{semilla}.db')
+    if os.path.exists(ruta):
+        print(f"[{filas}] reutilizando {ruta}", flush=True)
+        conn = sqlite3.connect(ruta)
+        usuarios = conn.execute('SELECT COUNT(*) FROM usuarios').fetchone()[0]
+        conn.close()
+        datos = {'usuarios': usuarios, 'filas': filas, 'generacion_s': None,
+                 'tamano_mb': round(os.path.getsize(ruta) / 1e6, 1)}
+    else:
+        print(f"[{filas}] generando datos...", flush=True)
+        datos = generar_datos(ruta, filas, semilla)
+        print(f"[{filas}] {datos['usuarios']} usuarios en {datos['generacion_s']}s "
+              f"({datos['tamano_mb']} MB)", flush=True)
+
+    db = Database(ruta)
+    try:
+        hoy = date.today()
+        anio, mes = hoy.year, hoy.month
+        pesado, mediano = _usuarios_por_volumen(ruta)
+        resultado = dict(datos)
+        resultado['usuario_pesado'] = {'user_id': pesado, 'facturas': db.contar_facturas_usuario(pesado),
+                                       'metodos': medir_un_usuario(db, pesado, iteraciones, anio, mes)}
+        resultado['usuario_mediano'] = {'user_id': mediano, 'facturas': db.contar_facturas_usuario(mediano),
+                                        'metodos': medir_un_usuario(db, mediano, iteraciones, anio, mes)}
+        resultado['concurrente'] = medir_concurrente(db, datos['usuarios'], hilos, iteraciones,
+                                                     anio, mes, semilla)
+        return resultado
+    finally:
+        db.cerrar()
+
+
+def _imprimir(resultados: dict, anterior: Optional[dict] = None):
+    """Tabla de p50 por método; con un resultado anterior muestra el cambio relativo"""
+    for filas, resultado in resultados['resultados'].items():
+        print(f"\n== {int(filas):,} filas, {resultado['usuarios']} usuarios ==")
+        previo = (anterior or {}).get('resultados', {}).get(filas)
+        for escenario in ('usuario_pesado', 'usuario_mediano', 'concurrente'):
+            metodos = resultado[escenario]['metodos']
+            print(f"-- {escenario}")
+            for nombre, datos in metodos.items():
+                linea = f"   {nombre:<30} p50 {datos['p50_ms']:>10.3f} ms   p95 {datos['p95_ms']:>10.3f} ms"
+                if previo and nombre in previo[escenario]['metodos']:
+                    antes = previo[escenario]['metodos'][nombre]['p50_ms']
+                    if antes:
+                        linea += f"   {(datos['p50_ms'] - antes) / antes * 100:>+7.1f}% vs {anterior['commit']}"
+                print(linea)
+        concurrente = resultado['concurrente']
+        print(f"   total concurrente: {concurrente['ops_s']} ops/s con {concurrente['hilos']} hilos, "
+              f"{len(concurrente['errores'])} errores")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filas', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--iteraciones', type=int, default=200, help='Llamadas por método')
+    parser.add_argument('--hilos', type=int, default=8, help='Hilos del escenario concurrente')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--datos', help='Carpeta donde conservar las bases generadas para reutilizarlas')
+    parser.add_argument('--salida', help='Archivo JSON de resultados (por defecto bench_escala-<commit>.json)')
+    parser.add_argument('--comparar', help='JSON de una ejecución anterior para comparar')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    commit = _commit_actual()
+    resultados = {
+        'commit': commit,
+        'fecha': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'plataforma': platform.platform(),
+        'parametros': {'iteraciones': args.iteraciones, 'hilos': args.hilos, 'semilla': args.semilla},
+        'resultados': {},
+    }
+
+    with tempfile.TemporaryDirectory() as temporal:
+        carpeta = args.datos or temporal
+        os.makedirs(carpeta, exist_ok=True)
+        for filas in args.filas:
+            resultados['resultados'][str(filas)] = ejecutar(filas, carpeta, args.iteraciones,
+                                                             args.hilos, args.semilla)
+
+    salida = args.salida or f"bench_escala-{commit or 'local'}.json"
+    with open(salida, 'w', encoding='utf-8') as archivo:
+        json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            anterior = json.load(archivo)
+    _imprimir(resultados, anterior)
+    print(f"\nResultados guardados en {salida}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Benchmark de carga de escrituras concurrentes en Database
+
+Simula el cierre de mes: muchos usuarios subiendo facturas al mismo tiempo.
+Cada hilo inserta facturas (y borra una de cada diez) y se mide el total de
+operaciones por segundo y los commits por segundo.
+
+Uso:
+    python -m benchmarks.bench_escrituras [--hilos 16] [--operaciones 500]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import logging
+import threading
+from src.database import Database
+
+
+def _trabajador(db: Database, user_id: int, operaciones: int, errores: list):
+    """Inserta facturas para un usuario y borra una de cada diez"""
+    try:
+        for i in range(operaciones):
+            # Una serie por usuario: el índice único rechaza NIT, serie y número repetidos
+            factura_id = db.insertar_factura(user_id, '2025-06-15', '1234567', 'Proveedor', f'A1B2C3D4-{user_id}',
+                                             str(i), 'COMBUSTIBLE', 100.0, 'facturas/x.jpg')
+            if i % 10 == 9:
+                db.eliminar_factura(user_id, factura_id)
+    except Exception as e:
+        errores.append(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hilos', type=int, default=16)
+    parser.add_argument('--operaciones', type=int, default=500, help='Inserciones por hilo')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        db = Database(os.path.join(carpeta, 'bench.db'))
+        for user_id in range(args.hilos):
+            db.registrar_usuario(user_id, f'Usuario {user_id}')
+
+        errores = []
+        hilos = [threading.Thread(target=_trabajador, args=(db, user_id, args.operaciones, errores))
+                 for user_id in range(args.hilos)]
+
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+
+        total = args.hilos * (args.operaciones + args.operaciones // 10)
+        # Sin cola de escritura cada operación es su propio commit
+        estadisticas = getattr(db, 'estadisticas_escrituras', lambda: {'lotes': total})()
+
+        print(f"hilos={args.hilos} operaciones={total} errores={len(errores)}")
+        print(f"operaciones/s: {total / duracion:>10.0f}")
+        print(f"commits/s:     {estadisticas['lotes'] / duracion:>10.0f}")
+        print(f"ops/commit:    {total / max(estadisticas['lotes'], 1):>10.1f}")
+        db.cerrar()
+
+
+if __name__ == '__main__':
+    main()
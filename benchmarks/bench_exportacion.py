@@ -0,0 +1,194 @@
+"""
+Benchmark de la exportación a Excel
+
+Compara generar_excel (openpyxl en modo de solo escritura, leyendo las facturas por
+lotes con iterar_facturas) con la implementación anterior basada en pandas
+(DataFrame + to_excel y después formato celda por celda), que se reproduce aquí
+como referencia. Cada caso corre en un proceso aparte para medir también la
+importación de los módulos y la memoria máxima del proceso (RSS).
+
+Uso:
+    python -m benchmarks.bench_exportacion [--filas 100 10000 100000]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import logging
+import argparse
+import tempfile
+import subprocess
+from datetime import date, datetime, timedelta
+from src.config import EXCEL_CONFIG, TIPOS_GASTO
+from src.database import Database
+from src.utils import formatear_fecha
+
+_USER_ID = 1
+
+
+def _crear_base(ruta: str, filas: int):
+    """Base de datos con un usuario y `filas` facturas repartidas en un año"""
+    db = Database(ruta)
+    db.registrar_usuario(_USER_ID, 'Usuario Benchmark')
+    db.cerrar()
+
+    rng = random.Random(42)
+    inicio = date(2025, 1, 1)
+    conn = sqlite3.connect(ruta)
+    conn.executemany('''INSERT INTO facturas
+                        (user_id, fecha, nit_proveedor, nombre_proveedor, serie, numero,
+                         tipo_gasto, monto_centavos, foto_path, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                     ((_USER_ID, (inicio + timedelta(days=rng.randrange(365))).isoformat(),
+                       str(rng.randint(1000000, 9999999)), f'PROVEEDOR {i % 300}', 'A1B2C3D4', str(i),
+                       rng.choice(TIPOS_GASTO), rng.randint(1000, 50000), f'facturas/{i}.jpg',
+                       '2025-01-01 00:00:00') for i in range(filas)))
+    conn.commit()
+    conn.close()
+
+
+def _generar_excel_pandas(facturas, filepath: str):
+    """Exportador anterior: DataFrame completo, to_excel y formato sobre la hoja ya escrita"""
+    import pandas as pd
+    from openpyxl.styles import Font, Alignment
+
+    df = pd.DataFrame(facturas, columns=EXCEL_CONFIG['columns'])
+    df['FECHA'] = df['FECHA'].map(formatear_fecha)
+
+    with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='Sheet1', startrow=EXCEL_CONFIG['data_start_row'] - 1, index=False)
+        sheet = writer.sheets['Sheet1']
+
+        sheet['G2'] = 'PROYECTO :'
+        sheet['G3'] = 'NOMBRE SUPERVISOR'
+        sheet['G4'] = 'CODIGO MAESTRO'
+        sheet['G5'] = 'PUESTO'
+        sheet['H5'] = 'SUPERVISOR JR'
+        sheet['G6'] = 'MES'
+        sheet['H6'] = datetime.now().strftime('%B').upper()
+        sheet['I6'] = 'FECHA'
+        sheet['J6'] = datetime.now().strftime('%Y-%m-%d')
+
+        for cell in sheet[EXCEL_CONFIG['data_start_row']]:
+            cell.font = Font(bold=True)
+            cell.alignment = Alignment(horizontal='center', vertical='center')
+
+        for col, width in EXCEL_CONFIG['column_widths'].items():
+            sheet.column_dimensions[col].width = width
+
+        start_row = EXCEL_CONFIG['data_start_row'] + 1
+        for idx, row in enumerate(range(start_row, start_row + len(df)), start=1):
+            sheet[f'A{row}'] = idx
+
+
+def _memoria_maxima_mb() -> float:
+    """RSS máximo del proceso (None donde no está el módulo resource)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB y macOS en bytes
+    return maximo / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _ejecutar_caso(caso: str, db_path: str, carpeta: str) -> dict:
+    """Corre un exportador en este proceso y devuelve sus tiempos, memoria y tamaño"""
+    inicio = time.perf_counter()
+    if caso == 'pandas':
+        import pandas  # noqa: F401  (la importación es parte del costo del exportador anterior)
+    else:
+        from src import excel_export
+    importado = time.perf_counter()
+
+    db = Database(db_path)
+    try:
+        if caso == 'pandas':
+            # El exportador anterior recibía la lista completa, con los montos como float
+            facturas = [(f.fecha, f.nit_proveedor, f.nombre_proveedor, f.serie, f.numero,
+                         f.tipo_gasto, float(f.monto)) for f in db.obtener_todas_facturas(_USER_ID)]
+            ruta = os.path.join(carpeta, 'pandas.xlsx')
+            _generar_excel_pandas(facturas, ruta)
+        else:
+            excel_export.FACTURAS_FOLDER = carpeta
+            ruta = excel_export.generar_excel(db.iterar_facturas(_USER_ID), 'Usuario Benchmark', 'Todas')[0]
+    finally:
+        db.cerrar()
+    fin = time.perf_counter()
+
+    return {
+        'importacion_s': importado - inicio,
+        'exportacion_s': fin - importado,
+        'memoria_mb': _memoria_maxima_mb(),
+        'tamano_kb': os.path.getsize(ruta) / 1024
+    }
+
+
+def _medir(caso: str, db_path: str, carpeta: str) -> dict:
+    """Corre un caso en un proceso nuevo (importaciones y memoria sin compartir)"""
+    resultado = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_exportacion', '--caso', caso, '--db', db_path,
+         '--carpeta', carpeta],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(resultado.stdout.strip().splitlines()[-1])
+
+
+def _hay_pandas() -> bool:
+    try:
+        import pandas  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filas', type=int, nargs='+', default=[100, 10000, 100000])
+    # Uso interno: un solo caso dentro del proceso hijo
+    parser.add_argument('--caso', choices=['actual', 'pandas'], help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--carpeta', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    if args.caso:
+        print(json.dumps(_ejecutar_caso(args.caso, args.db, args.carpeta)))
+        return
+
+    casos = ['actual']
+    if _hay_pandas():
+        casos.append('pandas')
+    else:
+        print("pandas no está instalado: solo se mide el exportador actual")
+
+    print(f"{'filas':>8}  {'exportador':<10} {'importación':>12} {'exportación':>12} "
+          f"{'memoria máx.':>13} {'archivo':>10}")
+    with tempfile.TemporaryDirectory() as carpeta:
+        for filas in args.filas:
+            db_path = os.path.join(carpeta, f'bench_{filas}.db')
+            _crear_base(db_path, filas)
+
+            resultados = {}
+            for caso in casos:
+                r = resultados[caso] = _medir(caso, db_path, carpeta)
+                memoria = f"{r['memoria_mb']:>10.0f} MB" if r['memoria_mb'] is not None else f"{'-':>13}"
+                print(f"{filas:>8}  {caso:<10} {r['importacion_s']:>11.2f}s {r['exportacion_s']:>11.2f}s "
+                      f"{memoria} {r['tamano_kb']:>7.0f} KB")
+
+            if 'pandas' in resultados:
+                actual, pandas = resultados['actual'], resultados['pandas']
+                tiempo = ((actual['importacion_s'] + actual['exportacion_s'])
+                          / (pandas['importacion_s'] + pandas['exportacion_s']))
+                linea = f"{'':>8}  actual/pandas: tiempo {tiempo:.0%}"
+                if actual['memoria_mb'] and pandas['memoria_mb']:
+                    linea += f", memoria {actual['memoria_mb'] / pandas['memoria_mb']:.0%}"
+                print(linea)
+
+
+if __name__ == '__main__':
+    main()
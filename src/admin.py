@@ -0,0 +1,244 @@
+"""
+Comandos de administración de Samantha
+Tareas de mantenimiento que se ejecutan desde la terminal, con el bot encendido o apagado
+
+Uso:
+    python -m src.admin reconstruir-resumenes
+    python -m src.admin respaldar
+    python -m src.admin restaurar respaldos/viaticos-20250101-030000.db
+    python -m src.admin archivar [2022 2023]
+    python -m src.admin verificar-planes
+    python -m src.admin duplicados
+    python -m src.admin mantenimiento [--vacuum]
+    python -m src.admin importar 123456789 gastos-2024.xlsx [--simular]
+"""
+
+import sys
+import argparse
+import logging
+from .config import DATABASE_NAME, MANTENIMIENTO_CONFIG
+from .database import Database
+from .excel_import import leer_facturas
+from .instrumentacion import es_escaneo_completo
+from .respaldo import crear_respaldo, listar_respaldos, restaurar_respaldo
+from .utils import configurar_logging, formatear_fecha, formatear_monto
+
+logger = logging.getLogger(__name__)
+
+
+def reconstruir_resumenes(db: Database, args: argparse.Namespace) -> int:
+    """Recalcula la tabla resumen_mensual desde facturas"""
+    filas = db.reconstruir_resumenes()
+    print(f"✓ Resumen mensual reconstruido: {filas} filas")
+    return 0
+
+
+def respaldar(db: Database, args: argparse.Namespace) -> int:
+    """Crea un respaldo verificado de la base de datos y aplica la retención"""
+    ruta = crear_respaldo(db, args.directorio)
+    print(f"✓ Respaldo creado: {ruta}")
+    return 0
+
+
+def restaurar(db: None, args: argparse.Namespace) -> int:
+    """Restaura la base de datos desde un respaldo (con el bot detenido)"""
+    db_path = args.db or DATABASE_NAME
+    if not args.archivo:
+        respaldos = listar_respaldos(db_path, args.directorio)
+        if not respaldos:
+            print("No hay respaldos disponibles")
+            return 1
+        print("Respaldos disponibles (del más reciente al más antiguo):")
+        for ruta in respaldos:
+            print(f"  {ruta}")
+        return 0
+
+    anterior = restaurar_respaldo(args.archivo, db_path, args.directorio)
+    if anterior:
+        print(f"✓ Estado anterior guardado en: {anterior}")
+    print(f"✓ Base de datos restaurada desde: {args.archivo}")
+    return 0
+
+
+def archivar(db: Database, args: argparse.Namespace) -> int:
+    """Mueve las facturas de años cerrados a sus archivos anuales"""
+    anios = args.anios or db.anios_archivables()
+    if not anios:
+        print("No hay años cerrados para archivar")
+        return 0
+
+    for anio in anios:
+        movidas = db.archivar_anio(anio, args.directorio)
+        print(f"✓ Año {anio}: {movidas} facturas archivadas")
+    return 0
+
+
+def ejecutar_consultas_frecuentes(db: Database, user_id: int, mes: int = 1, anio: int = 2025):
+    """Ejecuta una vez cada consulta frecuente del bot (la usan verificar-planes y sus pruebas)"""
+    db.obtener_usuario(user_id)
+    db.contar_facturas_usuario(user_id)
+    db.obtener_resumen(user_id)
+    db.obtener_resumen(user_id, mes, anio)
+    db.obtener_meses_con_datos(user_id)
+    db.obtener_facturas(user_id)
+    db.obtener_facturas_pagina(user_id)
+    db.obtener_facturas_pagina(user_id, antes_de_id=10 ** 9)
+    db.obtener_facturas_pagina(user_id, despues_de_id=0)
+    db.obtener_facturas_pagina(user_id, mes=mes, anio=anio, tipo_gasto='COMBUSTIBLE')
+    db.buscar_facturas(user_id, 'a')
+    db.buscar_factura_duplicada('1234567-8', 'A1B2C3D4', '1')
+    db.obtener_todas_facturas(user_id)
+    db.obtener_todas_facturas(user_id, mes, anio)
+
+
+def verificar_planes(db: Database, args: argparse.Namespace) -> int:
+    """Ejecuta las consultas frecuentes del bot y falla si alguna recorre una tabla completa"""
+    db._metricas.capturar_planes = True
+    ejecutar_consultas_frecuentes(db, args.user_id)
+
+    escaneos = 0
+    for (consulta, sql), plan in sorted(db._metricas.planes().items()):
+        completos = [paso for paso in plan if es_escaneo_completo(paso)]
+        escaneos += len(completos)
+        marca = '❌' if completos else '✓'
+        print(f"{marca} {consulta}: {sql[:100]}")
+        for paso in plan:
+            print(f"      {paso}")
+
+    if escaneos:
+        print(f"❌ {escaneos} recorridos completos de tabla en consultas frecuentes")
+        return 1
+    print("✓ Ninguna consulta frecuente recorre una tabla completa")
+    return 0
+
+
+def duplicados(db: Database, args: argparse.Namespace) -> int:
+    """Lista las facturas que repiten NIT, serie y número (termina con código 1 si hay)"""
+    grupos = db.obtener_duplicados()
+    if not grupos:
+        print("✓ No hay facturas duplicadas")
+        return 0
+
+    for grupo in grupos:
+        _, _, _, nit, serie, numero, _, _ = grupo[0]
+        print(f"NIT {nit} | serie {serie} | número {numero}: {len(grupo)} facturas")
+        for factura_id, user_id, fecha, _, _, _, monto, duplicado_de in grupo:
+            marca = f" (guardada como duplicado de #{duplicado_de})" if duplicado_de else ""
+            print(f"    #{factura_id} usuario {user_id} | {formatear_fecha(fecha)} | "
+                  f"{formatear_monto(monto)}{marca}")
+
+    repetidas = sum(len(grupo) - 1 for grupo in grupos)
+    print(f"❌ {len(grupos)} facturas repetidas ({repetidas} copias de más)")
+    return 1
+
+
+def mantenimiento(db: Database, args: argparse.Namespace) -> int:
+    """Ejecuta el mantenimiento diario ahora; con --vacuum antes compacta la base de datos"""
+    if args.vacuum:
+        db.compactar()
+        print("✓ Base de datos compactada (auto_vacuum INCREMENTAL)")
+
+    presupuesto = MANTENIMIENTO_CONFIG['presupuesto_s'] if args.presupuesto is None else args.presupuesto
+    duraciones = db.mantenimiento(presupuesto, MANTENIMIENTO_CONFIG['limite_analisis'],
+                                  MANTENIMIENTO_CONFIG['paginas_por_paso'])
+    for paso, duracion_ms in duraciones.items():
+        print(f"  {paso}: {duracion_ms:.1f} ms")
+    print(f"✓ Mantenimiento terminado: {len(duraciones)} de 4 pasos")
+    return 0
+
+
+def _imprimir_filas(titulo: str, filas, maximo: int = 50):
+    print(f"{titulo}: {len(filas)}")
+    for numero_fila, motivo in filas[:maximo]:
+        print(f"    fila {numero_fila}: {motivo}")
+    if len(filas) > maximo:
+        print(f"    ... y {len(filas) - maximo} más")
+
+
+def importar(db: Database, args: argparse.Namespace) -> int:
+    """Importa las facturas de un .xlsx o .csv con las columnas de la plantilla para un usuario"""
+    if not db.usuario_existe(args.user_id):
+        print(f"❌ El usuario {args.user_id} no está registrado en el bot")
+        return 1
+
+    facturas, rechazadas = leer_facturas(args.archivo)
+    if rechazadas:
+        _imprimir_filas("Filas rechazadas", rechazadas)
+
+    if args.simular:
+        print(f"✓ {len(facturas)} facturas válidas (simulación: no se guardó nada)")
+        return 0
+
+    insertadas, duplicadas = db.importar_facturas(args.user_id, facturas)
+    if duplicadas:
+        _imprimir_filas("Filas duplicadas", duplicadas)
+    print(f"✓ {insertadas} facturas importadas para el usuario {args.user_id}")
+    return 0
+
+
+def main(argv=None) -> int:
+    """Punto de entrada de los comandos de administración"""
+    parser = argparse.ArgumentParser(prog='python -m src.admin', description='Administración de Samantha')
+    parser.add_argument('--db', default=None, help='Ruta de la base de datos (por defecto la configurada)')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    sub = subparsers.add_parser('reconstruir-resumenes', help='Recalcular los totales mensuales desde facturas')
+    sub.set_defaults(funcion=reconstruir_resumenes)
+
+    sub = subparsers.add_parser('respaldar', help='Respaldar la base de datos en caliente')
+    sub.add_argument('--directorio', default=None, help='Carpeta de respaldos (por defecto la configurada)')
+    sub.set_defaults(funcion=respaldar)
+
+    sub = subparsers.add_parser('restaurar', help='Restaurar un respaldo (detener el bot antes)')
+    sub.add_argument('archivo', nargs='?', help='Respaldo a restaurar; sin archivo lista los disponibles')
+    sub.add_argument('--directorio', default=None, help='Carpeta de respaldos (por defecto la configurada)')
+    # La base de datos se reemplaza completa: no se abre antes de restaurar
+    sub.set_defaults(funcion=restaurar, sin_db=True)
+
+    sub = subparsers.add_parser('archivar', help='Mover años cerrados a archivos anuales')
+    sub.add_argument('anios', nargs='*', type=int,
+                     help='Años a archivar; por defecto los anteriores a los años activos')
+    sub.add_argument('--directorio', default=None, help='Carpeta de archivos (por defecto la configurada)')
+    sub.set_defaults(funcion=archivar)
+
+    sub = subparsers.add_parser('verificar-planes',
+                                help='Revisar con EXPLAIN QUERY PLAN que las consultas frecuentes usen índices')
+    sub.add_argument('--user-id', type=int, default=0, help='Usuario con el que se ejecutan las consultas')
+    sub.set_defaults(funcion=verificar_planes)
+
+    sub = subparsers.add_parser('duplicados', help='Listar facturas con el mismo NIT, serie y número')
+    sub.set_defaults(funcion=duplicados)
+
+    sub = subparsers.add_parser('mantenimiento', help='ANALYZE, optimize, incremental_vacuum y checkpoint del WAL')
+    sub.add_argument('--presupuesto', type=float, default=None,
+                     help='Segundos máximos (por defecto el presupuesto configurado)')
+    sub.add_argument('--vacuum', action='store_true',
+                     help='VACUUM completo antes (bloquea las escrituras; activa auto_vacuum incremental)')
+    sub.set_defaults(funcion=mantenimiento)
+
+    sub = subparsers.add_parser('importar', help='Importar facturas desde un .xlsx o .csv con las columnas de la plantilla')
+    sub.add_argument('user_id', type=int, help='Usuario de Telegram al que se asignan las facturas')
+    sub.add_argument('archivo', help='Archivo .xlsx o .csv')
+    sub.add_argument('--simular', action='store_true', help='Solo validar el archivo, sin guardar')
+    sub.set_defaults(funcion=importar)
+
+    args = parser.parse_args(argv)
+
+    configurar_logging(nivel=logging.INFO)
+    if getattr(args, 'sin_db', False):
+        db = None
+    else:
+        db = Database(args.db) if args.db else Database()
+    try:
+        return args.funcion(db, args)
+    except Exception as e:
+        logger.error(f"Error en comando {args.comando}: {e}", exc_info=True)
+        print(f"❌ Error: {e}")
+        return 1
+    finally:
+        if db is not None:
+            db.cerrar()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,36 +4,85 @@ Lógica principal del bot con personalidad cálida y humana
 """
 
 import os
+import re
+import asyncio
+from decimal import Decimal
 import logging
 from datetime import datetime
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram.error import BadRequest
 from telegram.ext import (
     Application, CommandHandler, MessageHandler,
     filters, ContextTypes, ConversationHandler
 )
 
 from .config import (
-    TELEGRAM_TOKEN, TIPOS_GASTO, FACTURAS_FOLDER,
+    TELEGRAM_TOKEN, TIPOS_GASTO, FACTURAS_FOLDER, FACTURAS_POR_PAGINA, MAXIMO_FACTURAS_BORRADO,
     TIPO_GASTO, PHOTO, CONFIRMAR, EDITAR_CAMPO, EDITAR_VALOR, BORRAR_ID,
-    REGISTRO_NOMBRE, SELECCIONAR_MES, SELECCIONAR_ANIO, CAMBIAR_NOMBRE
+    REGISTRO_NOMBRE, SELECCIONAR_MES, SELECCIONAR_ANIO, CAMBIAR_NOMBRE,
+    LISTA_PAGINA, BUSCAR_TEXTO, BUSCAR_PAGINA, CONFIRMAR_DUPLICADO, BORRAR_CONFIRMAR, IMPORTAR_ARCHIVO,
+    BACKUP_CONFIG, MANTENIMIENTO_CONFIG, EXCEL_CONFIG, IMPORTACION_CONFIG
 )
-from .database import Database
+from .database import Database, FacturaDuplicada
+from .database_async import DatabaseAsync
 from .ocr import extraer_datos_factura
+from .preprocesamiento import registrar_resumen_etapas
 from .excel_export import generar_excel
+from .excel_import import leer_facturas
+from .respaldo import crear_respaldo
 from .utils import (
-    formatear_monto, truncar_texto, validar_monto,
-    obtener_nombre_mes, obtener_mes_actual, obtener_anio_actual, formatear_periodo
+    formatear_monto, truncar_texto, validar_monto, normalizar_fecha, formatear_fecha,
+    parsear_mes_anio, obtener_nombre_mes, obtener_mes_actual, obtener_anio_actual, formatear_periodo,
+    parsear_ids, eliminar_archivos
 )
 
 logger = logging.getLogger(__name__)
 
+# Botones de navegación de la lista de facturas
+LISTA_RECIENTES = '⬅️ Más recientes'
+LISTA_ANTIGUAS = 'Más antiguas ➡️'
+LISTA_FILTROS_TIPO = {
+    '🍔 Solo Alimentación': 'ALIMENTACIÓN',
+    '⛽ Solo Combustible': 'COMBUSTIBLE',
+    '🏷️ Todos los tipos': None
+}
+LISTA_TODOS_MESES = '📅 Todos los meses'
+
+# Botones de navegación de los resultados de búsqueda
+BUSQUEDA_ANTERIORES = '⬅️ Resultados anteriores'
+BUSQUEDA_SIGUIENTES = 'Más resultados ➡️'
+BUSQUEDA_NUEVA = '🔎 Nueva búsqueda'
+
+# Botón para guardar una factura que repite NIT, serie y número de otra
+DUPLICADO_GUARDAR = '💾 Guardar de todos modos'
+
+# Confirmación del borrado de facturas; la lista muestra como máximo este número de líneas
+BORRAR_SI = '✅ Sí, borrar'
+BORRAR_LINEAS_MAXIMAS = 15
+
+# Filas con errores o duplicadas que se muestran al terminar una importación
+IMPORTAR_LINEAS_MAXIMAS = 15
+
+
+# python-telegram-bot no expone el estado de una conversación: ConversationHandler guarda en
+# _conversations la llave (chat, usuario) -> estado mientras está activa (versión fijada en requirements.txt)
+def _conversacion_activa(handler: ConversationHandler, update: Update) -> bool:
+    return handler._get_key(update) in handler._conversations
+
+
+def _terminar_conversacion(handler: ConversationHandler, update: Update):
+    handler._update_state(ConversationHandler.END, handler._get_key(update))
+
 
 class SamanthaBot:
     """Bot de Viáticos Samantha"""
 
     def __init__(self):
         """Inicializar bot"""
-        self.db = Database()
+        self.db = DatabaseAsync(Database())
+        # Conversaciones que una foto no debe interrumpir y las que solo navegan (se configuran en setup_handlers)
+        self._conversaciones_en_espera = []
+        self._conversaciones_navegacion = []
         logger.info("Bot Samantha inicializado")
 
     def _get_user_id(self, update: Update) -> int:
@@ -44,7 +93,7 @@ class SamanthaBot:
         """Verificar si el usuario está registrado, si no iniciar registro"""
         user_id = self._get_user_id(update)
 
-        if not self.db.usuario_existe(user_id):
+        if not await self.db.usuario_existe(user_id):
             await update.message.reply_text(
                 "¡Hola! 👋 Veo que es tu primera vez por aquí.\n\n"
                 "Para empezar, ¿cómo te llamas? 😊",
@@ -59,7 +108,8 @@ class SamanthaBot:
             ['📝 Nueva Factura', '📊 Resumen'],
             ['📋 Ver Lista', '📥 Exportar Excel'],
             ['🗑️ Borrar Factura', '⚙️ Mi Perfil'],
-            ['❓ Ayuda']
+            ['🔎 Buscar', '❓ Ayuda'],
+            ['📤 Importar Excel']
         ]
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -67,7 +117,7 @@ class SamanthaBot:
         try:
             user_id = self._get_user_id(update)
 
-            if not self.db.usuario_existe(user_id):
+            if not await self.db.usuario_existe(user_id):
                 await update.message.reply_text(
                     "¡Hola! 👋 Veo que es tu primera vez por aquí.\n\n"
                     "Para empezar, ¿cómo te llamas? 😊",
@@ -76,7 +126,7 @@ class SamanthaBot:
                 context.user_data['esperando_nombre_registro'] = True
                 return
 
-            nombre_usuario = self.db.obtener_nombre_usuario(user_id)
+            nombre_usuario = await self.db.obtener_nombre_usuario(user_id)
 
             mensaje = (
                 f"¡Hola {nombre_usuario}! 👋 Soy *Samantha*, tu asistente personal de viáticos 💼\n\n"
@@ -113,7 +163,7 @@ class SamanthaBot:
                 )
                 return
 
-            self.db.registrar_usuario(user_id, nombre)
+            await self.db.registrar_usuario(user_id, nombre)
             logger.info(f"Usuario {user_id} registrado como: {nombre}")
 
             mensaje = (
@@ -149,13 +199,15 @@ class SamanthaBot:
             mensaje = (
                 "💡 *¿Cómo funciono?*\n\n"
                 "Es súper fácil, mira:\n\n"
-                "1️⃣ Presionas *Nueva Factura* y yo te pregunto qué tipo de gasto es\n"
-                "2️⃣ Seleccionas si es Alimentación o Combustible\n"
-                "3️⃣ Me envías la foto de tu factura 📸\n"
-                "4️⃣ Yo leo la factura y extraigo los datos automáticamente ✨\n"
-                "5️⃣ Te muestro lo que encontré para que lo revises\n"
-                "6️⃣ Si algo está mal, puedes editarlo fácilmente\n"
-                "7️⃣ Le das confirmar y ¡listo! Ya quedó guardado 🎉\n\n"
+                "1️⃣ Me envías la foto de tu factura en cualquier momento 📸\n"
+                "2️⃣ Yo leo la factura y extraigo los datos automáticamente ✨\n"
+                "3️⃣ También detecto si es Alimentación o Combustible (si no, te pregunto)\n"
+                "4️⃣ Te muestro lo que encontré para que lo revises\n"
+                "5️⃣ Si algo está mal, puedes editarlo fácilmente\n"
+                "6️⃣ Le das confirmar y ¡listo! Ya quedó guardado 🎉\n\n"
+                "Si prefieres, también puedes presionar *Nueva Factura* y elegir el tipo primero.\n\n"
+                "¿Buscas una factura vieja? Usa *Buscar* o escribe /buscar seguido del proveedor, NIT o número 🔎\n\n"
+                "¿Tienes tus gastos en la plantilla de Excel? Usa *Importar Excel* y envíame el archivo 📤\n\n"
                 "*Tips para mejores resultados:*\n"
                 "• Toma la foto con buena luz 💡\n"
                 "• Que el texto se vea clarito\n"
@@ -182,10 +234,13 @@ class SamanthaBot:
                 context.user_data['esperando_nombre_registro'] = True
                 return ConversationHandler.END
 
+            self._limpiar_factura_en_curso(context)
+
             keyboard = [['🍔 ALIMENTACIÓN', '⛽ COMBUSTIBLE'], ['❌ Cancelar']]
             await update.message.reply_text(
                 '¡Perfecto! Vamos a registrar tu factura 📝\n\n'
-                'Primero dime, ¿qué tipo de gasto es?',
+                'Primero dime, ¿qué tipo de gasto es?\n'
+                '💡 También puedes enviarme la foto directamente y yo lo detecto',
                 reply_markup=ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
             )
             logger.info(f"Usuario {self._get_user_id(update)} inició nueva factura")
@@ -195,6 +250,40 @@ class SamanthaBot:
             await update.message.reply_text("Error al iniciar. Intenta nuevamente desde el menú.")
             return ConversationHandler.END
 
+    def _limpiar_factura_en_curso(self, context: ContextTypes.DEFAULT_TYPE):
+        """Descartar datos de una factura anterior que no se terminó"""
+        for clave in ('tipo_gasto', 'tipo_gasto_detectado', 'datos_factura', 'foto_path', 'nombre_editado',
+                      'duplicado_de', 'duplicado_existente'):
+            context.user_data.pop(clave, None)
+
+    async def recibir_foto_directa(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Recibir una foto fuera de conversación: OCR inmediato sin pasar por el menú"""
+        try:
+            # Otra operación espera una respuesta: la foto no abre una factura en paralelo
+            if any(_conversacion_activa(handler, update) for handler in self._conversaciones_en_espera):
+                await update.message.reply_text(
+                    'Tienes otra operación en curso ✋\n'
+                    'Termínala o escribe /cancelar y vuelve a enviarme la foto 📸'
+                )
+                return ConversationHandler.END
+
+            # La lista y la búsqueda solo esperan botones de navegación: la foto las termina
+            for handler in self._conversaciones_navegacion:
+                if _conversacion_activa(handler, update):
+                    _terminar_conversacion(handler, update)
+
+            if not await self._verificar_usuario_registrado(update, context):
+                context.user_data['esperando_nombre_registro'] = True
+                return ConversationHandler.END
+
+            self._limpiar_factura_en_curso(context)
+            logger.info(f"Usuario {self._get_user_id(update)} envió foto directa")
+            return await self.recibir_foto(update, context)
+        except Exception as e:
+            logger.error(f"Error al recibir foto directa: {e}", exc_info=True)
+            await update.message.reply_text("Error al procesar la foto. Intenta nuevamente desde el menú.")
+            return ConversationHandler.END
+
     async def recibir_tipo_gasto(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Recibir tipo de gasto"""
         try:
@@ -213,8 +302,14 @@ class SamanthaBot:
                 return TIPO_GASTO
 
             context.user_data['tipo_gasto'] = tipo
+            context.user_data['tipo_gasto_detectado'] = False
             logger.debug(f"Tipo de gasto seleccionado: {tipo}")
 
+            # La foto ya fue procesada (flujo foto primero): ir directo a confirmación
+            datos = context.user_data.get('datos_factura')
+            if datos:
+                return await self._mostrar_datos_extraidos(update, context, datos, datos['fecha'])
+
             await update.message.reply_text(
                 f'Perfecto, es de *{tipo}* ✅\n\n'
                 f'Ahora sí, envíame la foto de la factura 📸\n'
@@ -237,31 +332,54 @@ class SamanthaBot:
 
             photo = update.message.photo[-1]
             file = await photo.get_file()
-            filename = f"{FACTURAS_FOLDER}/factura_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+            # Las fotos llegan en cualquier momento: el usuario y el id de la foto evitan que dos
+            # fotos del mismo segundo se pisen antes del OCR
+            filename = (f"{FACTURAS_FOLDER}/factura_{self._get_user_id(update)}_"
+                        f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{photo.file_unique_id}.jpg")
             await file.download_to_drive(filename)
 
             context.user_data['foto_path'] = filename
             logger.info(f"Foto guardada: {filename}")
 
+            # El OCR corre en un hilo aparte mientras se envía el aviso al usuario
+            tarea_ocr = asyncio.create_task(
+                asyncio.to_thread(extraer_datos_factura, filename, self.db.db.obtener_nombre_proveedor)
+            )
             await update.message.reply_text('🔍 Extrayendo los datos...')
-            datos = extraer_datos_factura(filename)
+            datos = await tarea_ocr
 
             if not datos:
                 logger.warning(f"OCR falló para imagen: {filename}")
-                keyboard = [['🔄 Intentar de nuevo', '❌ Cancelar']]
+                keyboard = self._get_menu_principal()
                 await update.message.reply_text(
                     'Ay no... 😅 Tuve problemas para leer esta factura.\n\n'
-                    '¿Puedes intentar de nuevo con una foto más clara? '
+                    '¿Puedes enviarme otra foto más clara? '
                     'Asegúrate que el texto se vea bien legible.',
                     reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
                 )
                 return ConversationHandler.END
 
             context.user_data['datos_factura'] = datos
+            context.user_data['nombre_editado'] = False
 
             fecha_hoy = datetime.now().strftime('%d/%m/%Y')
             context.user_data['datos_factura']['fecha'] = fecha_hoy
 
+            if not context.user_data.get('tipo_gasto'):
+                tipo_detectado = datos.get('tipo_gasto')
+
+                if not tipo_detectado:
+                    keyboard = [['🍔 ALIMENTACIÓN', '⛽ COMBUSTIBLE'], ['❌ Cancelar']]
+                    await update.message.reply_text(
+                        'Ya leí la factura ✅ pero no logré saber qué tipo de gasto es 🤔\n\n'
+                        '¿Es de alimentación o de combustible?',
+                        reply_markup=ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+                    )
+                    return TIPO_GASTO
+
+                context.user_data['tipo_gasto'] = tipo_detectado
+                context.user_data['tipo_gasto_detectado'] = True
+
             return await self._mostrar_datos_extraidos(update, context, datos, fecha_hoy)
 
         except Exception as e:
@@ -288,16 +406,25 @@ class SamanthaBot:
             mensaje = "¡Listo! 🎉 Esto es lo que encontré:\n\n"
             mensaje += f"📅 *Fecha:* {fecha_hoy}\n"
             mensaje += f"🏢 *NIT Proveedor:* {datos['nit'] if datos['nit'] else '❌ No encontrado'}\n"
-            mensaje += f"👤 *Proveedor:* {truncar_texto(datos['nombre'], 40) if datos['nombre'] else '❌ No encontrado'}\n"
+            mensaje += f"👤 *Proveedor:* {truncar_texto(datos['nombre'], 40) if datos['nombre'] else '❌ No encontrado'}"
+            if datos.get('nombre_desde_directorio'):
+                mensaje += " 📒"
+            mensaje += "\n"
             mensaje += f"🔢 *Serie:* {datos['serie'] if datos['serie'] else '❌ No encontrado'}\n"
             mensaje += f"📄 *Número:* {datos['numero'] if datos['numero'] else '❌ No encontrado'}\n"
             mensaje += f"💰 *Monto:* {formatear_monto(datos['monto']) if datos['monto'] else '❌ No encontrado'}\n"
-            mensaje += f"🏷️ *Tipo:* {context.user_data['tipo_gasto']}\n\n"
+            mensaje += f"🏷️ *Tipo:* {context.user_data['tipo_gasto']}"
+            if context.user_data.get('tipo_gasto_detectado'):
+                mensaje += " (detectado automáticamente)"
+            mensaje += "\n\n"
 
             if datos_faltantes:
                 mensaje += f"⚠️ No encontré: {', '.join(datos_faltantes)}\n"
                 mensaje += "Pero no te preocupes, puedes agregarlo tú después 😊\n\n"
 
+            if datos.get('nombre_desde_directorio'):
+                mensaje += "📒 El nombre del proveedor viene del directorio. Si está mal, edítalo y lo corrijo para todos\n\n"
+
             mensaje += "¿Todo bien o necesitas hacer algo?"
 
             keyboard = [
@@ -325,6 +452,11 @@ class SamanthaBot:
                 return await self.cancelar(update, context)
 
             elif respuesta == '📸 Reintentar Foto':
+                # Si el tipo fue inferido, se vuelve a inferir con la nueva foto
+                if context.user_data.get('tipo_gasto_detectado'):
+                    context.user_data.pop('tipo_gasto', None)
+                    context.user_data['tipo_gasto_detectado'] = False
+
                 await update.message.reply_text(
                     'Ok! Envíame una nueva foto de la factura 📸\n'
                     'Intenta que tenga buena iluminación y que el texto se vea claro 💡',
@@ -412,6 +544,16 @@ class SamanthaBot:
                     )
                     return EDITAR_VALOR
 
+            if campo == 'fecha':
+                try:
+                    nuevo_valor = formatear_fecha(normalizar_fecha(nuevo_valor))
+                except ValueError:
+                    await update.message.reply_text(
+                        'Mmm, esa fecha no me quedó clara 🤔\n'
+                        'Escríbela como día/mes/año (ej: 15/03/2025):'
+                    )
+                    return EDITAR_VALOR
+
             if campo == 'tipo_gasto':
                 if nuevo_valor.upper() not in TIPOS_GASTO:
                     await update.message.reply_text(
@@ -420,8 +562,11 @@ class SamanthaBot:
                     )
                     return EDITAR_VALOR
                 context.user_data['tipo_gasto'] = nuevo_valor.upper()
+                context.user_data['tipo_gasto_detectado'] = False
             else:
                 context.user_data['datos_factura'][campo] = nuevo_valor
+                if campo == 'nombre':
+                    context.user_data['nombre_editado'] = True
 
             logger.debug(f"Campo {campo} actualizado a: {nuevo_valor}")
 
@@ -452,21 +597,32 @@ class SamanthaBot:
             datos = context.user_data['datos_factura']
             tipo_gasto = context.user_data['tipo_gasto']
             foto = context.user_data['foto_path']
+            # Solo viene con valor si el usuario confirmó guardar un duplicado
+            duplicado_de = context.user_data.pop('duplicado_de', None)
 
-            factura_id = self.db.insertar_factura(
-                user_id=user_id,
-                fecha=datos.get('fecha'),
-                nit=datos.get('nit'),
-                nombre=datos.get('nombre'),
-                serie=datos.get('serie'),
-                numero=datos.get('numero'),
-                tipo_gasto=tipo_gasto,
-                monto=datos.get('monto'),
-                foto_path=foto
-            )
+            try:
+                factura_id = await self.db.insertar_factura(
+                    user_id=user_id,
+                    fecha=datos.get('fecha'),
+                    nit=datos.get('nit'),
+                    nombre=datos.get('nombre'),
+                    serie=datos.get('serie'),
+                    numero=datos.get('numero'),
+                    tipo_gasto=tipo_gasto,
+                    monto=datos.get('monto'),
+                    foto_path=foto,
+                    duplicado_de=duplicado_de
+                )
+            except FacturaDuplicada as e:
+                return await self._advertir_duplicado(update, context, e.existente)
 
             logger.info(f"Factura #{factura_id} guardada exitosamente para usuario {user_id}")
 
+            # Un nombre corregido a mano se guarda en el directorio para todos los usuarios
+            if context.user_data.get('nombre_editado') and datos.get('nit') and datos.get('nombre'):
+                await self.db.actualizar_proveedor(datos.get('nit'), datos.get('nombre'))
+                context.user_data['nombre_editado'] = False
+
             keyboard = self._get_menu_principal()
 
             await update.message.reply_text(
@@ -492,6 +648,41 @@ class SamanthaBot:
             )
             return ConversationHandler.END
 
+    async def _advertir_duplicado(self, update: Update, context: ContextTypes.DEFAULT_TYPE, existente):
+        """Avisar que la factura ya está registrada y preguntar si se guarda igual"""
+        factura_id, dueno_id, fecha = existente
+        context.user_data['duplicado_existente'] = factura_id
+
+        # El id y la fecha de la factura solo se muestran a su dueño
+        if dueno_id == self._get_user_id(update):
+            registrada = f'como tu *Factura #{factura_id}*{f" del {formatear_fecha(fecha)}" if fecha else ""}'
+        else:
+            registrada = 'por otro usuario'
+
+        keyboard = [[DUPLICADO_GUARDAR], ['❌ Cancelar']]
+        await update.message.reply_text(
+            f'⚠️ Ojo, esta factura ya está registrada {registrada}.\n\n'
+            f'Tiene el mismo NIT, serie y número 🔁\n'
+            f'¿La guardo de todos modos?',
+            reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True),
+            parse_mode='Markdown'
+        )
+        return CONFIRMAR_DUPLICADO
+
+    async def confirmar_duplicado(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Guardar o descartar una factura duplicada"""
+        respuesta = update.message.text
+
+        if respuesta == DUPLICADO_GUARDAR:
+            context.user_data['duplicado_de'] = context.user_data.pop('duplicado_existente', None)
+            return await self.guardar_factura(update, context)
+
+        if respuesta == '❌ Cancelar':
+            context.user_data.pop('duplicado_existente', None)
+            return await self.cancelar(update, context)
+
+        return CONFIRMAR_DUPLICADO
+
     async def cancelar(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Cancelar operación"""
         keyboard = self._get_menu_principal()
@@ -515,7 +706,7 @@ class SamanthaBot:
             mes_actual = obtener_mes_actual()
             anio_actual = obtener_anio_actual()
 
-            total, cantidad, por_tipo = self.db.obtener_resumen(user_id, mes_actual, anio_actual)
+            total, cantidad, por_tipo = await self.db.obtener_resumen(user_id, mes_actual, anio_actual)
 
             keyboard = self._get_menu_principal()
             keyboard.insert(1, ['📅 Ver Otros Meses'])
@@ -558,7 +749,7 @@ class SamanthaBot:
                 return ConversationHandler.END
 
             user_id = self._get_user_id(update)
-            meses_disponibles = self.db.obtener_meses_con_datos(user_id)
+            meses_disponibles = await self.db.obtener_meses_con_datos(user_id)
 
             if not meses_disponibles:
                 keyboard = self._get_menu_principal()
@@ -573,7 +764,7 @@ class SamanthaBot:
             mensaje = '📅 *Selecciona el mes que quieres ver:*\n\n'
             keyboard = []
 
-            for anio, mes in meses_disponibles[:12]:
+            for anio, mes, _ in meses_disponibles[:12]:
                 nombre_mes = obtener_nombre_mes(mes)
                 keyboard.append([f'{nombre_mes} {anio}'])
 
@@ -605,7 +796,7 @@ class SamanthaBot:
             meses_disponibles = context.user_data.get('meses_disponibles', [])
 
             anio_mes = None
-            for anio, mes in meses_disponibles:
+            for anio, mes, _ in meses_disponibles:
                 nombre_mes = obtener_nombre_mes(mes)
                 if f'{nombre_mes} {anio}' == seleccion:
                     anio_mes = (anio, mes)
@@ -619,7 +810,7 @@ class SamanthaBot:
                 return SELECCIONAR_MES
 
             anio, mes = anio_mes
-            total, cantidad, por_tipo = self.db.obtener_resumen(user_id, mes, anio)
+            total, cantidad, por_tipo = await self.db.obtener_resumen(user_id, mes, anio)
 
             keyboard = self._get_menu_principal()
 
@@ -647,44 +838,238 @@ class SamanthaBot:
             return ConversationHandler.END
 
     async def lista(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Listar últimas facturas del usuario"""
+        """Listar facturas del usuario por páginas (acepta /lista MM/AAAA y tipo de gasto)"""
         try:
             if not await self._verificar_usuario_registrado(update, context):
                 context.user_data['esperando_nombre_registro'] = True
-                return
+                return ConversationHandler.END
 
-            user_id = self._get_user_id(update)
-            facturas = self.db.obtener_facturas(user_id, limit=20)
+            filtros = {'mes': None, 'anio': None, 'tipo_gasto': None}
 
-            keyboard = self._get_menu_principal()
+            for arg in (context.args or []):
+                tipo = arg.upper().replace('ALIMENTACION', 'ALIMENTACIÓN')
+                if tipo in TIPOS_GASTO:
+                    filtros['tipo_gasto'] = tipo
+                    continue
+                try:
+                    filtros['mes'], filtros['anio'] = parsear_mes_anio(arg)
+                except ValueError:
+                    logger.debug(f"Argumento de /lista ignorado: {arg}")
 
-            if not facturas:
-                await update.message.reply_text(
-                    'Aún no tienes facturas guardadas 📭\n\n'
-                    'Presiona *Nueva Factura* para agregar tu primera factura!',
-                    parse_mode='Markdown',
-                    reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-                )
-                return
+            context.user_data['lista'] = filtros
+            logger.info(f"Lista de facturas solicitada por usuario {self._get_user_id(update)} (filtros={filtros})")
+            return await self._mostrar_pagina_lista(update, context)
+
+        except Exception as e:
+            logger.error(f"Error al listar facturas: {e}", exc_info=True)
+            await update.message.reply_text("⚠️ Error al obtener lista. Intenta nuevamente.")
+            return ConversationHandler.END
+
+    async def lista_navegar(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Cambiar de página o de filtro en la lista de facturas"""
+        try:
+            texto = update.message.text
+            estado = context.user_data.setdefault('lista', {'mes': None, 'anio': None, 'tipo_gasto': None})
+
+            if texto == LISTA_ANTIGUAS and estado.get('ultimo_id'):
+                return await self._mostrar_pagina_lista(update, context, antes_de_id=estado['ultimo_id'])
 
-            mensaje = '📋 *Tus últimas facturas*\n\n'
-            for fac in facturas:
-                emoji = '🍔' if fac[3] == 'ALIMENTACIÓN' else '⛽'
-                nombre_corto = truncar_texto(fac[2], 25) if fac[2] else 'Sin nombre'
-                mensaje += f'#{fac[0]} {emoji} | {fac[1]} | {nombre_corto} | {formatear_monto(fac[4])}\n'
+            if texto == LISTA_RECIENTES and estado.get('primer_id'):
+                return await self._mostrar_pagina_lista(update, context, despues_de_id=estado['primer_id'])
 
-            mensaje += f'\n💡 Para borrar alguna, usa *Borrar Factura* y escribe el número'
+            if texto in LISTA_FILTROS_TIPO:
+                estado['tipo_gasto'] = LISTA_FILTROS_TIPO[texto]
+            elif texto == LISTA_TODOS_MESES:
+                estado['mes'] = estado['anio'] = None
+            else:
+                try:
+                    estado['mes'], estado['anio'] = parsear_mes_anio(texto)
+                except ValueError:
+                    await update.message.reply_text(
+                        'Ese mes no me quedó claro 🤔\n'
+                        'Escríbelo como mes/año, por ejemplo: 03/2025'
+                    )
+                    return LISTA_PAGINA
+
+            # Un filtro nuevo vuelve a la primera página
+            return await self._mostrar_pagina_lista(update, context)
+
+        except Exception as e:
+            logger.error(f"Error al navegar lista: {e}", exc_info=True)
+            await update.message.reply_text("⚠️ Error al obtener lista. Intenta nuevamente.")
+            return ConversationHandler.END
 
+    async def _mostrar_pagina_lista(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                    antes_de_id: int = None, despues_de_id: int = None):
+        """Consultar y mostrar una página de la lista con sus botones de navegación"""
+        user_id = self._get_user_id(update)
+        estado = context.user_data['lista']
+
+        facturas, hay_recientes, hay_antiguas = await self.db.obtener_facturas_pagina(
+            user_id, limite=FACTURAS_POR_PAGINA,
+            antes_de_id=antes_de_id, despues_de_id=despues_de_id,
+            mes=estado['mes'], anio=estado['anio'], tipo_gasto=estado['tipo_gasto']
+        )
+
+        filtros_texto = []
+        if estado['mes'] and estado['anio']:
+            filtros_texto.append(formatear_periodo(estado['mes'], estado['anio']))
+        if estado['tipo_gasto']:
+            filtros_texto.append(estado['tipo_gasto'])
+
+        keyboard = []
+        navegacion = []
+        if hay_recientes:
+            navegacion.append(LISTA_RECIENTES)
+        if hay_antiguas:
+            navegacion.append(LISTA_ANTIGUAS)
+        if navegacion:
+            keyboard.append(navegacion)
+        keyboard.append(list(LISTA_FILTROS_TIPO))
+        if estado['mes']:
+            keyboard.append([LISTA_TODOS_MESES])
+        keyboard.append(['🏠 Menú Principal'])
+
+        if not facturas:
+            if filtros_texto:
+                mensaje = f'No encontré facturas con esos filtros ({", ".join(filtros_texto)}) 📭'
+            else:
+                mensaje = ('Aún no tienes facturas guardadas 📭\n\n'
+                           'Presiona *Nueva Factura* para agregar tu primera factura!')
             await update.message.reply_text(
                 mensaje,
                 parse_mode='Markdown',
                 reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
             )
-            logger.info(f"Lista de facturas solicitada por usuario {user_id}: {len(facturas)} facturas")
+            return LISTA_PAGINA
+
+        estado['primer_id'] = facturas[0].id
+        estado['ultimo_id'] = facturas[-1].id
+
+        mensaje = '📋 *Tus facturas*'
+        if filtros_texto:
+            mensaje += f' ({", ".join(filtros_texto)})'
+        mensaje += '\n\n'
+        for fac in facturas:
+            emoji = '🍔' if fac.tipo_gasto == 'ALIMENTACIÓN' else '⛽'
+            nombre_corto = truncar_texto(fac.nombre_proveedor, 25) if fac.nombre_proveedor else 'Sin nombre'
+            mensaje += f'#{fac.id} {emoji} | {formatear_fecha(fac.fecha)} | {nombre_corto} | {formatear_monto(fac.monto)}\n'
+
+        mensaje += '\n💡 Escribe un mes (ej: 03/2025) para filtrar por mes'
+        mensaje += '\n💡 Para borrar alguna, usa *Borrar Factura* y escribe el número'
+
+        await update.message.reply_text(
+            mensaje,
+            parse_mode='Markdown',
+            reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        )
+        return LISTA_PAGINA
+
+    async def buscar(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Buscar facturas por proveedor, NIT, serie o número (/buscar texto)"""
+        try:
+            if not await self._verificar_usuario_registrado(update, context):
+                context.user_data['esperando_nombre_registro'] = True
+                return ConversationHandler.END
+
+            texto = ' '.join(context.args or []).strip()
+            if texto:
+                context.user_data['busqueda'] = {'texto': texto}
+                return await self._mostrar_pagina_busqueda(update, context)
+
+            await update.message.reply_text(
+                '¿Qué factura buscas? 🔎\n\n'
+                'Escribe el nombre del proveedor, el NIT, la serie o el número.\n'
+                'Basta con el inicio de la palabra, por ejemplo: *gaso* o *12345*',
+                parse_mode='Markdown',
+                reply_markup=ReplyKeyboardMarkup([['❌ Cancelar']], resize_keyboard=True)
+            )
+            return BUSCAR_TEXTO
 
         except Exception as e:
-            logger.error(f"Error al listar facturas: {e}", exc_info=True)
-            await update.message.reply_text("⚠️ Error al obtener lista. Intenta nuevamente.")
+            logger.error(f"Error al iniciar búsqueda: {e}", exc_info=True)
+            await update.message.reply_text("⚠️ Error al buscar. Intenta nuevamente.")
+            return ConversationHandler.END
+
+    async def buscar_texto(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Recibir el texto a buscar"""
+        try:
+            texto = update.message.text.strip()
+            if texto == '❌ Cancelar':
+                return await self.cancelar(update, context)
+
+            context.user_data['busqueda'] = {'texto': texto}
+            return await self._mostrar_pagina_busqueda(update, context)
+
+        except Exception as e:
+            logger.error(f"Error al buscar facturas: {e}", exc_info=True)
+            await update.message.reply_text("⚠️ Error al buscar. Intenta nuevamente.")
+            return ConversationHandler.END
+
+    async def buscar_navegar(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Cambiar de página en los resultados de búsqueda"""
+        try:
+            texto = update.message.text
+            estado = context.user_data.get('busqueda')
+
+            if texto == BUSQUEDA_NUEVA or not estado:
+                return await self.buscar(update, context)
+            if texto == BUSQUEDA_SIGUIENTES and estado.get('ultimo_id'):
+                return await self._mostrar_pagina_busqueda(update, context, antes_de_id=estado['ultimo_id'])
+            if texto == BUSQUEDA_ANTERIORES and estado.get('primer_id'):
+                return await self._mostrar_pagina_busqueda(update, context, despues_de_id=estado['primer_id'])
+            return await self._mostrar_pagina_busqueda(update, context)
+
+        except Exception as e:
+            logger.error(f"Error al navegar búsqueda: {e}", exc_info=True)
+            await update.message.reply_text("⚠️ Error al buscar. Intenta nuevamente.")
+            return ConversationHandler.END
+
+    async def _mostrar_pagina_busqueda(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                       antes_de_id: int = None, despues_de_id: int = None):
+        """Consultar y mostrar una página de resultados con sus botones de navegación"""
+        user_id = self._get_user_id(update)
+        estado = context.user_data['busqueda']
+
+        facturas, hay_anteriores, hay_siguientes = await self.db.buscar_facturas(
+            user_id, estado['texto'], limite=FACTURAS_POR_PAGINA,
+            antes_de_id=antes_de_id, despues_de_id=despues_de_id
+        )
+
+        keyboard = []
+        navegacion = []
+        if hay_anteriores:
+            navegacion.append(BUSQUEDA_ANTERIORES)
+        if hay_siguientes:
+            navegacion.append(BUSQUEDA_SIGUIENTES)
+        if navegacion:
+            keyboard.append(navegacion)
+        keyboard.append([BUSQUEDA_NUEVA, '🏠 Menú Principal'])
+
+        if not facturas:
+            await update.message.reply_text(
+                f'No encontré facturas con "{estado["texto"]}" 📭\n\n'
+                'Prueba con otra palabra o con el inicio del nombre del proveedor.',
+                reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            )
+            return BUSCAR_PAGINA
+
+        estado['primer_id'] = facturas[0].id
+        estado['ultimo_id'] = facturas[-1].id
+        logger.info(f"Búsqueda de usuario {user_id}: '{estado['texto']}' ({len(facturas)} resultados en la página)")
+
+        mensaje = f'🔎 Resultados para "{estado["texto"]}"\n\n'
+        for fac in facturas:
+            emoji = '🍔' if fac.tipo_gasto == 'ALIMENTACIÓN' else '⛽'
+            nombre_corto = truncar_texto(fac.nombre_proveedor, 25) if fac.nombre_proveedor else 'Sin nombre'
+            mensaje += f'#{fac.id} {emoji} | {formatear_fecha(fac.fecha)} | {nombre_corto} | {formatear_monto(fac.monto)}\n'
+            mensaje += f'      NIT {fac.nit_proveedor or "N/A"} | {fac.serie or "-"} {fac.numero or "-"}\n'
+
+        await update.message.reply_text(
+            mensaje,
+            reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        )
+        return BUSCAR_PAGINA
 
     async def borrar(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Iniciar proceso de borrar factura"""
@@ -696,8 +1081,9 @@ class SamanthaBot:
             keyboard = [['❌ Cancelar']]
 
             await update.message.reply_text(
-                'Perfecto! Vamos a borrar una factura 🗑️\n\n'
-                'Escribe el *número de la factura* que quieres eliminar\n\n'
+                'Perfecto! Vamos a borrar facturas 🗑️\n\n'
+                'Escribe el *número de la factura* que quieres eliminar.\n'
+                'También puedes poner varias y rangos, por ejemplo: *12, 15, 20-31*\n\n'
                 '💡 Puedes usar *Ver Lista* primero para ver los números de tus facturas.',
                 parse_mode='Markdown',
                 reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
@@ -711,7 +1097,7 @@ class SamanthaBot:
             return ConversationHandler.END
 
     async def borrar_recibir_id(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Recibir ID de factura a borrar"""
+        """Recibir los números de las facturas a borrar y pedir confirmación"""
         try:
             user_id = self._get_user_id(update)
             keyboard = self._get_menu_principal()
@@ -725,42 +1111,123 @@ class SamanthaBot:
                 return ConversationHandler.END
 
             try:
-                factura_id = int(update.message.text.strip())
-            except ValueError:
+                ids = parsear_ids(update.message.text, MAXIMO_FACTURAS_BORRADO)
+            except ValueError as e:
                 await update.message.reply_text(
-                    'Ese número no es válido 😅\n\n'
-                    'Tiene que ser un número, por ejemplo: 5\n\n'
-                    'Inténtalo de nuevo o presiona *Cancelar*:',
+                    f'No entendí esos números 😅 ({e})\n\n'
+                    f'Escribe uno o varios, por ejemplo: *5* o *12, 15, 20-31*\n\n'
+                    f'Inténtalo de nuevo o presiona *Cancelar*:',
                     parse_mode='Markdown'
                 )
                 return BORRAR_ID
 
-            eliminada = self.db.eliminar_factura(user_id, factura_id)
+            # Una sola consulta valida cuáles son del usuario
+            facturas = await self.db.obtener_facturas_por_ids(user_id, ids)
+
+            if not facturas:
+                await update.message.reply_text(
+                    f'Mmm... 🤔 No encontré ninguna factura tuya con '
+                    f'{"ese número" if len(ids) == 1 else "esos números"}\n\n'
+                    f'Usa *Ver Lista* para ver tus facturas disponibles.',
+                    parse_mode='Markdown',
+                    reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+                )
+                return ConversationHandler.END
+
+            context.user_data['borrar_ids'] = [fac.id for fac in facturas]
+            total = sum((fac.monto for fac in facturas if fac.monto is not None), Decimal('0.00'))
+
+            mensaje = (f'Voy a borrar *{len(facturas)} '
+                       f'{"factura" if len(facturas) == 1 else "facturas"}* 🗑️\n\n')
+            for fac in facturas[:BORRAR_LINEAS_MAXIMAS]:
+                emoji = '🍔' if fac.tipo_gasto == 'ALIMENTACIÓN' else '⛽'
+                nombre_corto = truncar_texto(fac.nombre_proveedor, 18)
+                mensaje += f'#{fac.id} {emoji} | {formatear_fecha(fac.fecha)} | {nombre_corto} | {formatear_monto(fac.monto)}\n'
+            if len(facturas) > BORRAR_LINEAS_MAXIMAS:
+                mensaje += f'... y {len(facturas) - BORRAR_LINEAS_MAXIMAS} más\n'
+            mensaje += f'\n💰 *Total:* {formatear_monto(total)}\n'
+
+            no_encontradas = sorted(set(ids) - set(context.user_data['borrar_ids']))
+            if no_encontradas:
+                muestra = ', '.join(f'#{n}' for n in no_encontradas[:10])
+                mas = f' y {len(no_encontradas) - 10} más' if len(no_encontradas) > 10 else ''
+                mensaje += f'\n⚠️ No encontré como tuyas: {muestra}{mas}\n'
+
+            mensaje += '\n¿Las borro? Esto no se puede deshacer.'
 
-            if eliminada:
+            await update.message.reply_text(
+                mensaje,
+                parse_mode='Markdown',
+                reply_markup=ReplyKeyboardMarkup([[BORRAR_SI], ['❌ Cancelar']], resize_keyboard=True)
+            )
+            return BORRAR_CONFIRMAR
+
+        except Exception as e:
+            logger.error(f"Error al preparar borrado: {e}", exc_info=True)
+            await update.message.reply_text(
+                "⚠️ Error al buscar las facturas. Intenta nuevamente desde el menú.",
+                reply_markup=ReplyKeyboardMarkup(self._get_menu_principal(), resize_keyboard=True)
+            )
+            return ConversationHandler.END
+
+    async def borrar_confirmar(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Borrar en una sola transacción las facturas confirmadas"""
+        keyboard = self._get_menu_principal()
+        try:
+            user_id = self._get_user_id(update)
+            respuesta = update.message.text
+
+            if respuesta == '❌ Cancelar':
+                context.user_data.pop('borrar_ids', None)
                 await update.message.reply_text(
-                    f'Listo! ✅ La factura #{factura_id} ya está eliminada.',
+                    'Ok! Operación cancelada 👌\n\n'
+                    'No se eliminó ninguna factura.',
                     reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
                 )
-                logger.info(f"Factura #{factura_id} eliminada exitosamente por usuario {user_id}")
+                return ConversationHandler.END
+
+            if respuesta != BORRAR_SI:
+                return BORRAR_CONFIRMAR
+
+            ids = context.user_data.pop('borrar_ids', [])
+            eliminadas = await self.db.eliminar_facturas(user_id, ids)
+
+            if eliminadas:
+                numeros = ', '.join(f'#{factura.id}' for factura in eliminadas[:BORRAR_LINEAS_MAXIMAS])
+                if len(eliminadas) > BORRAR_LINEAS_MAXIMAS:
+                    numeros += f' y {len(eliminadas) - BORRAR_LINEAS_MAXIMAS} más'
+                await update.message.reply_text(
+                    f'Listo! ✅ Eliminé {len(eliminadas)} '
+                    f'{"factura" if len(eliminadas) == 1 else "facturas"}: {numeros}',
+                    reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+                )
+                # Las fotos se borran en segundo plano, sin demorar la respuesta
+                fotos = [factura.foto_path for factura in eliminadas]
+                context.application.create_task(asyncio.to_thread(self._limpiar_fotos, fotos))
             else:
                 await update.message.reply_text(
-                    f'Mmm... 🤔 No encontré ninguna factura tuya con el número #{factura_id}\n\n'
-                    f'Usa *Ver Lista* para ver tus facturas disponibles.',
-                    parse_mode='Markdown',
+                    'Esas facturas ya no estaban registradas 🤔',
                     reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
                 )
 
             return ConversationHandler.END
 
         except Exception as e:
-            logger.error(f"Error al borrar factura: {e}", exc_info=True)
+            logger.error(f"Error al borrar facturas: {e}", exc_info=True)
             await update.message.reply_text(
-                "⚠️ Error al eliminar factura. Intenta nuevamente desde el menú.",
+                "⚠️ Error al eliminar las facturas. No se borró ninguna; intenta nuevamente desde el menú.",
                 reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
             )
             return ConversationHandler.END
 
+    def _limpiar_fotos(self, fotos):
+        """Eliminar las fotos de facturas borradas que ya no usa ninguna otra factura"""
+        try:
+            eliminadas = eliminar_archivos(self.db.db.fotos_sin_uso(fotos), FACTURAS_FOLDER)
+            logger.info(f"Fotos de facturas borradas eliminadas: {eliminadas}")
+        except Exception as e:
+            logger.error(f"Error al eliminar fotos de facturas borradas: {e}", exc_info=True)
+
     async def exportar(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Iniciar proceso de exportación"""
         try:
@@ -769,7 +1236,7 @@ class SamanthaBot:
                 return ConversationHandler.END
 
             user_id = self._get_user_id(update)
-            meses_disponibles = self.db.obtener_meses_con_datos(user_id)
+            meses_disponibles = await self.db.obtener_meses_con_datos(user_id)
 
             if not meses_disponibles:
                 keyboard = self._get_menu_principal()
@@ -786,7 +1253,7 @@ class SamanthaBot:
 
             keyboard = [['📅 Todas las Facturas']]
 
-            for anio, mes in meses_disponibles[:10]:
+            for anio, mes, _ in meses_disponibles[:10]:
                 nombre_mes = obtener_nombre_mes(mes)
                 keyboard.append([f'{nombre_mes} {anio}'])
 
@@ -817,18 +1284,13 @@ class SamanthaBot:
 
             keyboard = self._get_menu_principal()
 
-            await update.message.reply_text(
-                'Dale! Ya estoy preparando tu Excel 📊\n'
-                'Esto tomará solo unos segundos...'
-            )
-
             mes = None
             anio = None
 
             if seleccion != '📅 Todas las Facturas':
                 meses_disponibles = context.user_data.get('meses_disponibles', [])
 
-                for a, m in meses_disponibles:
+                for a, m, _ in meses_disponibles:
                     nombre_mes = obtener_nombre_mes(m)
                     if f'{nombre_mes} {a}' == seleccion:
                         mes = m
@@ -843,43 +1305,69 @@ class SamanthaBot:
                     )
                     return ConversationHandler.END
 
-            facturas = self.db.obtener_todas_facturas(user_id, mes, anio)
+            # El resumen mensual dice si hay facturas sin leerlas todas
+            _, cantidad, _ = await self.db.obtener_resumen(user_id, mes, anio)
 
-            if not facturas:
+            if not cantidad:
                 await update.message.reply_text(
                     'No encontré facturas para ese período 📭',
                     reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
                 )
                 return ConversationHandler.END
 
-            nombre_usuario = self.db.obtener_nombre_usuario(user_id)
-            periodo_texto = formatear_periodo(mes, anio) if mes and anio else "Todas"
+            # La versión se lee antes de generar: si una factura cambia mientras tanto,
+            # el archivo se guarda con la versión vieja y la próxima exportación lo regenera
+            version = await self.db.version_datos(user_id, mes, anio)
+            guardada = await self.db.obtener_exportacion(user_id, version, mes, anio)
 
-            filepath, filename = generar_excel(facturas, nombre_usuario, periodo_texto)
+            if guardada:
+                file_id, filename, cantidad, total = guardada
+                try:
+                    # Telegram ya tiene el archivo: se reenvía sin generarlo ni subirlo otra vez
+                    await update.message.reply_document(
+                        document=file_id,
+                        caption=self._caption_exportacion(cantidad, total, mes, anio),
+                        parse_mode='Markdown',
+                        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+                    )
+                    logger.info(f"Excel reenviado desde caché a usuario {user_id}: {filename}")
+                    return ConversationHandler.END
+                except BadRequest as e:
+                    logger.warning(f"Telegram rechazó el file_id guardado de {filename}, se regenera: {e}")
+                    await self.db.descartar_exportacion(user_id, mes, anio)
 
-            total = sum([f[5] for f in facturas if f[5]])
+            await update.message.reply_text(
+                'Dale! Ya estoy preparando tu Excel 📊\n'
+                'Esto tomará solo unos segundos...'
+            )
 
-            with open(filepath, 'rb') as file:
-                caption = f'¡Listo! 🎉 Aquí está tu Excel\n\n'
-                caption += f'📄 *{len(facturas)} facturas* registradas\n'
-                caption += f'💰 *Total:* {formatear_monto(total)}\n'
+            nombre_usuario = await self.db.obtener_nombre_usuario(user_id)
+            periodo_texto = formatear_periodo(mes, anio) if mes and anio else "Todas"
 
-                if mes and anio:
-                    caption += f'📅 *Período:* {obtener_nombre_mes(mes)} {anio}\n\n'
-                else:
-                    caption += f'📅 *Período:* Todas las facturas\n\n'
+            # Las filas se leen por lotes dentro del hilo que escribe el Excel
+            facturas = self.db.db.iterar_facturas(user_id, mes, anio)
+            filepath, filename, cantidad, total = await asyncio.to_thread(
+                generar_excel, facturas, nombre_usuario, periodo_texto, user_id
+            )
 
-                caption += 'Ya puedes usarlo para tus reportes de viáticos 😊'
+            try:
+                with open(filepath, 'rb') as file:
+                    mensaje = await update.message.reply_document(
+                        document=file,
+                        filename=filename,
+                        caption=self._caption_exportacion(cantidad, total, mes, anio),
+                        parse_mode='Markdown',
+                        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+                    )
+            finally:
+                # Telegram ya tiene el archivo (y su file_id queda en la caché de exportaciones)
+                eliminar_archivos([filepath], FACTURAS_FOLDER)
 
-                await update.message.reply_document(
-                    document=file,
-                    filename=filename,
-                    caption=caption,
-                    parse_mode='Markdown',
-                    reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-                )
+            if mensaje.document:
+                await self.db.guardar_exportacion(user_id, version, mensaje.document.file_id, filename,
+                                                  cantidad, total, mes, anio)
 
-            logger.info(f"Excel exportado por usuario {user_id}: {filename} con {len(facturas)} facturas")
+            logger.info(f"Excel exportado por usuario {user_id}: {filename} con {cantidad} facturas")
 
             return ConversationHandler.END
 
@@ -891,6 +1379,132 @@ class SamanthaBot:
             )
             return ConversationHandler.END
 
+    def _caption_exportacion(self, cantidad: int, total: Decimal, mes: int = None, anio: int = None) -> str:
+        caption = f'¡Listo! 🎉 Aquí está tu Excel\n\n'
+        caption += f'📄 *{cantidad} facturas* registradas\n'
+        caption += f'💰 *Total:* {formatear_monto(total)}\n'
+
+        if mes and anio:
+            caption += f'📅 *Período:* {obtener_nombre_mes(mes)} {anio}\n\n'
+        else:
+            caption += f'📅 *Período:* Todas las facturas\n\n'
+
+        caption += 'Ya puedes usarlo para tus reportes de viáticos 😊'
+        return caption
+
+    async def importar(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Iniciar importación de facturas desde la plantilla de Excel"""
+        try:
+            if not await self._verificar_usuario_registrado(update, context):
+                context.user_data['esperando_nombre_registro'] = True
+                return ConversationHandler.END
+
+            columnas = ', '.join(EXCEL_CONFIG['columns'])
+            await update.message.reply_text(
+                '📤 *Importar facturas*\n\n'
+                'Envíame tu archivo de Excel (.xlsx) o CSV como *documento*.\n\n'
+                f'Debe tener una fila con las columnas de la plantilla:\n{columnas}\n\n'
+                f'💡 Máximo {IMPORTACION_CONFIG["maximo_filas"]} facturas por archivo. '
+                'Las facturas que ya estén registradas no se repiten.',
+                parse_mode='Markdown',
+                reply_markup=ReplyKeyboardMarkup([['❌ Cancelar']], resize_keyboard=True)
+            )
+            return IMPORTAR_ARCHIVO
+
+        except Exception as e:
+            logger.error(f"Error al iniciar importación: {e}", exc_info=True)
+            await update.message.reply_text("Error al iniciar la importación. Intenta nuevamente.")
+            return ConversationHandler.END
+
+    async def importar_recibir_archivo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Recibir el archivo, validarlo e insertar sus facturas en una sola transacción"""
+        keyboard = self._get_menu_principal()
+        documento = update.message.document
+
+        if documento is None:
+            if update.message.text == '❌ Cancelar':
+                await update.message.reply_text(
+                    'Ok! Importación cancelada 👌',
+                    reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+                )
+                return ConversationHandler.END
+            await update.message.reply_text(
+                'Envíame el archivo como documento (📎 → Archivo), o presiona *Cancelar*',
+                parse_mode='Markdown'
+            )
+            return IMPORTAR_ARCHIVO
+
+        extension = os.path.splitext(documento.file_name or '')[1].lower()
+        if extension not in IMPORTACION_CONFIG['extensiones']:
+            await update.message.reply_text(
+                f'Solo puedo leer archivos {" o ".join(IMPORTACION_CONFIG["extensiones"])} 😅\n\n'
+                f'Envía otro archivo o presiona *Cancelar*',
+                parse_mode='Markdown'
+            )
+            return IMPORTAR_ARCHIVO
+
+        if (documento.file_size or 0) > IMPORTACION_CONFIG['maximo_mb'] * 1024 * 1024:
+            await update.message.reply_text(
+                f'El archivo es muy grande 📦 (máximo {IMPORTACION_CONFIG["maximo_mb"]} MB)\n\n'
+                f'Divídelo en partes más pequeñas o presiona *Cancelar*',
+                parse_mode='Markdown'
+            )
+            return IMPORTAR_ARCHIVO
+
+        user_id = self._get_user_id(update)
+        ruta = os.path.join(FACTURAS_FOLDER, f"importar_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{extension}")
+        try:
+            await update.message.reply_text('Recibido! 📄 Dejame revisar el archivo...')
+            os.makedirs(FACTURAS_FOLDER, exist_ok=True)
+            archivo = await documento.get_file()
+            await archivo.download_to_drive(ruta)
+
+            try:
+                facturas, rechazadas = await asyncio.to_thread(leer_facturas, ruta)
+            except ValueError as e:
+                await update.message.reply_text(
+                    f'No pude importar ese archivo 😅\n{e}\n\n'
+                    f'Envía otro archivo o presiona *Cancelar*',
+                    parse_mode='Markdown'
+                )
+                return IMPORTAR_ARCHIVO
+
+            insertadas, duplicadas = 0, []
+            if facturas:
+                insertadas, duplicadas = await self.db.importar_facturas(user_id, facturas)
+
+            if insertadas:
+                mensaje = f'Listo! ✅ Importé {insertadas} {"factura" if insertadas == 1 else "facturas"}\n'
+            else:
+                mensaje = 'No importé ninguna factura 🤔\n'
+            for titulo, filas in (('⚠️ Con errores', rechazadas), ('🔁 Ya registradas', duplicadas)):
+                if not filas:
+                    continue
+                mensaje += f'\n{titulo}: {len(filas)}\n'
+                for numero_fila, motivo in filas[:IMPORTAR_LINEAS_MAXIMAS]:
+                    mensaje += f'• Fila {numero_fila}: {motivo}\n'
+                if len(filas) > IMPORTAR_LINEAS_MAXIMAS:
+                    mensaje += f'... y {len(filas) - IMPORTAR_LINEAS_MAXIMAS} más\n'
+
+            # Los motivos incluyen texto del archivo: se envían sin Markdown
+            await update.message.reply_text(
+                mensaje,
+                reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            )
+            logger.info(f"Usuario {user_id} importó {insertadas} facturas de {documento.file_name} "
+                        f"({len(rechazadas)} con errores, {len(duplicadas)} duplicadas)")
+            return ConversationHandler.END
+
+        except Exception as e:
+            logger.error(f"Error al importar facturas: {e}", exc_info=True)
+            await update.message.reply_text(
+                "⚠️ Error al importar el archivo. No se guardó ninguna factura; intenta nuevamente.",
+                reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            )
+            return ConversationHandler.END
+        finally:
+            eliminar_archivos([ruta], FACTURAS_FOLDER)
+
     async def mi_perfil(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Mostrar perfil del usuario"""
         try:
@@ -899,10 +1513,12 @@ class SamanthaBot:
                 return
 
             user_id = self._get_user_id(update)
-            nombre_usuario = self.db.obtener_nombre_usuario(user_id)
-
-            total_facturas = self.db.contar_facturas_usuario(user_id)
-            total_gastado, _, _ = self.db.obtener_resumen(user_id)
+            # Las tres consultas son independientes: se lanzan en paralelo
+            nombre_usuario, total_facturas, (total_gastado, _, _) = await asyncio.gather(
+                self.db.obtener_nombre_usuario(user_id),
+                self.db.contar_facturas_usuario(user_id),
+                self.db.obtener_resumen(user_id)
+            )
 
             mensaje = '⚙️ *Mi Perfil*\n\n'
             mensaje += f'👤 *Nombre:* {nombre_usuario}\n'
@@ -967,7 +1583,7 @@ class SamanthaBot:
                 )
                 return CAMBIAR_NOMBRE
 
-            self.db.actualizar_nombre_usuario(user_id, nuevo_nombre)
+            await self.db.actualizar_nombre_usuario(user_id, nuevo_nombre)
             logger.info(f"Usuario {user_id} cambió su nombre a: {nuevo_nombre}")
 
             keyboard = self._get_menu_principal()
@@ -997,8 +1613,6 @@ class SamanthaBot:
 
         if texto == '📊 Resumen':
             return await self.resumen(update, context)
-        elif texto == '📋 Ver Lista':
-            return await self.lista(update, context)
         elif texto == '📥 Exportar Excel':
             return await self.exportar(update, context)
         elif texto == '⚙️ Mi Perfil':
@@ -1035,19 +1649,68 @@ class SamanthaBot:
             except Exception:
                 pass
 
+    async def respaldo_programado(self, context: ContextTypes.DEFAULT_TYPE):
+        """Tarea periódica: respaldo en caliente de la base de datos"""
+        try:
+            await asyncio.to_thread(crear_respaldo, self.db.db)
+        except Exception as e:
+            logger.error(f"Error en respaldo programado: {e}", exc_info=True)
+
+    async def mantenimiento_programado(self, context: ContextTypes.DEFAULT_TYPE):
+        """Tarea diaria: ANALYZE, optimize, incremental_vacuum y checkpoint en la hora de poco uso"""
+        try:
+            await asyncio.to_thread(self.db.db.mantenimiento, MANTENIMIENTO_CONFIG['presupuesto_s'],
+                                    MANTENIMIENTO_CONFIG['limite_analisis'], MANTENIMIENTO_CONFIG['paginas_por_paso'])
+        except Exception as e:
+            logger.error(f"Error en mantenimiento programado: {e}", exc_info=True)
+
+    async def metricas_programadas(self, context: ContextTypes.DEFAULT_TYPE):
+        """Tarea periódica: registrar en el log las consultas y etapas de OCR que más tiempo acumulan"""
+        self.db.db.registrar_resumen_consultas()
+        self.db.db.registrar_resumen_cache_usuarios()
+        registrar_resumen_etapas()
+
+    def setup_jobs(self, app: Application):
+        """Configurar tareas periódicas del bot"""
+        if app.job_queue is None:
+            logger.warning("JobQueue no disponible: instala python-telegram-bot[job-queue] para los respaldos automáticos")
+            return
+
+        intervalo = BACKUP_CONFIG['intervalo_horas'] * 3600
+        if intervalo > 0:
+            app.job_queue.run_repeating(self.respaldo_programado, interval=intervalo,
+                                        first=60, name='respaldo')
+            logger.info(f"Respaldo automático cada {BACKUP_CONFIG['intervalo_horas']:g} horas "
+                        f"en '{BACKUP_CONFIG['directorio']}'")
+
+        app.job_queue.run_repeating(self.metricas_programadas, interval=3600, first=3600, name='metricas_db')
+
+        hora = MANTENIMIENTO_CONFIG['hora']
+        if 0 <= hora <= 23:
+            # Hora local del servidor
+            momento = datetime.now().astimezone().replace(hour=hora, minute=0, second=0, microsecond=0).timetz()
+            app.job_queue.run_daily(self.mantenimiento_programado, time=momento, name='mantenimiento_db')
+            logger.info(f"Mantenimiento de la base de datos todos los días a las {hora:02d}:00 "
+                        f"(máximo {MANTENIMIENTO_CONFIG['presupuesto_s']:g}s)")
+
     def setup_handlers(self, app: Application):
         """Configurar handlers del bot"""
         conv_handler_nueva = ConversationHandler(
             entry_points=[
                 CommandHandler('nueva', self.nueva_factura),
-                MessageHandler(filters.Regex('^📝 Nueva Factura$'), self.nueva_factura)
+                MessageHandler(filters.Regex('^📝 Nueva Factura$'), self.nueva_factura),
+                MessageHandler(filters.PHOTO, self.recibir_foto_directa)
             ],
             states={
-                TIPO_GASTO: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.recibir_tipo_gasto)],
+                TIPO_GASTO: [
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.recibir_tipo_gasto),
+                    MessageHandler(filters.PHOTO, self.recibir_foto)
+                ],
                 PHOTO: [MessageHandler(filters.PHOTO, self.recibir_foto)],
                 CONFIRMAR: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.confirmar_datos)],
                 EDITAR_CAMPO: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.editar_campo)],
-                EDITAR_VALOR: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.editar_valor)]
+                EDITAR_VALOR: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.editar_valor)],
+                CONFIRMAR_DUPLICADO: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.confirmar_duplicado)]
             },
             fallbacks=[CommandHandler('cancelar', self.cancelar)]
         )
@@ -1058,7 +1721,8 @@ class SamanthaBot:
                 MessageHandler(filters.Regex('^🗑️ Borrar Factura$'), self.borrar)
             ],
             states={
-                BORRAR_ID: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.borrar_recibir_id)]
+                BORRAR_ID: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.borrar_recibir_id)],
+                BORRAR_CONFIRMAR: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.borrar_confirmar)]
             },
             fallbacks=[CommandHandler('cancelar', self.cancelar)]
         )
@@ -1084,6 +1748,58 @@ class SamanthaBot:
             fallbacks=[CommandHandler('cancelar', self.cancelar)]
         )
 
+        # Solo los botones de navegación pertenecen a la conversación; cualquier otro
+        # mensaje sigue hacia los demás handlers
+        lista_navegacion = '|'.join(
+            re.escape(boton) for boton in [LISTA_RECIENTES, LISTA_ANTIGUAS, LISTA_TODOS_MESES, *LISTA_FILTROS_TIPO]
+        )
+        conv_handler_lista = ConversationHandler(
+            entry_points=[
+                CommandHandler('lista', self.lista),
+                MessageHandler(filters.Regex('^📋 Ver Lista$'), self.lista)
+            ],
+            states={
+                LISTA_PAGINA: [
+                    MessageHandler(
+                        filters.Regex(rf'^({lista_navegacion}|\d{{1,2}}/\d{{4}}|\d{{4}}-\d{{1,2}})$'),
+                        self.lista_navegar
+                    )
+                ]
+            },
+            fallbacks=[CommandHandler('cancelar', self.cancelar)],
+            allow_reentry=True
+        )
+
+        busqueda_navegacion = '|'.join(
+            re.escape(boton) for boton in [BUSQUEDA_ANTERIORES, BUSQUEDA_SIGUIENTES, BUSQUEDA_NUEVA]
+        )
+        conv_handler_buscar = ConversationHandler(
+            entry_points=[
+                CommandHandler('buscar', self.buscar),
+                MessageHandler(filters.Regex('^🔎 Buscar$'), self.buscar)
+            ],
+            states={
+                BUSCAR_TEXTO: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.buscar_texto)],
+                BUSCAR_PAGINA: [MessageHandler(filters.Regex(rf'^({busqueda_navegacion})$'), self.buscar_navegar)]
+            },
+            fallbacks=[CommandHandler('cancelar', self.cancelar)],
+            allow_reentry=True
+        )
+
+        conv_handler_importar = ConversationHandler(
+            entry_points=[
+                CommandHandler('importar', self.importar),
+                MessageHandler(filters.Regex('^📤 Importar Excel$'), self.importar)
+            ],
+            states={
+                IMPORTAR_ARCHIVO: [
+                    MessageHandler(filters.Document.ALL, self.importar_recibir_archivo),
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.importar_recibir_archivo)
+                ]
+            },
+            fallbacks=[CommandHandler('cancelar', self.cancelar)]
+        )
+
         conv_handler_perfil = ConversationHandler(
             entry_points=[
                 MessageHandler(filters.Regex('^✏️ Cambiar Nombre$'), self.cambiar_nombre_inicio)
@@ -1094,15 +1810,21 @@ class SamanthaBot:
             fallbacks=[CommandHandler('cancelar', self.cancelar)]
         )
 
+        self._conversaciones_en_espera = [conv_handler_borrar, conv_handler_resumen_mes, conv_handler_exportar,
+                                          conv_handler_importar, conv_handler_perfil]
+        self._conversaciones_navegacion = [conv_handler_lista, conv_handler_buscar]
+
         app.add_handler(CommandHandler('start', self.start))
         app.add_handler(CommandHandler('help', self.help_command))
         app.add_handler(conv_handler_nueva)
         app.add_handler(conv_handler_borrar)
         app.add_handler(conv_handler_resumen_mes)
         app.add_handler(conv_handler_exportar)
+        app.add_handler(conv_handler_importar)
         app.add_handler(conv_handler_perfil)
+        app.add_handler(conv_handler_lista)
+        app.add_handler(conv_handler_buscar)
         app.add_handler(CommandHandler('resumen', self.resumen))
-        app.add_handler(CommandHandler('lista', self.lista))
         app.add_handler(MessageHandler(filters.Regex('^⚙️ Mi Perfil$'), self.mi_perfil))
 
         app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.manejar_menu))
@@ -1122,6 +1844,7 @@ class SamanthaBot:
             app = Application.builder().token(TELEGRAM_TOKEN).build()
 
             self.setup_handlers(app)
+            self.setup_jobs(app)
 
             logger.info("✨ Bot iniciado correctamente")
             logger.info("Presiona Ctrl+C para detener")
@@ -1147,3 +1870,5 @@ class SamanthaBot:
             else:
                 logger.error(f"Error fatal al iniciar el bot: {e}", exc_info=True)
             raise
+        finally:
+            self.db.cerrar()
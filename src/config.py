@@ -19,21 +19,108 @@ NIT_EMPRESA = os.getenv('NIT_EMPRESA', '71224556')
 
 # ==================== ESTADOS DE CONVERSACIÓN ====================
 (TIPO_GASTO, PHOTO, CONFIRMAR, EDITAR_CAMPO, EDITAR_VALOR, BORRAR_ID,
- REGISTRO_NOMBRE, SELECCIONAR_MES, SELECCIONAR_ANIO, CAMBIAR_NOMBRE) = range(10)
+ REGISTRO_NOMBRE, SELECCIONAR_MES, SELECCIONAR_ANIO, CAMBIAR_NOMBRE,
+ LISTA_PAGINA, BUSCAR_TEXTO, BUSCAR_PAGINA, CONFIRMAR_DUPLICADO,
+ BORRAR_CONFIRMAR, IMPORTAR_ARCHIVO) = range(16)
 
 # ==================== TIPOS DE GASTO ====================
 TIPOS_GASTO = ['ALIMENTACIÓN', 'COMBUSTIBLE']
 
+# Patrones (expresiones regulares sobre el texto del OCR en mayúsculas) para inferir el tipo de gasto.
+# Palabras sueltas que aparecen en cualquier factura (SUPER, REGULAR, BOMBA, MESA, CENA) solo
+# cuentan en el contexto de una gasolinera o un restaurante: tipo de combustible con galones,
+# número de bomba o de mesa
+TIPO_GASTO_PATRONES = {
+    'COMBUSTIBLE': [
+        r'GASOLINERA', r'ESTACI[OÓ]N DE SERVICIO', r'COMBUSTIBLES?', r'GASOLINA', r'GAL[OÓ]N(ES)?',
+        r'\d+(\.\d+)?\s*GLS?', r'DI[EÉ]SEL', r'V-POWER', r'LUBRICANTES',
+        r'(SUPER|REGULAR)\s+(\d+(\.\d+)?\s*(GLS?|GAL[OÓ]N(ES)?)|GASOLINA)',
+        r'(GASOLINA|COMBUSTIBLE)\s+(SUPER|REGULAR)',
+        r'BOMBA\s*(#|NO\.?|N[UÚ]MERO)\s*\d+'
+    ],
+    'ALIMENTACIÓN': [
+        r'RESTAURANTE?', r'CAFETER[IÍ]A', r'COMEDOR', r'COMIDA', r'ALIMENTOS', r'BEBIDAS?',
+        r'DESAYUNOS?', r'ALMUERZOS?', r'MEN[UÚ]', r'COMBO', r'POLLO', r'PIZZA', r'HAMBURGUESAS?',
+        r'CAF[EÉ]', r'PROPINA', r'MESERO', r'MESA\s*(#|NO\.?|N[UÚ]MERO)\s*\d+'
+    ]
+}
+
+# Ventaja mínima en coincidencias del tipo ganador sobre el otro para elegirlo sin preguntar
+TIPO_GASTO_MARGEN_MINIMO = 2
+
+# Facturas por página al navegar la lista
+FACTURAS_POR_PAGINA = 10
+
+# Facturas que se pueden borrar en una sola operación (lista o rangos de números)
+MAXIMO_FACTURAS_BORRADO = 200
+
 # ==================== CONFIGURACIÓN DE ARCHIVOS ====================
 FACTURAS_FOLDER = 'facturas'
 DATABASE_NAME = 'viaticos.db'
 
+# ==================== CONFIGURACIÓN DE BASE DE DATOS ====================
+DATABASE_CONFIG = {
+    'busy_timeout_ms': 5000,     # Espera máxima por el lock de escritura
+    'cache_size_kb': 20000,      # Caché de páginas por conexión (~20 MB)
+    'cached_statements': 256,    # Sentencias preparadas en caché por conexión
+    'hilos': 4,                  # Hilos para consultas desde el bot (uno por conexión de lectura)
+    'cache_usuarios': 1000,      # Usuarios que se mantienen en memoria para verificar identidad
+    'ventana_escritura_ms': 10,  # Tiempo para agrupar escrituras concurrentes en un commit
+    'lote_maximo_escritura': 200,  # Escrituras máximas por commit
+    'lote_lectura': 500,         # Filas por fetchmany al recorrer facturas para exportar
+    # Sentencias más lentas que esto se registran en el log como consultas lentas
+    'consulta_lenta_ms': float(os.getenv('DB_CONSULTA_LENTA_MS', '100')),
+    # Capturar EXPLAIN QUERY PLAN de las consultas lentas (DB_EXPLICAR_LENTAS=1)
+    'explicar_consultas_lentas': os.getenv('DB_EXPLICAR_LENTAS', '0') == '1'
+}
+
+# ==================== CONFIGURACIÓN DE RESPALDOS ====================
+BACKUP_CONFIG = {
+    'directorio': os.getenv('BACKUP_DIR', 'respaldos'),
+    'intervalo_horas': float(os.getenv('BACKUP_INTERVALO_HORAS', '24')),  # Cada cuánto se respalda
+    'retencion': int(os.getenv('BACKUP_RETENCION', '7')),                  # Respaldos que se conservan
+    # Copias del estado previo a una restauración que se conservan (se rotan aparte de los respaldos)
+    'retencion_restauraciones': int(os.getenv('BACKUP_RETENCION_RESTAURACIONES', '3')),
+    'paginas_por_paso': 256,     # Páginas copiadas por paso de la API de respaldo
+    'pausa_ms': 20               # Pausa entre pasos para no acaparar la base de datos
+}
+
+# ==================== CONFIGURACIÓN DE MANTENIMIENTO ====================
+MANTENIMIENTO_CONFIG = {
+    'hora': int(os.getenv('MANTENIMIENTO_HORA', '3')),                 # Hora local de poco uso (-1 lo desactiva)
+    'presupuesto_s': float(os.getenv('MANTENIMIENTO_PRESUPUESTO_S', '60')),  # Tiempo máximo por ejecución
+    'limite_analisis': 1000,     # PRAGMA analysis_limit: filas revisadas por índice en ANALYZE
+    'paginas_por_paso': 500      # Páginas liberadas por paso de incremental_vacuum
+}
+
+# ==================== CONFIGURACIÓN DE ARCHIVO ANUAL ====================
+ARCHIVO_CONFIG = {
+    'directorio': os.getenv('ARCHIVO_DIR', 'archivo'),
+    'anios_activos': int(os.getenv('ARCHIVO_ANIOS_ACTIVOS', '2'))  # Año actual y anterior en la base principal
+}
+
 # ==================== CONFIGURACIÓN DE OCR ====================
 OCR_CONFIG = {
     'lang': 'spa',
     'config': '--psm 6'
 }
 
+# Pipelines de preprocesamiento: nombre -> etapas registradas en src/preprocesamiento.py
+# Se pueden sobrescribir desde .env con nombres separados por coma
+OCR_PIPELINES = {
+    'basico': os.getenv('OCR_PIPELINE_BASICO', 'gris,contraste,enfocar,mediana,brillo').split(','),
+    'avanzado': os.getenv('OCR_PIPELINE_AVANZADO', 'gris,nlmeans,umbral_adaptativo,nitidez').split(','),
+    'original': []
+}
+
+# Estrategias de OCR: (pipeline, configuración de tesseract)
+OCR_ESTRATEGIAS = [
+    ('basico', '--psm 6 --oem 3'),
+    ('basico', '--psm 4 --oem 3'),
+    ('avanzado', '--psm 6 --oem 3'),
+    ('original', '--psm 6 --oem 3'),  # Sin preprocesamiento
+]
+
 # ==================== PATRONES REGEX PARA OCR ====================
 OCR_PATTERNS = {
     'nit': r'\d{6,}',
@@ -46,19 +133,29 @@ OCR_PATTERNS = {
 EXCEL_CONFIG = {
     'data_start_row': 7,
     'columns': ['FECHA', 'NIT PROVEEDOR', 'NOMBRE PROVEEDOR', 'SERIE', 'No. COMPROBANTE', 'TIPO DE GASTO', 'MONTO Q.'],
+    # A: numeración, B-H: columnas de datos
     'column_widths': {
         'A': 8,
         'B': 12,
-        'C': 30,
-        'D': 12,
-        'E': 18,
-        'F': 15,
+        'C': 14,
+        'D': 30,
+        'E': 12,
+        'F': 18,
         'G': 18,
         'H': 18,
-        'I': 12
+        'I': 12,
+        'J': 12
     }
 }
 
+# ==================== CONFIGURACIÓN DE IMPORTACIÓN ====================
+IMPORTACION_CONFIG = {
+    'extensiones': ('.xlsx', '.csv'),
+    'maximo_filas': 5000,        # Facturas por archivo
+    'maximo_mb': 5,              # Tamaño máximo del archivo enviado al bot
+    'filas_encabezado': 20       # Filas donde se busca la fila de headers (la plantilla la tiene en la 7)
+}
+
 # ==================== VALIDACIÓN ====================
 def validate_config():
     """Validar que la configuración esté completa"""
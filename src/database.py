@@ -2,113 +2,767 @@
 Módulo de Base de Datos con soporte multi-usuario
 """
 
+import os
+import queue
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
-from typing import List, Tuple, Optional
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Optional
 import logging
-from .config import DATABASE_NAME
+from .config import DATABASE_NAME, DATABASE_CONFIG, ARCHIVO_CONFIG
+from .instrumentacion import CursorMedido, MetricasConsultas
+from .modelos import Factura, fila_factura
+from .migraciones import (aplicar_migraciones, actualizar_facturas_a_centavos, sql_agrupar_resumen,
+                          sql_llave_duplicado, SQL_RECONSTRUIR_RESUMEN, SQL_FACTURA_IDENTIFICABLE,
+                          VERSION_ARCHIVO)
+from .utils import normalizar_fecha, normalizar_nit, a_centavos, desde_centavos
 
 logger = logging.getLogger(__name__)
 
+# Los montos se guardan en centavos enteros; las columnas con tipo [centavos] en su alias
+# (p. ej. monto_centavos AS "monto [centavos]") se leen como Decimal en quetzales
+sqlite3.register_converter('centavos', lambda valor: desde_centavos(int(valor)))
+_MONTO = 'monto_centavos AS "monto [centavos]"'
+
+# Las migraciones usan ALTER TABLE ... DROP COLUMN y los borrados DELETE ... RETURNING
+SQLITE_VERSION_MINIMA = (3, 35, 0)
+
+
+def _rango_mes(mes: int, anio: int) -> Tuple[str, str]:
+    """Límites ISO [inicio, fin) de un mes para consultas por rango de fecha"""
+    fecha_inicio = f"{anio}-{mes:02d}-01"
+    if mes == 12:
+        fecha_fin = f"{anio + 1}-01-01"
+    else:
+        fecha_fin = f"{anio}-{mes + 1:02d}-01"
+    return fecha_inicio, fecha_fin
+
+
+def _condicion_tramo(desde: Optional[str], hasta: Optional[str]) -> Tuple[str, List[str]]:
+    """Condición SQL (y sus parámetros) para fechas en [desde, hasta); sin inicio incluye las facturas sin fecha"""
+    if desde is None and hasta is None:
+        return '', []
+    if desde is None:
+        return ' AND (fecha IS NULL OR fecha < ?)', [hasta]
+    if hasta is None:
+        return ' AND fecha >= ?', [desde]
+    return ' AND fecha >= ? AND fecha < ?', [desde, hasta]
+
+
+def _periodo_exportacion(mes: Optional[int], anio: Optional[int]) -> str:
+    """Llave del período en la caché de exportaciones: 'AAAA-MM' o 'todas'"""
+    return f"{anio}-{mes:02d}" if mes and anio else 'todas'
+
+
+# Columnas de facturas en el orden en que se copian a los archivos anuales
+_COLUMNAS_FACTURA = ('id, user_id, fecha, nit_proveedor, nombre_proveedor, serie, numero, '
+                     'tipo_gasto, monto_centavos, foto_path, created_at, duplicado_de')
+
+# Esquema de un archivo anual: las facturas conservan su id original
+_ESQUEMA_ARCHIVO = (
+    '''CREATE TABLE IF NOT EXISTS archivo.facturas
+       (id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        fecha TEXT,
+        nit_proveedor TEXT,
+        nombre_proveedor TEXT,
+        serie TEXT,
+        numero TEXT,
+        tipo_gasto TEXT,
+        monto_centavos INTEGER,
+        foto_path TEXT,
+        created_at TEXT,
+        duplicado_de INTEGER)''',
+    '''CREATE INDEX IF NOT EXISTS archivo.idx_facturas_user_fecha
+       ON facturas(user_id, fecha, tipo_gasto, monto_centavos)''',
+    # Sin UNIQUE: un archivo puede traer duplicados de antes del índice único de la base principal
+    f'''CREATE INDEX IF NOT EXISTS archivo.idx_facturas_llave
+        ON facturas({', '.join(sql_llave_duplicado())}) WHERE {SQL_FACTURA_IDENTIFICABLE}'''
+)
+
+# Misma llave normalizada en una consulta: (nit, serie, numero) como parámetros
+_CONDICION_LLAVE = ' AND '.join(f'{columna} = {valor}' for columna, valor
+                                in zip(sql_llave_duplicado(), sql_llave_duplicado('?', '?', '?')))
+
+
+def _anio_fecha(fecha: Optional[str]) -> Optional[int]:
+    """Año de una fecha ISO, o None si no hay fecha"""
+    return int(fecha[:4]) if fecha else None
+
+
+def _consulta_busqueda(user_id: int, texto: str) -> Optional[str]:
+    """
+    Expresión MATCH de FTS5 para buscar un texto entre las facturas de un usuario
+
+    Cada palabra se busca como prefijo. Los NIT se indexan sin guiones, así que
+    también se prueba el texto con los guiones entre dígitos quitados (12345-6 -> 123456).
+    Las palabras se buscan solo en las columnas de la factura: sin el filtro de columnas,
+    'u' o 'u1' coincidirían con el token del usuario y devolverían todas sus facturas.
+    """
+    variantes = []
+    for variante in (texto, re.sub(r'(?<=\w)-(?=\w)', '', texto)):
+        terminos = re.findall(r'\w+', variante)
+        if terminos and terminos not in variantes:
+            variantes.append(terminos)
+    if not variantes:
+        return None
+
+    alternativas = ' OR '.join('(' + ' '.join(f'"{t}"*' for t in terminos) + ')' for terminos in variantes)
+    return f'usuario:"u{int(user_id)}" AND {{proveedor nit serie numero}}: ({alternativas})'
+
+
+class FacturaDuplicada(Exception):
+    """La factura repite el NIT, la serie y el número de otra ya registrada"""
+
+    def __init__(self, existente: Tuple[int, int, str]):
+        self.existente = existente
+        super().__init__(f"La factura ya está registrada como #{existente[0]}")
+
 
 class Database:
 
     def __init__(self, db_name: str = DATABASE_NAME):
+        if sqlite3.sqlite_version_info < SQLITE_VERSION_MINIMA:
+            minima = '.'.join(map(str, SQLITE_VERSION_MINIMA))
+            logger.error(f"SQLite {sqlite3.sqlite_version} no es compatible: se necesita {minima} o superior")
+            raise RuntimeError(f"Se necesita SQLite {minima} o superior (Python usa {sqlite3.sqlite_version}); "
+                               f"actualiza Python o la biblioteca SQLite del sistema")
         self.db_name = db_name
-        self.init_db()
-        self._migrate_if_needed()
-        self._create_indexes()
-
-    def init_db(self):
-        try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
-
-            c.execute('''CREATE TABLE IF NOT EXISTS usuarios
-                         (user_id INTEGER PRIMARY KEY,
-                          nombre TEXT NOT NULL,
-                          telefono TEXT,
-                          created_at TEXT,
-                          updated_at TEXT)''')
-
-            c.execute('''CREATE TABLE IF NOT EXISTS facturas
-                         (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                          user_id INTEGER NOT NULL,
-                          fecha TEXT,
-                          nit_proveedor TEXT,
-                          nombre_proveedor TEXT,
-                          serie TEXT,
-                          numero TEXT,
-                          tipo_gasto TEXT,
-                          monto REAL,
-                          foto_path TEXT,
-                          created_at TEXT,
-                          FOREIGN KEY (user_id) REFERENCES usuarios (user_id))''')
-
-            conn.commit()
-            conn.close()
-            logger.info("Tablas de base de datos inicializadas correctamente")
+        # Una conexión de escritura compartida (serializada con el lock) y
+        # una conexión de lectura por hilo; en modo WAL las lecturas no esperan a las escrituras
+        self._lock = threading.RLock()
+        self._lectores = threading.local()
+        self._conexiones = []
+        self._conn = self._conectar()
+        # Métricas por consulta (duración, filas, espera de lock) y registro de consultas lentas
+        self._metricas = MetricasConsultas(DATABASE_CONFIG['consulta_lenta_ms'],
+                                           DATABASE_CONFIG['explicar_consultas_lentas'])
+        # Caché LRU de usuarios: user_id -> (user_id, nombre, telefono) o None si no existe
+        self._cache_usuarios = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_generacion = 0
+        self._cache_aciertos = 0
+        self._cache_fallos = 0
+        # Cola de escrituras agrupadas (group commit) para inserciones y borrados de facturas
+        self._cola_escritura = queue.Queue()
+        # Acciones en memoria de la operación del lote en curso, para después del commit
+        self._al_confirmar = []
+        self._lotes_escritura = 0
+        self._operaciones_escritura = 0
+        self._hilo_escritor = threading.Thread(target=self._escritor, name='db-escritor', daemon=True)
+        self._hilo_escritor.start()
+        self._migrar()
+        self._proveedores = {}
+        self._cargar_directorio_proveedores()
+        self._archivos = {}
+        self._cargar_archivos()
+
+    def _conectar(self, registrar: bool = True) -> sqlite3.Connection:
+        """Abre una conexión configurada con WAL y pragmas de rendimiento"""
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=DATABASE_CONFIG['busy_timeout_ms'] / 1000,
+            check_same_thread=False,
+            cached_statements=DATABASE_CONFIG['cached_statements'],
+            detect_types=sqlite3.PARSE_COLNAMES
+        )
+        # Las páginas libres se devuelven con incremental_vacuum en el mantenimiento; solo tiene
+        # efecto en bases nuevas o después de un VACUUM completo (python -m src.admin mantenimiento --vacuum)
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f"PRAGMA busy_timeout={int(DATABASE_CONFIG['busy_timeout_ms'])}")
+        conn.execute(f"PRAGMA cache_size=-{int(DATABASE_CONFIG['cache_size_kb'])}")
+        conn.execute('PRAGMA temp_store=MEMORY')
+        if registrar:
+            with self._lock:
+                self._conexiones.append(conn)
+        return conn
+
+    @contextmanager
+    def _escritura(self, nombre: str) -> Iterator[CursorMedido]:
+        """Cursor medido de la conexión de escritura; confirma al salir o revierte si hay error"""
+        inicio = time.perf_counter()
+        with self._lock:
+            espera_ms = (time.perf_counter() - inicio) * 1000
+            c = CursorMedido(self._conn.cursor(), nombre, self._metricas, espera_ms)
+            try:
+                yield c
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            finally:
+                c.close()
+
+    @contextmanager
+    def _lectura(self, nombre: str) -> Iterator[CursorMedido]:
+        """Cursor medido de la conexión de lectura del hilo actual (se abre la primera vez)"""
+        conn = getattr(self._lectores, 'conn', None)
+        if conn is None:
+            conn = self._conectar()
+            self._lectores.conn = conn
+        c = CursorMedido(conn.cursor(), nombre, self._metricas)
+        try:
+            yield c
+        finally:
+            c.close()
+
+    def _escribir_en_lote(self, nombre: str, operacion: Callable[[sqlite3.Cursor], Any]) -> Any:
+        """
+        Encola una escritura para el hilo escritor y espera su resultado.
+        La operación recibe un cursor dentro de la transacción del lote; sus
+        excepciones se relanzan aquí sin afectar al resto del lote.
+        """
+        futuro = Future()
+        self._cola_escritura.put((operacion, futuro, nombre, time.perf_counter()))
+        return futuro.result()
+
+    def _escritor(self):
+        """Hilo que agrupa las escrituras pendientes y las confirma en una sola transacción"""
+        ventana = DATABASE_CONFIG['ventana_escritura_ms'] / 1000
+        lote_maximo = DATABASE_CONFIG['lote_maximo_escritura']
+        ultimo_lote = 0
+
+        while True:
+            item = self._cola_escritura.get()
+            if item is None:
+                return
+
+            lote = [item]
+            detener = False
+            # Se toma todo lo que ya está en cola; además, dentro de la ventana se espera
+            # hasta juntar tantas escrituras como el lote anterior. Así una escritura
+            # aislada no paga latencia extra y con carga cada commit agrupa a todos
+            limite = time.monotonic() + ventana
+            while len(lote) < lote_maximo:
+                restante = limite - time.monotonic()
+                esperar = restante > 0 and len(lote) < ultimo_lote
+                try:
+                    item = self._cola_escritura.get(timeout=restante) if esperar else self._cola_escritura.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    detener = True
+                    break
+                lote.append(item)
+
+            self._ejecutar_lote(lote)
+            ultimo_lote = len(lote)
+            if detener:
+                return
+
+    def _ejecutar_lote(self, lote: List[Tuple[Callable, Future, str, float]]):
+        """Ejecuta un lote de escrituras en una transacción con un savepoint por operación"""
+        resultados = []
+        confirmar = []
+        with self._lock:
+            c = self._conn.cursor()
+            try:
+                c.execute('BEGIN IMMEDIATE')
+                for operacion, futuro, nombre, encolado in lote:
+                    c.execute('SAVEPOINT operacion')
+                    self._al_confirmar = []
+                    # La espera de una escritura agrupada es el tiempo que pasó en la cola
+                    medido = CursorMedido(c, nombre, self._metricas, (time.perf_counter() - encolado) * 1000)
+                    try:
+                        resultados.append((futuro, operacion(medido), None))
+                        medido.terminar()
+                        c.execute('RELEASE operacion')
+                        confirmar.extend(self._al_confirmar)
+                    except Exception as e:
+                        medido.terminar()
+                        c.execute('ROLLBACK TO operacion')
+                        c.execute('RELEASE operacion')
+                        resultados.append((futuro, None, e))
+                self._conn.commit()
+                self._lotes_escritura += 1
+                self._operaciones_escritura += len(lote)
+            except Exception as e:
+                self._conn.rollback()
+                logger.error(f"Error al confirmar lote de {len(lote)} escrituras: {e}")
+                for _, futuro, _, _ in lote:
+                    futuro.set_exception(e)
+                return
+            finally:
+                self._al_confirmar = []
+                c.close()
+
+            for accion in confirmar:
+                accion()
+
+        # Los resultados se entregan solo después del commit
+        for futuro, resultado, error in resultados:
+            if error is not None:
+                futuro.set_exception(error)
+            else:
+                futuro.set_result(resultado)
+
+    def estadisticas_consultas(self) -> Dict[str, dict]:
+        """Métricas por consulta (llamadas, percentiles, filas, espera de lock, histograma), de mayor a menor tiempo total"""
+        return self._metricas.resumen()
+
+    def consultas_lentas(self) -> List[dict]:
+        """Últimas sentencias que superaron DATABASE_CONFIG['consulta_lenta_ms']"""
+        return self._metricas.consultas_lentas()
+
+    def registrar_resumen_consultas(self, cantidad: int = 5):
+        """Escribe en el log las consultas que más tiempo acumulan"""
+        for nombre, datos in list(self._metricas.resumen().items())[:cantidad]:
+            logger.info(f"Consulta {nombre}: {datos['llamadas']} llamadas, total {datos['total_ms']:.1f} ms, "
+                        f"p50 {datos['p50_ms']} ms, p95 {datos['p95_ms']} ms, máx {datos['max_ms']} ms, "
+                        f"espera de lock {datos['espera_lock_ms']:.1f} ms")
+
+    def registrar_resumen_cache_usuarios(self):
+        """Escribe en el log los aciertos de la caché de usuarios"""
+        datos = self.estadisticas_cache_usuarios()
+        consultas = datos['aciertos'] + datos['fallos']
+        tasa = f"{datos['aciertos'] / consultas:.0%}" if consultas else "-"
+        logger.info(f"Caché de usuarios: {datos['aciertos']} aciertos, {datos['fallos']} fallos ({tasa}), "
+                    f"{datos['tamano']} usuarios en memoria")
+
+    def estadisticas_escrituras(self) -> dict:
+        """Lotes confirmados y operaciones escritas por la cola de escritura"""
+        return {'lotes': self._lotes_escritura, 'operaciones': self._operaciones_escritura}
+
+    def respaldar(self, destino: sqlite3.Connection, paginas_por_paso: int, pausa: float):
+        """
+        Copia la base de datos a otra conexión con la API de respaldo de SQLite
+
+        Se copia desde la conexión de escritura, así las escrituras hechas durante el
+        respaldo se reflejan en la copia en lugar de reiniciarla. El lock se libera
+        entre pasos para que las escrituras del bot no esperen al respaldo completo.
+
+        Args:
+            destino: Conexión a la base de datos de destino
+            paginas_por_paso: Páginas copiadas en cada paso
+            pausa: Segundos de espera entre pasos
+        """
+        def ceder(estado, restantes, total):
+            if restantes:
+                self._lock.release()
+                try:
+                    time.sleep(pausa)
+                finally:
+                    self._lock.acquire()
+
+        with self._lock:
+            self._conn.backup(destino, pages=paginas_por_paso, progress=ceder)
+
+    def _tamanio_archivos(self) -> int:
+        """Bytes que ocupan la base de datos y su WAL"""
+        return sum(os.path.getsize(ruta) for ruta in (self.db_name, f"{self.db_name}-wal") if os.path.exists(ruta))
+
+    def mantenimiento(self, presupuesto: float, limite_analisis: int = 1000,
+                      paginas_por_paso: int = 500) -> Dict[str, float]:
+        """
+        Mantenimiento de la base de datos dentro de un presupuesto de tiempo
+
+        Pasos: ANALYZE (muestreado con analysis_limit), PRAGMA optimize, incremental_vacuum
+        por pasos y checkpoint del WAL. Un paso no empieza si el presupuesto ya se agotó, y
+        el lock de escritura se libera entre pasos para que el bot siga guardando facturas.
+
+        Args:
+            presupuesto: Segundos disponibles
+            limite_analisis: Filas revisadas por índice en ANALYZE
+            paginas_por_paso: Páginas liberadas en cada paso del vacuum
+
+        Returns:
+            dict: paso -> duración en ms (solo los pasos que se ejecutaron)
+        """
+        limite = time.monotonic() + presupuesto
+        tamanio_antes = self._tamanio_archivos()
+        duraciones = {}
+
+        def analizar():
+            with self._escritura('mantenimiento_analyze') as c:
+                c.execute(f'PRAGMA analysis_limit={int(limite_analisis)}')
+                c.execute('ANALYZE main')
+
+        def optimizar():
+            with self._escritura('mantenimiento_optimize') as c:
+                c.execute('PRAGMA optimize')
+
+        def liberar_paginas():
+            with self._escritura('mantenimiento_vacuum') as c:
+                modo = c.execute('PRAGMA auto_vacuum').fetchone()[0]
+            if modo != 2:
+                return "auto_vacuum no es INCREMENTAL, se omite"
+            liberadas = 0
+            while time.monotonic() < limite:
+                with self._lock:
+                    libres = self._conn.execute('PRAGMA freelist_count').fetchone()[0]
+                    if not libres:
+                        break
+                    # execute() da un solo paso a la sentencia (libera una página);
+                    # executescript la ejecuta completa
+                    self._conn.executescript(f'PRAGMA incremental_vacuum({int(paginas_por_paso)})')
+                    liberadas += libres - self._conn.execute('PRAGMA freelist_count').fetchone()[0]
+            return f"{liberadas} páginas liberadas"
+
+        def checkpoint():
+            with self._escritura('mantenimiento_checkpoint') as c:
+                ocupado, paginas_wal, copiadas = c.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+            return f"{copiadas} de {paginas_wal} páginas del WAL" + (", había lectores activos" if ocupado else "")
+
+        for nombre, paso in (('analyze', analizar), ('optimize', optimizar),
+                             ('incremental_vacuum', liberar_paginas), ('wal_checkpoint', checkpoint)):
+            if time.monotonic() >= limite:
+                logger.warning(f"Mantenimiento: presupuesto de {presupuesto:g}s agotado, se omite {nombre}")
+                continue
+            inicio = time.perf_counter()
+            try:
+                detalle = paso()
+            except Exception as e:
+                logger.error(f"Error en mantenimiento ({nombre}): {e}")
+                continue
+            duraciones[nombre] = round((time.perf_counter() - inicio) * 1000, 1)
+            logger.info(f"Mantenimiento: {nombre} en {duraciones[nombre]:.1f} ms"
+                        + (f" ({detalle})" if detalle else ""))
+
+        tamanio_despues = self._tamanio_archivos()
+        logger.info(f"Mantenimiento terminado: {tamanio_antes / 1024:.0f} KB -> {tamanio_despues / 1024:.0f} KB "
+                    f"(base de datos y WAL) en {sum(duraciones.values()):.0f} ms")
+        return duraciones
+
+    def compactar(self):
+        """
+        VACUUM completo de la base de datos; la deja con auto_vacuum INCREMENTAL
+
+        Reescribe todo el archivo y bloquea las escrituras mientras dura:
+        es para usar desde la terminal, no en el mantenimiento diario.
+        """
+        try:
+            with self._lock:
+                tamanio_antes = self._tamanio_archivos()
+                self._conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                self._conn.execute('VACUUM')
+                self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            logger.info(f"Base de datos compactada: {tamanio_antes / 1024:.0f} KB -> "
+                        f"{self._tamanio_archivos() / 1024:.0f} KB")
+        except Exception as e:
+            logger.error(f"Error al compactar base de datos: {e}")
+            raise
+
+    def cerrar(self):
+        """Cierra todas las conexiones abiertas"""
+        if self._hilo_escritor.is_alive():
+            self._cola_escritura.put(None)
+            self._hilo_escritor.join()
+        self.registrar_resumen_consultas()
+        with self._lock:
+            for conn in self._conexiones:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._conexiones = []
+            self._lectores = threading.local()
+        logger.info("Conexiones de base de datos cerradas")
+
+    def _migrar(self):
+        """Lleva el esquema a la última versión; si ya está al día solo lee PRAGMA user_version"""
+        try:
+            with self._lock:
+                version = aplicar_migraciones(self._conn)
+            logger.info(f"Base de datos lista (esquema versión {version})")
         except Exception as e:
-            logger.error(f"Error al inicializar base de datos: {e}")
+            logger.error(f"Error al migrar base de datos: {e}")
             raise
 
-    def _migrate_if_needed(self):
+    def _cargar_archivos(self):
+        """Carga en memoria los años archivados: anio -> ruta del archivo"""
+        pendientes = []
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
+            with self._escritura('_cargar_archivos') as c:
+                c.execute('SELECT anio, ruta, esquema FROM archivos')
+                filas = c.fetchall()
+            self._archivos = {anio: ruta for anio, ruta, _ in filas}
+            # Solo se abren los archivos que no se han revisado desde el último cambio de esquema
+            pendientes = [anio for anio, _, esquema in filas if esquema < VERSION_ARCHIVO]
+            if self._archivos:
+                logger.info(f"Años archivados: {sorted(self._archivos)}")
+        except Exception as e:
+            logger.error(f"Error al cargar archivos anuales: {e}")
 
-            c.execute("PRAGMA table_info(facturas)")
-            columns = [col[1] for col in c.fetchall()]
+        for anio in sorted(pendientes):
+            self._actualizar_archivo(anio)
 
-            if 'user_id' not in columns:
-                logger.info("Migrando base de datos a sistema multi-usuario")
+    def _actualizar_archivo(self, anio: int):
+        """
+        Lleva un archivo anual al esquema actual y lo marca al día
 
-                c.execute('ALTER TABLE facturas ADD COLUMN user_id INTEGER')
-                c.execute('UPDATE facturas SET user_id = 0 WHERE user_id IS NULL')
+        Convierte a centavos los montos de los archivos creados antes de la migración 9,
+        agrega duplicado_de a los creados antes de que se copiara (sus facturas quedan sin enlace)
+        y crea el índice de la llave de duplicados.
+        """
+        try:
+            with self._lock:
+                self._conn.execute('ATTACH DATABASE ? AS archivo', (self._archivos[anio],))
+                c = self._conn.cursor()
+                try:
+                    c.execute('PRAGMA archivo.table_info(facturas)')
+                    columnas = [col[1] for col in c.fetchall()]
+                    convertir = 'monto' in columnas
+                    c.execute('BEGIN IMMEDIATE')
+                    if convertir:
+                        c.execute('DROP INDEX IF EXISTS archivo.idx_facturas_user_fecha')
+                        actualizar_facturas_a_centavos(c, 'archivo')
+                        c.execute(_ESQUEMA_ARCHIVO[1])
+                    if 'duplicado_de' not in columnas:
+                        c.execute('ALTER TABLE archivo.facturas ADD COLUMN duplicado_de INTEGER')
+                    c.execute(_ESQUEMA_ARCHIVO[2])
+                    c.execute('UPDATE archivos SET esquema = ? WHERE anio = ?', (VERSION_ARCHIVO, anio))
+                    self._conn.commit()
+                    if convertir:
+                        logger.info(f"Archivo del año {anio} convertido a montos en centavos")
+                except Exception:
+                    self._conn.rollback()
+                    raise
+                finally:
+                    c.close()
+                    self._conn.execute('DETACH DATABASE archivo')
+        except Exception as e:
+            logger.error(f"Error al actualizar el archivo del año {anio}: {e}")
 
-                c.execute("SELECT COUNT(*) FROM usuarios WHERE user_id = 0")
-                if c.fetchone()[0] == 0:
-                    c.execute('''INSERT INTO usuarios (user_id, nombre, created_at)
-                                 VALUES (0, 'Usuario Legacy', ?)''',
-                              (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+    def anios_archivados(self) -> List[int]:
+        """Años cuyas facturas están en archivos anuales"""
+        return sorted(self._archivos)
 
-                conn.commit()
-                logger.info("Migración completada")
+    @contextmanager
+    def _adjuntar_archivo(self, c: sqlite3.Cursor, anio: int) -> Iterator[None]:
+        """Adjunta el archivo de un año como esquema 'archivo' mientras dura el bloque"""
+        c.execute('ATTACH DATABASE ? AS archivo', (self._archivos[anio],))
+        try:
+            yield
+        finally:
+            c.execute('DETACH DATABASE archivo')
 
-            conn.close()
+    def anios_archivables(self) -> List[int]:
+        """Años cerrados que todavía tienen facturas en la base principal"""
+        anio_limite = datetime.now().year - ARCHIVO_CONFIG['anios_activos'] + 1
+        with self._lectura('anios_archivables') as c:
+            c.execute('''SELECT DISTINCT CAST(substr(fecha, 1, 4) AS INTEGER) FROM facturas
+                         WHERE fecha >= '0001-01-01' AND fecha < ?
+                         ORDER BY 1''', (f"{anio_limite}-01-01",))
+            return [fila[0] for fila in c.fetchall()]
+
+    def archivar_anio(self, anio: int, directorio: str = None) -> int:
+        """
+        Mueve las facturas de un año cerrado a su archivo anual
+
+        Primero se copian al archivo (en su propia transacción) y después se borran de la
+        base principal, así una interrupción nunca pierde facturas. resumen_mensual conserva
+        los totales del año, de modo que los resúmenes no necesitan abrir el archivo.
+        Volver a archivar un año mueve las facturas que se registraron después.
+
+        Args:
+            anio: Año a archivar (anterior al año actual)
+            directorio: Carpeta de los archivos (por defecto la configurada)
+
+        Returns:
+            int: Facturas movidas al archivo
+
+        Raises:
+            ValueError: Si el año no está cerrado
+        """
+        if anio >= datetime.now().year:
+            raise ValueError(f"El año {anio} no está cerrado")
+
+        directorio = directorio or ARCHIVO_CONFIG['directorio']
+        os.makedirs(directorio, exist_ok=True)
+        base = os.path.splitext(os.path.basename(self.db_name))[0]
+        ruta = self._archivos.get(anio) or os.path.join(directorio, f"{base}-{anio}.db")
+        rango = (f"{anio}-01-01", f"{anio + 1}-01-01")
+
+        try:
+            with self._lock:
+                self._conn.execute('ATTACH DATABASE ? AS archivo', (ruta,))
+                c = self._conn.cursor()
+                try:
+                    c.execute('BEGIN IMMEDIATE')
+                    for sentencia in _ESQUEMA_ARCHIVO:
+                        c.execute(sentencia)
+                    c.execute(f'''INSERT OR IGNORE INTO archivo.facturas ({_COLUMNAS_FACTURA})
+                                  SELECT {_COLUMNAS_FACTURA} FROM main.facturas
+                                  WHERE fecha >= ? AND fecha < ?''', rango)
+                    self._conn.commit()
+
+                    c.execute('BEGIN IMMEDIATE')
+                    # Los triggers restan del resumen al borrar; se conservan los totales del año
+                    c.execute('''SELECT user_id, anio, mes, tipo_gasto, total_centavos, cantidad
+                                 FROM resumen_mensual WHERE anio = ?''', (anio,))
+                    resumen = c.fetchall()
+                    c.execute('''DELETE FROM main.facturas
+                                 WHERE fecha >= ? AND fecha < ?
+                                   AND id IN (SELECT id FROM archivo.facturas)''', rango)
+                    movidas = c.rowcount
+                    c.execute('DELETE FROM resumen_mensual WHERE anio = ?', (anio,))
+                    c.executemany('''INSERT INTO resumen_mensual (user_id, anio, mes, tipo_gasto, total_centavos, cantidad)
+                                     VALUES (?, ?, ?, ?, ?, ?)''', resumen)
+                    c.execute('SELECT COUNT(*) FROM archivo.facturas')
+                    total_archivo = c.fetchone()[0]
+                    c.execute('''INSERT OR REPLACE INTO archivos (anio, ruta, facturas, archivado_en, esquema)
+                                 VALUES (?, ?, ?, ?, ?)''',
+                              (anio, ruta, total_archivo, datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                               VERSION_ARCHIVO))
+                    self._conn.commit()
+                except Exception:
+                    self._conn.rollback()
+                    raise
+                finally:
+                    c.close()
+                    self._conn.execute('DETACH DATABASE archivo')
+
+                self._archivos[anio] = ruta
+
+            logger.info(f"Año {anio} archivado en {ruta}: {movidas} facturas movidas ({total_archivo} en total)")
+            return movidas
         except Exception as e:
-            logger.error(f"Error en migración: {e}")
+            logger.error(f"Error al archivar el año {anio}: {e}")
+            raise
 
-    def _create_indexes(self):
-        """Crea los índices después de asegurar que las columnas existan"""
+    def reconstruir_resumenes(self) -> int:
+        """
+        Recalcula resumen_mensual completo desde facturas
+
+        Returns:
+            int: Cantidad de filas (usuario, mes, tipo) generadas
+        """
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
+            # Totales de los años archivados, leídos antes de abrir la transacción
+            archivados = []
+            with self._lectura('reconstruir_resumenes') as c:
+                for anio in self.anios_archivados():
+                    with self._adjuntar_archivo(c, anio):
+                        c.execute(sql_agrupar_resumen('archivo.facturas'))
+                        archivados.extend(c.fetchall())
 
-            c.execute('CREATE INDEX IF NOT EXISTS idx_facturas_user ON facturas(user_id)')
-            c.execute('CREATE INDEX IF NOT EXISTS idx_facturas_fecha ON facturas(fecha)')
+            with self._escritura('reconstruir_resumenes') as c:
+                c.execute('DELETE FROM resumen_mensual')
+                c.execute(SQL_RECONSTRUIR_RESUMEN)
+                c.executemany('''INSERT INTO resumen_mensual (user_id, anio, mes, tipo_gasto, total_centavos, cantidad)
+                                 VALUES (?, ?, ?, ?, ?, ?)
+                                 ON CONFLICT(user_id, anio, mes, tipo_gasto) DO UPDATE
+                                 SET total_centavos = total_centavos + excluded.total_centavos,
+                                     cantidad = cantidad + excluded.cantidad''',
+                              archivados)
+                c.execute('SELECT COUNT(*) FROM resumen_mensual')
+                filas = c.fetchone()[0]
+            logger.info(f"Resumen mensual reconstruido: {filas} filas")
+            return filas
+        except Exception as e:
+            logger.error(f"Error al reconstruir resumen mensual: {e}")
+            raise
 
-            conn.commit()
-            conn.close()
-            logger.info("Índices de base de datos creados correctamente")
+    def _cargar_directorio_proveedores(self):
+        """Carga el directorio NIT -> nombre en memoria"""
+        try:
+            with self._escritura('_cargar_directorio_proveedores') as c:
+                c.execute('SELECT nit, nombre FROM proveedores')
+                self._proveedores = dict(c.fetchall())
+
+            logger.info(f"Directorio de proveedores cargado: {len(self._proveedores)} NITs")
         except Exception as e:
-            logger.error(f"Error al crear índices: {e}")
+            logger.error(f"Error al cargar directorio de proveedores: {e}")
 
-    def registrar_usuario(self, user_id: int, nombre: str, telefono: str = None) -> bool:
+    def obtener_nombre_proveedor(self, nit: str) -> Optional[str]:
+        """Busca el nombre de un proveedor en el directorio en memoria"""
+        return self._proveedores.get(normalizar_nit(nit))
+
+    def actualizar_proveedor(self, nit: str, nombre: str) -> bool:
+        """Corrige (o agrega) el nombre de un proveedor para todos los usuarios"""
+        nit_normalizado = normalizar_nit(nit)
+        if not nit_normalizado or not nombre:
+            return False
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            with self._escritura('actualizar_proveedor') as c:
+                c.execute('''INSERT INTO proveedores (nit, nombre, created_at, updated_at)
+                             VALUES (?, ?, ?, ?)
+                             ON CONFLICT(nit) DO UPDATE SET nombre = excluded.nombre,
+                                                            updated_at = excluded.updated_at''',
+                          (nit_normalizado, nombre, now, now))
+            self._proveedores[nit_normalizado] = nombre
+            logger.info(f"Proveedor {nit_normalizado} actualizado en directorio: {nombre}")
+            return True
+        except Exception as e:
+            logger.error(f"Error al actualizar proveedor: {e}")
+            return False
+
+    def _agregar_proveedor_si_no_existe(self, c: sqlite3.Cursor, nit: str, nombre: str):
+        """
+        Agrega al directorio un NIT nuevo usando el nombre de una factura confirmada
+
+        Se llama dentro de una escritura agrupada: el directorio en memoria se actualiza
+        después del commit del lote, así no queda un nombre que la tabla no tiene si se revierte.
+        """
+        nit_normalizado = normalizar_nit(nit)
+        if not nit_normalizado or not nombre or nit_normalizado in self._proveedores:
+            return
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        c.execute('''INSERT OR IGNORE INTO proveedores (nit, nombre, created_at, updated_at)
+                     VALUES (?, ?, ?, ?)''', (nit_normalizado, nombre, now, now))
+        if c.rowcount:
+            self._al_confirmar.append(lambda: self._proveedores.setdefault(nit_normalizado, nombre))
+
+    def _invalidar_usuario(self, user_id: int):
+        """Saca a un usuario de la caché después de modificarlo"""
+        with self._cache_lock:
+            self._cache_usuarios.pop(user_id, None)
+            self._cache_generacion += 1
+
+    def _usuario_en_cache(self, user_id: int) -> Optional[Tuple]:
+        """Obtiene un usuario desde la caché; si no está, lo consulta y lo guarda"""
+        with self._cache_lock:
+            if user_id in self._cache_usuarios:
+                self._cache_usuarios.move_to_end(user_id)
+                self._cache_aciertos += 1
+                return self._cache_usuarios[user_id]
+            self._cache_fallos += 1
+            generacion = self._cache_generacion
 
+        with self._lectura('obtener_usuario') as c:
+            c.execute('SELECT user_id, nombre, telefono FROM usuarios WHERE user_id = ?', (user_id,))
+            usuario = c.fetchone()
+
+        with self._cache_lock:
+            # Si hubo una invalidación mientras se consultaba, el dato puede estar viejo
+            if generacion == self._cache_generacion:
+                self._cache_usuarios[user_id] = usuario
+                if len(self._cache_usuarios) > DATABASE_CONFIG['cache_usuarios']:
+                    self._cache_usuarios.popitem(last=False)
+        return usuario
+
+    def estadisticas_cache_usuarios(self) -> dict:
+        """Aciertos, fallos y tamaño de la caché de usuarios"""
+        with self._cache_lock:
+            return {
+                'aciertos': self._cache_aciertos,
+                'fallos': self._cache_fallos,
+                'tamano': len(self._cache_usuarios)
+            }
+
+    def registrar_usuario(self, user_id: int, nombre: str, telefono: str = None) -> bool:
+        try:
             now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            c.execute('''INSERT OR REPLACE INTO usuarios
-                         (user_id, nombre, telefono, created_at, updated_at)
-                         VALUES (?, ?, ?,
-                                 COALESCE((SELECT created_at FROM usuarios WHERE user_id = ?), ?),
-                                 ?)''',
-                      (user_id, nombre, telefono, user_id, now, now))
-
-            conn.commit()
-            conn.close()
+            with self._escritura('registrar_usuario') as c:
+                c.execute('''INSERT OR REPLACE INTO usuarios
+                             (user_id, nombre, telefono, created_at, updated_at)
+                             VALUES (?, ?, ?,
+                                     COALESCE((SELECT created_at FROM usuarios WHERE user_id = ?), ?),
+                                     ?)''',
+                          (user_id, nombre, telefono, user_id, now, now))
+                # El nombre va en el encabezado de los Excel ya generados
+                c.execute('DELETE FROM exportaciones WHERE user_id = ?', (user_id,))
+            self._invalidar_usuario(user_id)
+
             logger.info(f"Usuario {user_id} registrado/actualizado: {nombre}")
             return True
         except Exception as e:
@@ -117,24 +771,14 @@ class Database:
 
     def usuario_existe(self, user_id: int) -> bool:
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
-            c.execute('SELECT user_id FROM usuarios WHERE user_id = ?', (user_id,))
-            existe = c.fetchone() is not None
-            conn.close()
-            return existe
+            return self._usuario_en_cache(user_id) is not None
         except Exception as e:
             logger.error(f"Error al verificar usuario: {e}")
             return False
 
     def obtener_usuario(self, user_id: int) -> Optional[Tuple]:
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
-            c.execute('SELECT user_id, nombre, telefono FROM usuarios WHERE user_id = ?', (user_id,))
-            usuario = c.fetchone()
-            conn.close()
-            return usuario
+            return self._usuario_en_cache(user_id)
         except Exception as e:
             logger.error(f"Error al obtener usuario: {e}")
             return None
@@ -142,12 +786,8 @@ class Database:
     def obtener_nombre_usuario(self, user_id: int) -> Optional[str]:
         """Obtiene solo el nombre del usuario"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
-            c.execute('SELECT nombre FROM usuarios WHERE user_id = ?', (user_id,))
-            result = c.fetchone()
-            conn.close()
-            return result[0] if result else None
+            usuario = self._usuario_en_cache(user_id)
+            return usuario[1] if usuario else None
         except Exception as e:
             logger.error(f"Error al obtener nombre de usuario: {e}")
             return None
@@ -155,11 +795,9 @@ class Database:
     def contar_facturas_usuario(self, user_id: int) -> int:
         """Cuenta el total de facturas de un usuario"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
-            c.execute('SELECT COUNT(*) FROM facturas WHERE user_id = ?', (user_id,))
-            count = c.fetchone()[0]
-            conn.close()
+            with self._lectura('contar_facturas_usuario') as c:
+                c.execute('SELECT SUM(cantidad) FROM resumen_mensual WHERE user_id = ?', (user_id,))
+                count = c.fetchone()[0]
             return count or 0
         except Exception as e:
             logger.error(f"Error al contar facturas: {e}")
@@ -167,13 +805,12 @@ class Database:
 
     def actualizar_nombre_usuario(self, user_id: int, nuevo_nombre: str) -> bool:
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
-            c.execute('''UPDATE usuarios SET nombre = ?, updated_at = ?
-                         WHERE user_id = ?''',
-                      (nuevo_nombre, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), user_id))
-            conn.commit()
-            conn.close()
+            with self._escritura('actualizar_nombre_usuario') as c:
+                c.execute('''UPDATE usuarios SET nombre = ?, updated_at = ?
+                             WHERE user_id = ?''',
+                          (nuevo_nombre, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), user_id))
+                c.execute('DELETE FROM exportaciones WHERE user_id = ?', (user_id,))
+            self._invalidar_usuario(user_id)
             logger.info(f"Nombre actualizado para usuario {user_id}: {nuevo_nombre}")
             return True
         except Exception as e:
@@ -182,119 +819,521 @@ class Database:
 
     def insertar_factura(self, user_id: int, fecha: str, nit: str, nombre: str,
                         serie: str, numero: str, tipo_gasto: str,
-                        monto: float, foto_path: str) -> int:
-        try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
-            c.execute('''INSERT INTO facturas
-                         (user_id, fecha, nit_proveedor, nombre_proveedor, serie, numero,
-                          tipo_gasto, monto, foto_path, created_at)
-                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                      (user_id, fecha, nit, nombre, serie, numero, tipo_gasto, monto,
-                       foto_path, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-            conn.commit()
-            factura_id = c.lastrowid
-            conn.close()
-            logger.info(f"Factura #{factura_id} insertada para usuario {user_id}")
+                        monto: Decimal, foto_path: str, duplicado_de: int = None) -> int:
+        """
+        Inserta una factura y devuelve su id
+
+        Args:
+            duplicado_de: Id de la factura que repite, para guardarla a propósito como duplicado
+
+        Raises:
+            FacturaDuplicada: Si ya hay una factura con el mismo NIT, serie y número, también
+                              en el archivo del año de la fecha
+        """
+        try:
+            fecha = normalizar_fecha(fecha) if fecha else None
+            monto_centavos = a_centavos(monto)
+
+            # El índice único solo cubre la base principal: las facturas de un año archivado
+            # se comparan antes con su archivo
+            if duplicado_de is None and _anio_fecha(fecha) in self._archivos:
+                existente = self.buscar_factura_duplicada(nit, serie, numero, fecha)
+                if existente is not None:
+                    logger.info(f"Factura de usuario {user_id} duplicada de #{existente[0]} (archivada)")
+                    raise FacturaDuplicada(existente)
+
+            def insertar(c: sqlite3.Cursor) -> int:
+                c.execute('''INSERT INTO facturas
+                             (user_id, fecha, nit_proveedor, nombre_proveedor, serie, numero,
+                              tipo_gasto, monto_centavos, foto_path, created_at, duplicado_de)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                          (user_id, fecha, nit, nombre, serie, numero, tipo_gasto, monto_centavos,
+                           foto_path, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), duplicado_de))
+                factura_id = c.lastrowid
+                self._agregar_proveedor_si_no_existe(c, nit, nombre)
+                return factura_id
+
+            try:
+                factura_id = self._escribir_en_lote('insertar_factura', insertar)
+            except sqlite3.IntegrityError:
+                # El índice único de (NIT, serie, número) rechazó la factura
+                existente = self.buscar_factura_duplicada(nit, serie, numero, fecha)
+                if existente is None:
+                    raise
+                logger.info(f"Factura de usuario {user_id} duplicada de #{existente[0]}")
+                raise FacturaDuplicada(existente)
+            logger.info(f"Factura #{factura_id} insertada para usuario {user_id}"
+                        + (f" (duplicado de #{duplicado_de})" if duplicado_de else ""))
             return factura_id
+        except FacturaDuplicada:
+            raise
         except Exception as e:
             logger.error(f"Error al insertar factura: {e}")
             raise
 
-    def obtener_resumen(self, user_id: int, mes: int = None, anio: int = None) -> Tuple[float, int, List[Tuple]]:
+    def importar_facturas(self, user_id: int,
+                          facturas: List[Tuple[int, Factura]]) -> Tuple[int, List[Tuple[int, str]]]:
+        """
+        Inserta en una sola transacción las facturas leídas de un archivo
+
+        Antes de insertar se descartan, dentro de la misma transacción, las que repiten
+        una factura registrada o una fila anterior del archivo (la llave del índice único
+        se calcula en SQL). Las de años archivados se comparan antes con su archivo,
+        porque no se puede adjuntar una base dentro de la transacción. Las demás se insertan con un solo executemany; los triggers
+        mantienen al día resumen_mensual y el índice de búsqueda.
+
+        Args:
+            user_id: Usuario al que se asignan las facturas
+            facturas: (número de fila, Factura) con fecha ISO, NIT, nombre, serie, número,
+                      tipo de gasto y monto en Decimal
+
+        Returns:
+            tuple: (facturas insertadas, duplicadas como (número de fila, motivo))
+        """
+        if not facturas:
+            return 0, []
+
+        llave = sql_llave_duplicado('?', '?', '?')
+        # La factura existente se identifica solo si es del mismo usuario (0 si es de otro)
+        consulta_llave = (f'''SELECT {', '.join(llave)},
+                                     (SELECT CASE WHEN user_id = ? THEN id ELSE 0 END FROM facturas
+                                      WHERE {_CONDICION_LLAVE} AND {SQL_FACTURA_IDENTIFICABLE})''')
+        archivadas = self._buscar_archivadas(user_id, facturas)
+        ahora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        def importar(c: sqlite3.Cursor) -> Tuple[int, List[Tuple[int, str]]]:
+            filas = []
+            duplicadas = []
+            vistas = {}
+            for numero_fila, factura in facturas:
+                nit, serie, numero = factura.nit_proveedor, factura.serie, factura.numero
+                if nit and serie and numero:
+                    *clave, existente = c.execute(consulta_llave, (nit, serie, numero, user_id,
+                                                                   nit, serie, numero)).fetchone()
+                    clave = tuple(clave)
+                    if existente is None:
+                        existente = archivadas.get(numero_fila)
+                    if existente is not None:
+                        duplicadas.append((numero_fila, f"ya registrada como #{existente}" if existente
+                                           else "ya registrada por otro usuario"))
+                        continue
+                    if clave in vistas:
+                        duplicadas.append((numero_fila, f"repite la fila {vistas[clave]}"))
+                        continue
+                    vistas[clave] = numero_fila
+
+                nombre = factura.nombre_proveedor or self._proveedores.get(normalizar_nit(nit)) or ''
+                self._agregar_proveedor_si_no_existe(c, nit, nombre)
+                filas.append((user_id, factura.fecha, nit, nombre, serie, numero, factura.tipo_gasto,
+                              a_centavos(factura.monto), None, ahora))
+
+            c.executemany('''INSERT INTO facturas
+                             (user_id, fecha, nit_proveedor, nombre_proveedor, serie, numero,
+                              tipo_gasto, monto_centavos, foto_path, created_at)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', filas)
+            return len(filas), duplicadas
+
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
+            insertadas, duplicadas = self._escribir_en_lote('importar_facturas', importar)
+            logger.info(f"Importación de usuario {user_id}: {insertadas} facturas insertadas, "
+                        f"{len(duplicadas)} duplicadas")
+            return insertadas, duplicadas
+        except Exception as e:
+            logger.error(f"Error al importar facturas: {e}")
+            raise
 
-            if mes and anio:
-                fecha_inicio = f"{anio}-{mes:02d}-01"
-                if mes == 12:
-                    fecha_fin = f"{anio + 1}-01-01"
-                else:
-                    fecha_fin = f"{anio}-{mes + 1:02d}-01"
+    def buscar_factura_duplicada(self, nit: str, serie: str, numero: str,
+                                 fecha: str = None) -> Optional[Tuple[int, int, str]]:
+        """
+        Busca una factura registrada con el mismo NIT, serie y número (normalizados)
 
-                c.execute('''SELECT SUM(monto), COUNT(*) FROM facturas
-                             WHERE user_id = ? AND fecha >= ? AND fecha < ?''',
-                          (user_id, fecha_inicio, fecha_fin))
-            else:
-                c.execute('SELECT SUM(monto), COUNT(*) FROM facturas WHERE user_id = ?', (user_id,))
+        Args:
+            fecha: Fecha ISO de la factura nueva; si su año está archivado también se busca en su archivo
 
-            total, cantidad = c.fetchone()
-            total = total or 0
-            cantidad = cantidad or 0
+        Returns:
+            tuple: (id, user_id, fecha) de la factura existente, o None
+        """
+        if not (nit and serie and numero):
+            return None
+        try:
+            with self._lectura('buscar_factura_duplicada') as c:
+                c.execute(f'''SELECT id, user_id, fecha FROM facturas
+                              WHERE {_CONDICION_LLAVE} AND {SQL_FACTURA_IDENTIFICABLE}''', (nit, serie, numero))
+                existente = c.fetchone()
+            anio = _anio_fecha(fecha)
+            if existente is not None or anio not in self._archivos:
+                return existente
 
-            if mes and anio:
-                c.execute('''SELECT tipo_gasto, SUM(monto), COUNT(*) FROM facturas
-                             WHERE user_id = ? AND fecha >= ? AND fecha < ?
-                             GROUP BY tipo_gasto''',
-                          (user_id, fecha_inicio, fecha_fin))
-            else:
-                c.execute('''SELECT tipo_gasto, SUM(monto), COUNT(*) FROM facturas
-                             WHERE user_id = ? GROUP BY tipo_gasto''', (user_id,))
+            with self._lectura('buscar_factura_duplicada_archivo') as c:
+                with self._adjuntar_archivo(c, anio):
+                    c.execute(f'''SELECT id, user_id, fecha FROM archivo.facturas
+                                  WHERE {_CONDICION_LLAVE} AND {SQL_FACTURA_IDENTIFICABLE}
+                                  ORDER BY id''', (nit, serie, numero))
+                    # Se leen todas para terminar la consulta antes de separar el archivo
+                    archivadas = c.fetchall()
+            return archivadas[0] if archivadas else None
+        except Exception as e:
+            logger.error(f"Error al buscar factura duplicada: {e}")
+            return None
 
-            por_tipo = c.fetchall()
+    def _buscar_archivadas(self, user_id: int, facturas: List[Tuple[int, Factura]]) -> Dict[int, int]:
+        """
+        Filas de una importación que repiten una factura del archivo del año de su fecha
+
+        Returns:
+            dict: número de fila -> id de la factura archivada (0 si es de otro usuario)
+        """
+        por_anio = {}
+        for numero_fila, factura in facturas:
+            anio = _anio_fecha(factura.fecha)
+            if factura.nit_proveedor and factura.serie and factura.numero and anio in self._archivos:
+                por_anio.setdefault(anio, []).append((numero_fila, factura))
+
+        archivadas = {}
+        for anio, filas in sorted(por_anio.items()):
+            with self._lectura('importar_facturas_archivo') as c:
+                with self._adjuntar_archivo(c, anio):
+                    for numero_fila, factura in filas:
+                        c.execute(f'''SELECT CASE WHEN user_id = ? THEN id ELSE 0 END FROM archivo.facturas
+                                      WHERE {_CONDICION_LLAVE} AND {SQL_FACTURA_IDENTIFICABLE}
+                                      ORDER BY id''',
+                                  (user_id, factura.nit_proveedor, factura.serie, factura.numero))
+                        encontradas = c.fetchall()
+                        if encontradas:
+                            archivadas[numero_fila] = encontradas[0][0]
+        return archivadas
+
+    def obtener_duplicados(self) -> List[List[Tuple]]:
+        """
+        Grupos de facturas con el mismo NIT, serie y número, incluidas las guardadas a propósito
+
+        Returns:
+            list: Un grupo por llave; cada grupo con filas
+                  (id, user_id, fecha, nit_proveedor, serie, numero, monto, duplicado_de) ordenadas por id
+        """
+        llave = ', '.join(sql_llave_duplicado())
+        columnas = 'id, user_id, fecha, nit_proveedor, serie, numero, monto_centavos, duplicado_de'
+        condicion = "nit_proveedor != '' AND serie != '' AND numero != ''"
+        try:
+            with self._lectura('obtener_duplicados') as c:
+                # Los años archivados también cuentan: se reúnen en una tabla temporal
+                # adjuntando un archivo a la vez, como en iterar_facturas. Cada inserción
+                # se confirma porque no se puede adjuntar un archivo dentro de una transacción
+                c.execute(f'''CREATE TEMP TABLE IF NOT EXISTS revision_duplicados AS
+                              SELECT {columnas} FROM main.facturas WHERE 0''')
+                try:
+                    c.execute(f'''INSERT INTO temp.revision_duplicados
+                                  SELECT {columnas} FROM main.facturas WHERE {condicion}''')
+                    c.connection.commit()
+                    for anio in self.anios_archivados():
+                        with self._adjuntar_archivo(c, anio):
+                            c.execute(f'''INSERT INTO temp.revision_duplicados
+                                          SELECT {columnas} FROM archivo.facturas WHERE {condicion}''')
+                            c.connection.commit()
+                    c.execute(f'''SELECT id, user_id, fecha, nit_proveedor, serie, numero,
+                                         {_MONTO}, duplicado_de, grupo
+                                  FROM (SELECT {columnas},
+                                               MIN(id) OVER (PARTITION BY {llave}) AS grupo,
+                                               COUNT(*) OVER (PARTITION BY {llave}) AS repeticiones
+                                        FROM temp.revision_duplicados)
+                                  WHERE repeticiones > 1
+                                  ORDER BY grupo, id''')
+                    filas = c.fetchall()
+                finally:
+                    c.connection.rollback()
+                    c.execute('DELETE FROM temp.revision_duplicados')
+                    c.connection.commit()
+        except Exception as e:
+            logger.error(f"Error al buscar facturas duplicadas: {e}")
+            raise
+
+        grupos = {}
+        for fila in filas:
+            grupos.setdefault(fila[-1], []).append(fila[:-1])
+        return list(grupos.values())
+
+    def obtener_resumen(self, user_id: int, mes: int = None, anio: int = None) -> Tuple[float, int, List[Tuple]]:
+        try:
+            with self._lectura('obtener_resumen') as c:
+                if mes and anio:
+                    c.execute('''SELECT tipo_gasto, total_centavos AS "total [centavos]", cantidad FROM resumen_mensual
+                                 WHERE user_id = ? AND anio = ? AND mes = ?
+                                 ORDER BY tipo_gasto''',
+                              (user_id, anio, mes))
+                else:
+                    c.execute('''SELECT tipo_gasto, SUM(total_centavos) AS "total [centavos]", SUM(cantidad)
+                                 FROM resumen_mensual
+                                 WHERE user_id = ?
+                                 GROUP BY tipo_gasto''', (user_id,))
+
+                # El tipo vacío en resumen_mensual corresponde a facturas sin tipo
+                por_tipo = [(tipo or None, monto, cant) for tipo, monto, cant in c.fetchall()]
+
+            total = sum((monto for _, monto, _ in por_tipo), desde_centavos(0))
+            cantidad = sum(cant for _, _, cant in por_tipo)
 
-            conn.close()
             logger.debug(f"Resumen obtenido para usuario {user_id}: total={total}, cantidad={cantidad}")
             return total, cantidad, por_tipo
         except Exception as e:
             logger.error(f"Error al obtener resumen: {e}")
             raise
 
-    def obtener_facturas(self, user_id: int, limit: int = 20) -> List[Tuple]:
+    def obtener_facturas(self, user_id: int, limit: int = 20) -> List[Factura]:
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
-            c.execute('''SELECT id, fecha, nombre_proveedor, tipo_gasto, monto
-                         FROM facturas WHERE user_id = ?
-                         ORDER BY id DESC LIMIT ?''', (user_id, limit))
-            facturas = c.fetchall()
-            conn.close()
+            with self._lectura('obtener_facturas') as c:
+                c.row_factory = fila_factura
+                c.execute(f'''SELECT id, fecha, nombre_proveedor, tipo_gasto, {_MONTO}
+                             FROM facturas WHERE user_id = ?
+                             ORDER BY id DESC LIMIT ?''', (user_id, limit))
+                facturas = c.fetchall()
             logger.debug(f"Obtenidas {len(facturas)} facturas para usuario {user_id}")
             return facturas
         except Exception as e:
             logger.error(f"Error al obtener facturas: {e}")
             raise
 
-    def obtener_todas_facturas(self, user_id: int, mes: int = None, anio: int = None) -> List[Tuple]:
-        try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
+    def obtener_facturas_pagina(self, user_id: int, limite: int = 10,
+                                antes_de_id: int = None, despues_de_id: int = None,
+                                mes: int = None, anio: int = None,
+                                tipo_gasto: str = None) -> Tuple[List[Factura], bool, bool]:
+        """
+        Obtiene una página de facturas (más recientes primero) con paginación por llave
+
+        Args:
+            user_id: Usuario dueño de las facturas
+            limite: Facturas por página
+            antes_de_id: Página siguiente (más antiguas que este id)
+            despues_de_id: Página anterior (más recientes que este id)
+            mes, anio: Filtro opcional por mes
+            tipo_gasto: Filtro opcional por tipo de gasto
 
+        Returns:
+            tuple: (facturas, hay_mas_recientes, hay_mas_antiguas); las facturas con
+                   id, fecha, nombre_proveedor, tipo_gasto y monto
+        """
+        try:
+            condiciones = ['user_id = ?']
+            params = [user_id]
             if mes and anio:
-                fecha_inicio = f"{anio}-{mes:02d}-01"
-                if mes == 12:
-                    fecha_fin = f"{anio + 1}-01-01"
+                condiciones.append('fecha >= ? AND fecha < ?')
+                params.extend(_rango_mes(mes, anio))
+            if tipo_gasto:
+                condiciones.append('tipo_gasto = ?')
+                params.append(tipo_gasto)
+            filtro = ' AND '.join(condiciones)
+
+            # Un mes de un año archivado se consulta en la base principal y en su archivo
+            archivado = bool(mes and anio and anio in self._archivos)
+            facturas_origen = 'facturas'
+            if archivado:
+                facturas_origen = (f'(SELECT {_COLUMNAS_FACTURA} FROM main.facturas '
+                                   f'UNION ALL SELECT {_COLUMNAS_FACTURA} FROM archivo.facturas)')
+
+            with self._lectura('obtener_facturas_pagina') as c, \
+                    (self._adjuntar_archivo(c, anio) if archivado else nullcontext()):
+                c.row_factory = fila_factura
+                if despues_de_id is not None:
+                    c.execute(f'''SELECT id, fecha, nombre_proveedor, tipo_gasto, {_MONTO}
+                                  FROM {facturas_origen} WHERE {filtro} AND id > ?
+                                  ORDER BY id ASC LIMIT ?''', params + [despues_de_id, limite])
+                    facturas = c.fetchall()[::-1]
+                elif antes_de_id is not None:
+                    c.execute(f'''SELECT id, fecha, nombre_proveedor, tipo_gasto, {_MONTO}
+                                  FROM {facturas_origen} WHERE {filtro} AND id < ?
+                                  ORDER BY id DESC LIMIT ?''', params + [antes_de_id, limite])
+                    facturas = c.fetchall()
                 else:
-                    fecha_fin = f"{anio}-{mes + 1:02d}-01"
+                    c.execute(f'''SELECT id, fecha, nombre_proveedor, tipo_gasto, {_MONTO}
+                                  FROM {facturas_origen} WHERE {filtro}
+                                  ORDER BY id DESC LIMIT ?''', params + [limite])
+                    facturas = c.fetchall()
 
-                c.execute('''SELECT fecha, nit_proveedor, nombre_proveedor, serie, numero, tipo_gasto, monto
-                             FROM facturas
-                             WHERE user_id = ? AND fecha >= ? AND fecha < ?
-                             ORDER BY fecha''',
-                          (user_id, fecha_inicio, fecha_fin))
+                c.row_factory = None
+                hay_mas_recientes = hay_mas_antiguas = False
+                if facturas:
+                    c.execute(f'''SELECT EXISTS(SELECT 1 FROM {facturas_origen} WHERE {filtro} AND id > ?),
+                                         EXISTS(SELECT 1 FROM {facturas_origen} WHERE {filtro} AND id < ?)''',
+                              params + [facturas[0].id] + params + [facturas[-1].id])
+                    hay_mas_recientes, hay_mas_antiguas = (bool(x) for x in c.fetchone())
+
+            logger.debug(f"Página de {len(facturas)} facturas para usuario {user_id}")
+            return facturas, hay_mas_recientes, hay_mas_antiguas
+        except Exception as e:
+            logger.error(f"Error al obtener página de facturas: {e}")
+            raise
+
+    def buscar_facturas(self, user_id: int, texto: str, limite: int = 10,
+                        antes_de_id: int = None, despues_de_id: int = None) -> Tuple[List[Factura], bool, bool]:
+        """
+        Busca facturas del usuario por proveedor, NIT, serie o número (más recientes primero)
+
+        Args:
+            user_id: Usuario dueño de las facturas
+            texto: Palabras a buscar; cada una puede ser el inicio de una palabra
+            limite: Resultados por página
+            antes_de_id: Página siguiente (más antiguas que este id)
+            despues_de_id: Página anterior (más recientes que este id)
+
+        Returns:
+            tuple: (facturas, hay_mas_recientes, hay_mas_antiguas); las facturas con id, fecha,
+                   nombre_proveedor, tipo_gasto, monto, nit_proveedor, serie y numero
+        """
+        consulta = _consulta_busqueda(user_id, texto or '')
+        if consulta is None:
+            return [], False, False
+
+        try:
+            with self._lectura('buscar_facturas') as c:
+                # La paginación se hace sobre el rowid del índice FTS (= id de la factura)
+                if despues_de_id is not None:
+                    c.execute('''SELECT rowid FROM facturas_fts
+                                 WHERE facturas_fts MATCH ? AND rowid > ?
+                                 ORDER BY rowid ASC LIMIT ?''', (consulta, despues_de_id, limite))
+                    ids = [fila[0] for fila in c.fetchall()][::-1]
+                elif antes_de_id is not None:
+                    c.execute('''SELECT rowid FROM facturas_fts
+                                 WHERE facturas_fts MATCH ? AND rowid < ?
+                                 ORDER BY rowid DESC LIMIT ?''', (consulta, antes_de_id, limite))
+                    ids = [fila[0] for fila in c.fetchall()]
+                else:
+                    c.execute('''SELECT rowid FROM facturas_fts
+                                 WHERE facturas_fts MATCH ?
+                                 ORDER BY rowid DESC LIMIT ?''', (consulta, limite))
+                    ids = [fila[0] for fila in c.fetchall()]
+
+                if not ids:
+                    return [], False, False
+
+                marcadores = ','.join('?' * len(ids))
+                c.row_factory = fila_factura
+                c.execute(f'''SELECT id, fecha, nombre_proveedor, tipo_gasto, {_MONTO}, nit_proveedor, serie, numero
+                              FROM facturas WHERE id IN ({marcadores}) AND user_id = ?
+                              ORDER BY id DESC''', ids + [user_id])
+                facturas = c.fetchall()
+                c.row_factory = None
+
+                c.execute('''SELECT EXISTS(SELECT 1 FROM facturas_fts WHERE facturas_fts MATCH ? AND rowid > ?),
+                                     EXISTS(SELECT 1 FROM facturas_fts WHERE facturas_fts MATCH ? AND rowid < ?)''',
+                          (consulta, ids[0], consulta, ids[-1]))
+                hay_mas_recientes, hay_mas_antiguas = (bool(x) for x in c.fetchone())
+
+            logger.debug(f"Búsqueda '{texto}' de usuario {user_id}: {len(facturas)} facturas")
+            return facturas, hay_mas_recientes, hay_mas_antiguas
+        except Exception as e:
+            logger.error(f"Error al buscar facturas: {e}")
+            raise
+
+    def obtener_todas_facturas(self, user_id: int, mes: int = None, anio: int = None) -> List[Factura]:
+        try:
+            condicion = 'user_id = ?'
+            params = [user_id]
+            if mes and anio:
+                condicion += ' AND fecha >= ? AND fecha < ?'
+                params.extend(_rango_mes(mes, anio))
+                anios = [anio] if anio in self._archivos else []
             else:
-                c.execute('''SELECT fecha, nit_proveedor, nombre_proveedor, serie, numero, tipo_gasto, monto
-                             FROM facturas WHERE user_id = ?
-                             ORDER BY fecha''', (user_id,))
+                anios = self.anios_archivados()
 
-            facturas = c.fetchall()
-            conn.close()
+            consulta = (f'''SELECT fecha, nit_proveedor, nombre_proveedor, serie, numero, tipo_gasto, {_MONTO}
+                           FROM {{tabla}} WHERE {condicion}
+                           ORDER BY fecha''')
+
+            with self._lectura('obtener_todas_facturas') as c:
+                c.row_factory = fila_factura
+                c.execute(consulta.format(tabla='facturas'), params)
+                facturas = c.fetchall()
+                # Los archivos anuales solo se abren si el periodo pedido los incluye
+                for anio_archivado in anios:
+                    with self._adjuntar_archivo(c, anio_archivado):
+                        c.execute(consulta.format(tabla='archivo.facturas'), params)
+                        facturas.extend(c.fetchall())
+
+            if anios:
+                facturas.sort(key=lambda factura: factura.fecha or '')
             logger.debug(f"Obtenidas {len(facturas)} facturas para exportar (usuario {user_id})")
             return facturas
         except Exception as e:
             logger.error(f"Error al obtener todas las facturas: {e}")
             raise
 
-    def eliminar_factura(self, user_id: int, factura_id: int) -> bool:
+    def iterar_facturas(self, user_id: int, mes: int = None, anio: int = None) -> Iterator[Factura]:
+        """
+        Recorre las facturas de un usuario en orden de fecha, leyéndolas por lotes
+
+        Las filas se leen con fetchmany (DATABASE_CONFIG['lote_lectura'] a la vez) en una
+        conexión propia que se cierra al terminar, así la memoria no depende de la
+        cantidad de facturas y el recorrido no ocupa la conexión de lectura del hilo.
+
+        Args:
+            user_id: Usuario dueño de las facturas
+            mes, anio: Filtro opcional por mes
+
+        Yields:
+            Factura: con fecha, nit_proveedor, nombre_proveedor, serie, numero, tipo_gasto y monto
+        """
+        condicion = 'user_id = ?'
+        params = [user_id]
+        if mes and anio:
+            condicion += ' AND fecha >= ? AND fecha < ?'
+            params.extend(_rango_mes(mes, anio))
+            anios = [anio] if anio in self._archivos else []
+        else:
+            anios = self.anios_archivados()
+
+        # Tramos de fecha en orden: cada año archivado es un tramo propio (su archivo más las
+        # facturas de ese año registradas después de archivarlo) y entre ellos solo se lee la base
+        # principal. Se adjunta un archivo a la vez (SQLite admite 10 por conexión) y el
+        # resultado completo sigue en orden de fecha
+        tramos = []
+        desde = None
+        for anio_archivado in anios:
+            inicio, fin = f"{anio_archivado}-01-01", f"{anio_archivado + 1}-01-01"
+            tramos.append((desde, inicio, None))
+            tramos.append((inicio, fin, anio_archivado))
+            desde = fin
+        tramos.append((desde, None, None))
+
+        columnas = f'fecha, nit_proveedor, nombre_proveedor, serie, numero, tipo_gasto, {_MONTO}'
+        conn = self._conectar(registrar=False)
+        # Si hay archivos anuales el orden requiere ordenar: se permite usar disco en lugar de memoria
+        conn.execute('PRAGMA temp_store=DEFAULT')
+        c = CursorMedido(conn.cursor(), 'iterar_facturas', self._metricas)
+        c.row_factory = fila_factura
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
-            c.execute('DELETE FROM facturas WHERE id = ? AND user_id = ?', (factura_id, user_id))
-            conn.commit()
-            eliminada = c.rowcount > 0
+            cantidad = 0
+            for desde, hasta, anio_archivado in tramos:
+                condicion_tramo, params_tramo = _condicion_tramo(desde, hasta)
+                consultas = [f'SELECT {columnas} FROM main.facturas WHERE {condicion}{condicion_tramo}']
+                if anio_archivado is not None:
+                    conn.execute('ATTACH DATABASE ? AS archivo', (self._archivos[anio_archivado],))
+                    consultas.append(f'SELECT {columnas} FROM archivo.facturas WHERE {condicion}')
+                c.execute(' UNION ALL '.join(consultas) + ' ORDER BY fecha',
+                          params + params_tramo + (params if anio_archivado is not None else []))
+                while True:
+                    filas = c.fetchmany(DATABASE_CONFIG['lote_lectura'])
+                    if not filas:
+                        break
+                    cantidad += len(filas)
+                    yield from filas
+                # Si el recorrido se interrumpe, el archivo se suelta al cerrar la conexión
+                if anio_archivado is not None:
+                    conn.execute('DETACH DATABASE archivo')
+            logger.debug(f"Recorridas {cantidad} facturas del usuario {user_id}")
+        except Exception as e:
+            logger.error(f"Error al recorrer facturas: {e}")
+            raise
+        finally:
+            c.close()
             conn.close()
 
+    def eliminar_factura(self, user_id: int, factura_id: int) -> bool:
+        try:
+            def eliminar(c: sqlite3.Cursor) -> bool:
+                c.execute('DELETE FROM facturas WHERE id = ? AND user_id = ?', (factura_id, user_id))
+                return c.rowcount > 0
+
+            eliminada = self._escribir_en_lote('eliminar_factura', eliminar)
+
             if eliminada:
                 logger.info(f"Factura #{factura_id} eliminada por usuario {user_id}")
             else:
@@ -305,21 +1344,154 @@ class Database:
             logger.error(f"Error al eliminar factura: {e}")
             raise
 
+    def obtener_facturas_por_ids(self, user_id: int, ids: List[int]) -> List[Factura]:
+        """
+        Facturas del usuario entre los ids indicados (los de otros usuarios se omiten)
+
+        Returns:
+            list: Facturas con id, fecha, nombre_proveedor, tipo_gasto y monto, ordenadas por id
+        """
+        if not ids:
+            return []
+        try:
+            marcadores = ','.join('?' * len(ids))
+            with self._lectura('obtener_facturas_por_ids') as c:
+                c.row_factory = fila_factura
+                c.execute(f'''SELECT id, fecha, nombre_proveedor, tipo_gasto, {_MONTO}
+                              FROM facturas WHERE user_id = ? AND id IN ({marcadores})
+                              ORDER BY id''', [user_id] + list(ids))
+                return c.fetchall()
+        except Exception as e:
+            logger.error(f"Error al obtener facturas por id: {e}")
+            raise
+
+    def eliminar_facturas(self, user_id: int, ids: List[int]) -> List[Factura]:
+        """
+        Elimina varias facturas del usuario en una sola transacción
+
+        Args:
+            user_id: Dueño de las facturas (las de otros usuarios no se tocan)
+            ids: Facturas a eliminar
+
+        Returns:
+            list: Facturas eliminadas (id y foto_path), ordenadas por id
+        """
+        if not ids:
+            return []
+        try:
+            marcadores = ','.join('?' * len(ids))
+
+            def eliminar(c: sqlite3.Cursor) -> List[Factura]:
+                # El cursor es el del lote: la fábrica de filas se restablece para las demás operaciones
+                c.row_factory = fila_factura
+                try:
+                    c.execute(f'''DELETE FROM facturas WHERE user_id = ? AND id IN ({marcadores})
+                                  RETURNING id, foto_path''', [user_id] + list(ids))
+                    return sorted(c.fetchall(), key=lambda factura: factura.id)
+                finally:
+                    c.row_factory = None
+
+            eliminadas = self._escribir_en_lote('eliminar_facturas', eliminar)
+            logger.info(f"Facturas eliminadas por usuario {user_id}: {[factura.id for factura in eliminadas]}")
+            return eliminadas
+        except Exception as e:
+            logger.error(f"Error al eliminar facturas: {e}")
+            raise
+
+    def fotos_sin_uso(self, rutas: List[str]) -> List[str]:
+        """De una lista de fotos, las que ya no usa ninguna factura, ni registrada ni archivada"""
+        sin_uso = {ruta for ruta in rutas if ruta}
+        if not sin_uso:
+            return []
+        try:
+            with self._lectura('fotos_sin_uso') as c:
+                marcadores = ','.join('?' * len(sin_uso))
+                c.execute(f'SELECT DISTINCT foto_path FROM facturas WHERE foto_path IN ({marcadores})',
+                          list(sin_uso))
+                sin_uso -= {fila[0] for fila in c.fetchall()}
+                # Una foto reenviada conserva su nombre, así que puede usarla una factura archivada
+                for anio in self.anios_archivados():
+                    if not sin_uso:
+                        break
+                    marcadores = ','.join('?' * len(sin_uso))
+                    with self._adjuntar_archivo(c, anio):
+                        c.execute(f'''SELECT DISTINCT foto_path FROM archivo.facturas
+                                      WHERE foto_path IN ({marcadores})''', list(sin_uso))
+                        sin_uso -= {fila[0] for fila in c.fetchall()}
+            return sorted(sin_uso)
+        except Exception as e:
+            logger.error(f"Error al revisar fotos en uso: {e}")
+            return []
+
+    def version_datos(self, user_id: int, mes: int = None, anio: int = None) -> int:
+        """
+        Versión de las facturas de un usuario en un mes (o en todos los meses)
+
+        La mantienen los triggers de facturas: cambia con cada factura insertada,
+        borrada o modificada en el período y nunca vuelve a un valor anterior.
+        """
+        try:
+            with self._lectura('version_datos') as c:
+                if mes and anio:
+                    c.execute('SELECT version FROM versiones_mes WHERE user_id = ? AND anio = ? AND mes = ?',
+                              (user_id, anio, mes))
+                else:
+                    c.execute('SELECT SUM(version) FROM versiones_mes WHERE user_id = ?', (user_id,))
+                fila = c.fetchone()
+            return (fila[0] if fila else None) or 0
+        except Exception as e:
+            logger.error(f"Error al obtener versión de datos: {e}")
+            raise
+
+    def obtener_exportacion(self, user_id: int, version: int, mes: int = None,
+                            anio: int = None) -> Optional[Tuple[str, str, int, Decimal]]:
+        """
+        Excel ya enviado para el período, si sus datos no cambiaron desde entonces
+
+        Returns:
+            tuple: (file_id de Telegram, filename, cantidad, total) o None
+        """
+        try:
+            with self._lectura('obtener_exportacion') as c:
+                c.execute('''SELECT file_id, filename, cantidad, total_centavos AS "total [centavos]"
+                             FROM exportaciones WHERE user_id = ? AND periodo = ? AND version = ?''',
+                          (user_id, _periodo_exportacion(mes, anio), version))
+                return c.fetchone()
+        except Exception as e:
+            logger.error(f"Error al buscar exportación en caché: {e}")
+            return None
+
+    def guardar_exportacion(self, user_id: int, version: int, file_id: str, filename: str,
+                            cantidad: int, total: Decimal, mes: int = None, anio: int = None):
+        """Recuerda el Excel enviado para el período con la versión de datos con que se generó"""
+        try:
+            with self._escritura('guardar_exportacion') as c:
+                c.execute('''INSERT OR REPLACE INTO exportaciones
+                             (user_id, periodo, version, file_id, filename, cantidad, total_centavos, created_at)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                          (user_id, _periodo_exportacion(mes, anio), version, file_id, filename, cantidad,
+                           a_centavos(total), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        except Exception as e:
+            logger.error(f"Error al guardar exportación en caché: {e}")
+
+    def descartar_exportacion(self, user_id: int, mes: int = None, anio: int = None):
+        """Olvida el Excel guardado para un período (por ejemplo si Telegram ya no acepta su file_id)"""
+        try:
+            with self._escritura('descartar_exportacion') as c:
+                c.execute('DELETE FROM exportaciones WHERE user_id = ? AND periodo = ?',
+                          (user_id, _periodo_exportacion(mes, anio)))
+        except Exception as e:
+            logger.error(f"Error al descartar exportación en caché: {e}")
+
     def obtener_meses_con_datos(self, user_id: int) -> List[Tuple[int, int, int]]:
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
-            c.execute('''SELECT DISTINCT
-                         CAST(strftime('%Y', fecha) AS INTEGER) as anio,
-                         CAST(strftime('%m', fecha) AS INTEGER) as mes,
-                         COUNT(*) as cantidad
-                         FROM facturas
-                         WHERE user_id = ? AND fecha IS NOT NULL
-                         GROUP BY anio, mes
-                         ORDER BY anio DESC, mes DESC''', (user_id,))
-            meses = c.fetchall()
-            conn.close()
-            return meses
+            with self._lectura('obtener_meses_con_datos') as c:
+                c.execute('''SELECT anio, mes, SUM(cantidad) as cantidad
+                             FROM resumen_mensual
+                             WHERE user_id = ? AND anio > 0
+                             GROUP BY anio, mes
+                             ORDER BY anio DESC, mes DESC''', (user_id,))
+                return c.fetchall()
         except Exception as e:
             logger.error(f"Error al obtener meses con datos: {e}")
             return []
@@ -0,0 +1,49 @@
+"""
+Fachada asíncrona sobre Database
+Ejecuta las consultas en un pool de hilos para no bloquear el event loop del bot
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from .config import DATABASE_CONFIG
+from .database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseAsync:
+    """
+    Envuelve una instancia de Database y expone sus métodos públicos como corrutinas.
+
+    Cada hilo del pool usa su propia conexión de lectura (WAL permite lecturas en paralelo)
+    y las escrituras se serializan en la conexión de escritura de Database.
+    """
+
+    def __init__(self, db: Database, hilos: int = DATABASE_CONFIG['hilos']):
+        self.db = db
+        self._executor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='db')
+        logger.info(f"Acceso asíncrono a base de datos con {hilos} hilos")
+
+    def __getattr__(self, nombre: str):
+        if nombre.startswith('_'):
+            raise AttributeError(nombre)
+
+        metodo = getattr(self.db, nombre)
+        if not callable(metodo):
+            return metodo
+
+        @functools.wraps(metodo)
+        async def llamada(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(metodo, *args, **kwargs))
+
+        # Guardar el envoltorio para no recrearlo en cada llamada
+        setattr(self, nombre, llamada)
+        return llamada
+
+    def cerrar(self):
+        """Espera a que terminen las consultas pendientes y cierra las conexiones"""
+        self._executor.shutdown(wait=True)
+        self.db.cerrar()
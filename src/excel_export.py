@@ -5,105 +5,126 @@ Genera reportes de viáticos en formato Excel
 
 import os
 import logging
+import tempfile
 from datetime import datetime
-from typing import List, Tuple
-import pandas as pd
+from decimal import Decimal
+from itertools import chain
+from typing import Iterable, List, Optional, Tuple
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment
 from .config import EXCEL_CONFIG, FACTURAS_FOLDER
+from .modelos import Factura
+from .utils import formatear_fecha, obtener_nombre_mes
 
 logger = logging.getLogger(__name__)
 
 
-def generar_excel(facturas: List[Tuple]) -> Tuple[str, str]:
+def generar_excel(facturas: Iterable[Factura], nombre_usuario: Optional[str] = None,
+                  periodo_texto: Optional[str] = None, user_id: Optional[int] = None) -> Tuple[str, str, int, Decimal]:
     """
     Genera archivo Excel con las facturas
 
+    Las filas se escriben a medida que llegan (modo de solo escritura de openpyxl),
+    así que se puede pasar directamente el generador de la base de datos sin
+    cargar todas las facturas en memoria.
+
     Args:
-        facturas: Lista de tuplas con datos de facturas
+        facturas: Facturas (fecha, nit, nombre, serie, numero, tipo_gasto y monto) en orden
+        nombre_usuario: Nombre que se escribe en la plantilla
+        periodo_texto: Período del reporte (por defecto el mes actual)
+        user_id: Usuario que exporta (va en el nombre del archivo en disco)
 
     Returns:
-        tuple: (filepath, filename) del archivo generado
+        tuple: (filepath, filename, cantidad de facturas, monto total). filepath es un
+        archivo nuevo en cada llamada; quien lo pide lo borra después de enviarlo.
+        filename es el nombre con que se entrega al usuario.
     """
     try:
-        if not facturas:
-            logger.warning("No hay facturas para exportar")
-            raise ValueError("No hay facturas para exportar")
-
-        # Crear DataFrame
-        df = pd.DataFrame(facturas, columns=EXCEL_CONFIG['columns'])
-
         # Crear nombre de archivo
         mes_actual = datetime.now().month
         anio_actual = datetime.now().year
-        mes_nombre = datetime.now().strftime('%B')
+        mes_texto = periodo_texto or obtener_nombre_mes(mes_actual)
 
         filename = f'viaticos_{mes_actual}_{anio_actual}.xlsx'
-        filepath = os.path.join(FACTURAS_FOLDER, filename)
-
-        logger.info(f"Generando Excel: {filepath}")
-
-        # Crear Excel con formato
-        with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-            # Escribir DataFrame empezando en fila 7
-            df.to_excel(writer, sheet_name='Sheet1',
-                       startrow=EXCEL_CONFIG['data_start_row'] - 1,
-                       index=False)
 
-            # Obtener workbook y sheet
-            workbook = writer.book
-            sheet = writer.sheets['Sheet1']
+        # Verificar que haya filas antes de crear el libro
+        facturas = iter(facturas)
+        primera = next(facturas, None)
+        if primera is None:
+            logger.warning("No hay facturas para exportar")
+            raise ValueError("No hay facturas para exportar")
 
-            # Agregar encabezados de la plantilla
-            _agregar_encabezados(sheet, mes_nombre)
+        # Los libros se generan en hilos: cada exportación escribe su propio archivo para que
+        # dos usuarios exportando a la vez no se pisen el archivo mientras se sube
+        os.makedirs(FACTURAS_FOLDER, exist_ok=True)
+        descriptor, filepath = tempfile.mkstemp(prefix=f'viaticos_{user_id or 0}_{mes_actual}_{anio_actual}_',
+                                                suffix='.xlsx', dir=FACTURAS_FOLDER)
+        # Desde aquí cualquier error borra el archivo: quien llama solo recibe rutas completas
+        try:
+            os.close(descriptor)
+            logger.info(f"Generando Excel: {filepath}")
 
-            # Formatear headers
-            _formatear_headers(sheet)
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet('Sheet1')
 
-            # Ajustar anchos de columna
+            # En modo de solo escritura el formato de columnas va antes que las filas
             _ajustar_anchos(sheet)
-
-            # Agregar numeración
-            _agregar_numeracion(sheet, len(df))
-
-        logger.info(f"Excel generado exitosamente: {filename}")
-        return filepath, filename
+            for fila in _filas_encabezado(mes_texto, nombre_usuario):
+                sheet.append(fila)
+            sheet.append(_fila_headers(sheet))
+
+            total = Decimal('0.00')
+            for cantidad, factura in enumerate(chain([primera], facturas), start=1):
+                # Las fechas se guardan en ISO y se muestran como DD/MM/AAAA; la columna A numera las filas
+                sheet.append([cantidad, formatear_fecha(factura.fecha), factura.nit_proveedor,
+                              factura.nombre_proveedor, factura.serie, factura.numero,
+                              factura.tipo_gasto, factura.monto])
+                total += factura.monto or 0
+
+            workbook.save(filepath)
+        except Exception:
+            os.remove(filepath)
+            raise
+
+        logger.info(f"Excel generado exitosamente: {filename} ({cantidad} facturas)")
+        return filepath, filename, cantidad, total
 
     except Exception as e:
         logger.error(f"Error al generar Excel: {type(e).__name__} - {str(e)}", exc_info=True)
         raise
 
 
-def _agregar_encabezados(sheet, mes_nombre: str):
-    """Agregar encabezados de la plantilla"""
-    sheet['G2'] = 'PROYECTO :'
-    sheet['G3'] = 'NOMBRE SUPERVISOR'
-    sheet['G4'] = 'CODIGO MAESTRO'
-    sheet['G5'] = 'PUESTO'
-    sheet['H5'] = 'SUPERVISOR JR'
-    sheet['G6'] = 'MES'
-    sheet['H6'] = mes_nombre.upper()
-    sheet['I6'] = 'FECHA'
-    sheet['J6'] = datetime.now().strftime('%Y-%m-%d')
+def _filas_encabezado(mes_texto: str, nombre_usuario: Optional[str]) -> List[List]:
+    """Filas 1 a 6: encabezados de la plantilla en las columnas G a J"""
+    vacias = [None] * 6
+    filas = [
+        [],
+        vacias + ['PROYECTO :'],
+        vacias + ['NOMBRE SUPERVISOR', nombre_usuario],
+        vacias + ['CODIGO MAESTRO'],
+        vacias + ['PUESTO', 'SUPERVISOR JR'],
+        vacias + ['MES', mes_texto.upper(), 'FECHA', datetime.now().strftime('%Y-%m-%d')]
+    ]
+    # La fila de headers de datos es la siguiente
+    return filas[:EXCEL_CONFIG['data_start_row'] - 1]
 
 
-def _formatear_headers(sheet):
-    """Formatear fila de headers (fila 7)"""
+def _fila_headers(sheet) -> List[WriteOnlyCell]:
+    """Fila de headers (fila 7) en negrita y centrada"""
     header_font = Font(bold=True)
     header_alignment = Alignment(horizontal='center', vertical='center')
 
-    for cell in sheet[EXCEL_CONFIG['data_start_row']]:
+    celdas = []
+    for titulo in ['No.'] + EXCEL_CONFIG['columns']:
+        cell = WriteOnlyCell(sheet, value=titulo)
         cell.font = header_font
         cell.alignment = header_alignment
+        celdas.append(cell)
+    return celdas
 
 
 def _ajustar_anchos(sheet):
     """Ajustar anchos de columna"""
     for col, width in EXCEL_CONFIG['column_widths'].items():
         sheet.column_dimensions[col].width = width
-
-
-def _agregar_numeracion(sheet, num_filas: int):
-    """Agregar numeración en columna A"""
-    start_row = EXCEL_CONFIG['data_start_row'] + 1
-    for idx, row in enumerate(range(start_row, start_row + num_filas), start=1):
-        sheet[f'A{row}'] = idx
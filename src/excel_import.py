@@ -0,0 +1,192 @@
+"""
+Módulo de Importación de Facturas
+Lee facturas desde la plantilla de Excel (o un CSV con las mismas columnas)
+"""
+
+import os
+import re
+import csv
+import logging
+import unicodedata
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterator, List, Optional, Sequence, Tuple
+from zipfile import BadZipFile
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from .config import EXCEL_CONFIG, IMPORTACION_CONFIG, TIPOS_GASTO
+from .modelos import Factura
+from .utils import normalizar_fecha, validar_monto
+
+logger = logging.getLogger(__name__)
+
+# Atributo de Factura que corresponde a cada columna de EXCEL_CONFIG['columns'], en el mismo orden
+_CAMPOS = ('fecha', 'nit_proveedor', 'nombre_proveedor', 'serie', 'numero', 'tipo_gasto', 'monto')
+
+
+def _sin_acentos(texto: str) -> str:
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
+
+
+def _clave(valor) -> str:
+    """Texto de un header o de un tipo de gasto para compararlo (mayúsculas, sin acentos ni espacios de más)"""
+    return ' '.join(_sin_acentos(str(valor)).upper().split()) if valor is not None else ''
+
+
+_TIPOS = {_clave(tipo): tipo for tipo in TIPOS_GASTO}
+
+
+def _texto(valor) -> str:
+    """Valor de una celda como texto; los números enteros leídos como float pierden el '.0'"""
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def _fecha(valor) -> str:
+    if isinstance(valor, (datetime, date)):
+        return valor.strftime('%Y-%m-%d')
+    texto = _texto(valor)
+    if not texto:
+        raise ValueError("falta la fecha")
+    try:
+        return normalizar_fecha(texto.split(' ')[0])
+    except ValueError:
+        raise ValueError(f"fecha inválida '{texto}'")
+
+
+# Montos escritos como texto. Sin separador de miles (12.50, 12,50) o con miles y decimales
+# en el formato de Guatemala y España (1.234,50) o en el de EE. UU. (1,234.50)
+_MONTO_SIMPLE = re.compile(r'\d+([.,](\d{1,2}|\d{4,}))?')
+_MONTO_PUNTO_MILES = re.compile(r'\d{1,3}(\.\d{3})+(,\d{1,2})?')
+_MONTO_COMA_MILES = re.compile(r'\d{1,3}(,\d{3})+(\.\d{1,2})?')
+# Un solo separador seguido de tres dígitos: 1.234 o 1,234 pueden ser miles o decimales
+_MONTO_AMBIGUO = re.compile(r'\d{1,3}[.,]\d{3}')
+
+
+def _monto(valor) -> Decimal:
+    texto = _texto(valor)
+    if not texto:
+        raise ValueError("falta el monto")
+
+    # Las celdas numéricas del .xlsx no tienen separadores de miles
+    if not isinstance(valor, (int, float, Decimal)) or isinstance(valor, bool):
+        cifra = re.sub(r'^Q\s*', '', texto)
+        if _MONTO_AMBIGUO.fullmatch(cifra):
+            raise ValueError(f"monto ambiguo '{texto}': escríbelo como 1234.50 o 1.234,50")
+        if _MONTO_SIMPLE.fullmatch(cifra):
+            cifra = cifra.replace(',', '.')
+        elif _MONTO_PUNTO_MILES.fullmatch(cifra):
+            cifra = cifra.replace('.', '').replace(',', '.')
+        elif _MONTO_COMA_MILES.fullmatch(cifra):
+            cifra = cifra.replace(',', '')
+        else:
+            raise ValueError(f"monto inválido '{texto}'")
+    else:
+        cifra = texto
+
+    try:
+        return validar_monto(cifra)
+    except ValueError:
+        raise ValueError(f"monto inválido '{texto}'")
+
+
+def _tipo_gasto(valor) -> str:
+    tipo = _TIPOS.get(_clave(valor))
+    if tipo is None:
+        raise ValueError(f"tipo de gasto '{_texto(valor)}' no es {' ni '.join(TIPOS_GASTO)}")
+    return tipo
+
+
+def _leer_filas(ruta: str) -> Iterator[Tuple[int, Sequence]]:
+    """Filas del archivo con su número (desde 1); el .xlsx se lee en modo de solo lectura"""
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == '.xlsx':
+        workbook = load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            yield from enumerate(workbook.active.iter_rows(values_only=True), start=1)
+        finally:
+            workbook.close()
+    elif extension == '.csv':
+        with open(ruta, newline='', encoding='utf-8-sig') as archivo:
+            muestra = archivo.read(4096)
+            archivo.seek(0)
+            try:
+                dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+            except csv.Error:
+                dialecto = csv.excel
+            yield from enumerate(csv.reader(archivo, dialecto), start=1)
+    else:
+        raise ValueError(f"Formato no soportado: usa {' o '.join(IMPORTACION_CONFIG['extensiones'])}")
+
+
+def _columnas(fila: Sequence) -> Optional[List[int]]:
+    """Posición de cada columna de la plantilla si la fila es la de headers"""
+    posiciones = {_clave(valor): i for i, valor in enumerate(fila)}
+    indices = [posiciones.get(_clave(titulo)) for titulo in EXCEL_CONFIG['columns']]
+    return None if None in indices else indices
+
+
+def leer_facturas(ruta: str, maximo: int = None) -> Tuple[List[Tuple[int, Factura]], List[Tuple[int, str]]]:
+    """
+    Lee y valida las facturas de un archivo .xlsx o .csv
+
+    La fila de headers debe tener las columnas de EXCEL_CONFIG['columns'] (en cualquier
+    orden; las demás columnas, como la numeración 'No.', se ignoran). Sirve tanto la
+    plantilla como un archivo generado por la exportación.
+
+    Args:
+        ruta: Archivo a leer
+        maximo: Facturas máximas (por defecto IMPORTACION_CONFIG['maximo_filas'])
+
+    Returns:
+        tuple: (facturas válidas como (número de fila, Factura), rechazadas como (número de fila, motivo))
+
+    Raises:
+        ValueError: Si el formato no es soportado, no hay fila de headers o hay demasiadas filas
+    """
+    maximo = maximo or IMPORTACION_CONFIG['maximo_filas']
+    facturas = []
+    rechazadas = []
+    indices = None
+
+    try:
+        for numero_fila, fila in _leer_filas(ruta):
+            if indices is None:
+                indices = _columnas(fila)
+                if indices is None and numero_fila >= IMPORTACION_CONFIG['filas_encabezado']:
+                    break
+                continue
+
+            valores = [fila[i] if i < len(fila) else None for i in indices]
+            if not any(_texto(valor) for valor in valores):
+                continue
+
+            if len(facturas) + len(rechazadas) >= maximo:
+                raise ValueError(f"El archivo tiene más de {maximo} facturas")
+
+            datos = dict(zip(_CAMPOS, valores))
+            try:
+                facturas.append((numero_fila, Factura(
+                    fecha=_fecha(datos['fecha']),
+                    nit_proveedor=_texto(datos['nit_proveedor']),
+                    nombre_proveedor=_texto(datos['nombre_proveedor']),
+                    serie=_texto(datos['serie']),
+                    numero=_texto(datos['numero']),
+                    tipo_gasto=_tipo_gasto(datos['tipo_gasto']),
+                    monto=_monto(datos['monto'])
+                )))
+            except ValueError as e:
+                rechazadas.append((numero_fila, str(e)))
+    except (OSError, UnicodeDecodeError, BadZipFile, InvalidFileException) as e:
+        logger.error(f"Error al leer {ruta}: {e}")
+        raise ValueError("No se pudo leer el archivo")
+
+    if indices is None:
+        raise ValueError(f"No encontré la fila de headers ({', '.join(EXCEL_CONFIG['columns'])})")
+
+    logger.info(f"Archivo {os.path.basename(ruta)} leído: {len(facturas)} facturas válidas, "
+                f"{len(rechazadas)} rechazadas")
+    return facturas, rechazadas
@@ -0,0 +1,262 @@
+"""
+Módulo de Instrumentación de Consultas
+Mide cada sentencia que ejecuta la base de datos: duración, filas y espera de lock,
+con histograma en memoria por consulta y registro de consultas lentas
+"""
+
+import re
+import time
+import bisect
+import logging
+import sqlite3
+import threading
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores (ms) de los intervalos del histograma; el último intervalo no tiene límite
+LIMITES_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Sentencias a las que se les puede pedir EXPLAIN QUERY PLAN
+_EXPLICABLE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+
+# Paso del plan que recorre una tabla completa (sin índice)
+_ESCANEO_COMPLETO = re.compile(r'^SCAN (\w+)$')
+
+
+def es_escaneo_completo(detalle: str) -> bool:
+    """Indica si un paso de EXPLAIN QUERY PLAN es un recorrido completo de una tabla"""
+    return _ESCANEO_COMPLETO.match(detalle.strip()) is not None
+
+
+def _sql_corto(sql: str) -> str:
+    return ' '.join(sql.split())
+
+
+class MetricasConsultas:
+    """Histograma de duraciones por consulta, consultas lentas y planes capturados"""
+
+    def __init__(self, umbral_lento_ms: float, explicar_lentas: bool = False, maximo_lentas: int = 100):
+        self.umbral_lento_ms = umbral_lento_ms
+        self.explicar_lentas = explicar_lentas
+        # Captura el plan de todas las sentencias (para verificar planes, no para producción)
+        self.capturar_planes = False
+        self._lock = threading.Lock()
+        self._por_consulta: Dict[str, dict] = {}
+        self._lentas = deque(maxlen=maximo_lentas)
+        self._planes: Dict[Tuple[str, str], List[str]] = {}
+
+    def necesita_plan(self, duracion_ms: float) -> bool:
+        return self.capturar_planes or (self.explicar_lentas and duracion_ms >= self.umbral_lento_ms)
+
+    def registrar(self, nombre: str, sql: str, duracion_ms: float, filas: int,
+                  espera_lock_ms: float, plan: Optional[List[str]] = None):
+        """Agrega una sentencia ejecutada a las métricas de su consulta"""
+        with self._lock:
+            datos = self._por_consulta.get(nombre)
+            if datos is None:
+                datos = self._por_consulta[nombre] = {
+                    'llamadas': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'filas': 0,
+                    'espera_lock_ms': 0.0, 'histograma': [0] * (len(LIMITES_MS) + 1)
+                }
+            datos['llamadas'] += 1
+            datos['total_ms'] += duracion_ms
+            datos['max_ms'] = max(datos['max_ms'], duracion_ms)
+            datos['filas'] += filas
+            datos['espera_lock_ms'] += espera_lock_ms
+            datos['histograma'][bisect.bisect_left(LIMITES_MS, duracion_ms)] += 1
+
+            if plan is not None:
+                self._planes[(nombre, _sql_corto(sql))] = plan
+
+            lenta = duracion_ms + espera_lock_ms >= self.umbral_lento_ms
+            if lenta:
+                self._lentas.append({
+                    'consulta': nombre, 'sql': _sql_corto(sql), 'duracion_ms': round(duracion_ms, 3),
+                    'espera_lock_ms': round(espera_lock_ms, 3), 'filas': filas, 'plan': plan,
+                    'momento': time.strftime('%Y-%m-%d %H:%M:%S')
+                })
+
+        if lenta:
+            mensaje = (f"Consulta lenta {nombre}: {duracion_ms:.1f} ms, {filas} filas, "
+                       f"espera de lock {espera_lock_ms:.1f} ms | {_sql_corto(sql)[:200]}")
+            if plan:
+                mensaje += f" | plan: {'; '.join(plan)}"
+            logger.warning(mensaje)
+
+    def resumen(self) -> Dict[str, dict]:
+        """
+        Métricas por consulta, ordenadas por tiempo total
+
+        Returns:
+            dict: nombre -> llamadas, total_ms, promedio_ms, p50_ms, p95_ms, max_ms,
+                  filas, espera_lock_ms e histograma {'<=1ms': n, ...}
+        """
+        with self._lock:
+            copia = {nombre: dict(datos, histograma=list(datos['histograma']))
+                     for nombre, datos in self._por_consulta.items()}
+
+        resultado = {}
+        for nombre, datos in sorted(copia.items(), key=lambda x: x[1]['total_ms'], reverse=True):
+            histograma = datos['histograma']
+            resultado[nombre] = {
+                'llamadas': datos['llamadas'],
+                'total_ms': round(datos['total_ms'], 3),
+                'promedio_ms': round(datos['total_ms'] / datos['llamadas'], 3),
+                'p50_ms': self._percentil(histograma, datos['llamadas'], 0.50, datos['max_ms']),
+                'p95_ms': self._percentil(histograma, datos['llamadas'], 0.95, datos['max_ms']),
+                'max_ms': round(datos['max_ms'], 3),
+                'filas': datos['filas'],
+                'espera_lock_ms': round(datos['espera_lock_ms'], 3),
+                'histograma': {
+                    (f"<={LIMITES_MS[i]:g}ms" if i < len(LIMITES_MS) else f">{LIMITES_MS[-1]:g}ms"): n
+                    for i, n in enumerate(histograma) if n
+                }
+            }
+        return resultado
+
+    @staticmethod
+    def _percentil(histograma: List[int], total: int, fraccion: float, maximo: float) -> float:
+        """
+        Percentil aproximado: límite superior del intervalo que lo contiene
+
+        Nunca pasa del máximo observado (con una sola muestra en el intervalo 1-2.5 ms,
+        el límite 2.5 ms sería mayor que la única duración registrada).
+        """
+        acumulado = 0
+        for i, n in enumerate(histograma):
+            acumulado += n
+            if acumulado >= total * fraccion:
+                limite = LIMITES_MS[i] if i < len(LIMITES_MS) else maximo
+                return round(min(limite, maximo), 3)
+        return round(maximo, 3)
+
+    def consultas_lentas(self) -> List[dict]:
+        """Últimas consultas que superaron el umbral, de la más antigua a la más reciente"""
+        with self._lock:
+            return list(self._lentas)
+
+    def planes(self) -> Dict[Tuple[str, str], List[str]]:
+        """Planes capturados: (consulta, sql) -> pasos de EXPLAIN QUERY PLAN"""
+        with self._lock:
+            return dict(self._planes)
+
+    def reiniciar(self):
+        with self._lock:
+            self._por_consulta.clear()
+            self._lentas.clear()
+            self._planes.clear()
+
+
+class CursorMedido:
+    """
+    Envoltura de un cursor que mide cada sentencia
+
+    La duración de una sentencia incluye su ejecución y la lectura de sus filas;
+    se registra al ejecutar la siguiente sentencia o al terminar el bloque.
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor, nombre: str, metricas: MetricasConsultas,
+                 espera_lock_ms: float = 0.0):
+        self._cursor = cursor
+        self._nombre = nombre
+        self._metricas = metricas
+        self._espera_lock_ms = espera_lock_ms
+        self._sql = None
+
+    def _medir(self, funcion, *args):
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args)
+        finally:
+            self._duracion += time.perf_counter() - inicio
+
+    def _iniciar(self, sql: str, params: Any, lote: bool):
+        self.terminar()
+        self._sql, self._params, self._lote = sql, params, lote
+        self._duracion = 0.0
+        self._filas = 0
+
+    def execute(self, sql: str, params: Any = ()) -> 'CursorMedido':
+        self._iniciar(sql, params, False)
+        self._medir(self._cursor.execute, sql, params)
+        return self
+
+    def executemany(self, sql: str, secuencia) -> 'CursorMedido':
+        self._iniciar(sql, None, True)
+        self._medir(self._cursor.executemany, sql, secuencia)
+        return self
+
+    def fetchone(self):
+        fila = self._medir(self._cursor.fetchone)
+        if fila is not None:
+            self._filas += 1
+        return fila
+
+    def fetchmany(self, cantidad: int = None):
+        filas = self._medir(self._cursor.fetchmany, cantidad or self._cursor.arraysize)
+        self._filas += len(filas)
+        return filas
+
+    def fetchall(self):
+        filas = self._medir(self._cursor.fetchall)
+        self._filas += len(filas)
+        return filas
+
+    def __iter__(self) -> Iterator:
+        while True:
+            fila = self.fetchone()
+            if fila is None:
+                return
+            yield fila
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self) -> Optional[int]:
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        return self._cursor.connection
+
+    @property
+    def row_factory(self):
+        return self._cursor.row_factory
+
+    @row_factory.setter
+    def row_factory(self, funcion):
+        self._cursor.row_factory = funcion
+
+    def _explicar(self) -> Optional[List[str]]:
+        if self._lote or not _EXPLICABLE.match(self._sql):
+            return None
+        try:
+            filas = self._cursor.connection.execute(f'EXPLAIN QUERY PLAN {self._sql}', self._params).fetchall()
+            return [fila[-1] for fila in filas]
+        except sqlite3.Error as e:
+            logger.debug(f"No se pudo obtener el plan de {self._nombre}: {e}")
+            return None
+
+    def terminar(self):
+        """Registra la sentencia pendiente"""
+        if self._sql is None:
+            return
+        duracion_ms = self._duracion * 1000
+        filas = self._filas if self._cursor.description is not None else max(self._cursor.rowcount, 0)
+        plan = self._explicar() if self._metricas.necesita_plan(duracion_ms) else None
+        self._metricas.registrar(self._nombre, self._sql, duracion_ms, filas, self._espera_lock_ms, plan)
+        # La espera por el lock se cuenta una sola vez por bloque
+        self._espera_lock_ms = 0.0
+        self._sql = None
+
+    def close(self):
+        self.terminar()
+        self._cursor.close()
@@ -0,0 +1,457 @@
+"""
+Módulo de Migraciones del Esquema
+Migraciones numeradas que se aplican en orden, cada una en su propia transacción,
+llevando la versión del esquema en PRAGMA user_version
+"""
+
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Callable, List, Tuple
+from .utils import normalizar_fecha, normalizar_nit
+
+logger = logging.getLogger(__name__)
+
+# Registro de migraciones: (versión, descripción, función (cursor) -> None), en orden de versión
+MIGRACIONES: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = []
+
+
+def migracion(version: int, descripcion: str):
+    """
+    Decorador para registrar una migración del esquema
+
+    Args:
+        version: Número de versión que alcanza el esquema al aplicarla (consecutivo)
+        descripcion: Texto corto que se registra en el log al aplicarla
+    """
+    def decorador(funcion: Callable[[sqlite3.Cursor], None]):
+        esperada = len(MIGRACIONES) + 1
+        if version != esperada:
+            raise ValueError(f"Migración {version} fuera de orden (se esperaba la {esperada})")
+        MIGRACIONES.append((version, descripcion, funcion))
+        return funcion
+    return decorador
+
+
+def version_esquema(conn: sqlite3.Connection) -> int:
+    """Versión actual del esquema guardada en la base de datos"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def aplicar_migraciones(conn: sqlite3.Connection) -> int:
+    """
+    Aplica las migraciones pendientes sobre una conexión
+
+    Cuando el esquema ya está al día solo se lee PRAGMA user_version.
+    Cada migración corre en una transacción junto con el cambio de versión,
+    así que un fallo deja la base de datos en la última versión completa.
+
+    Args:
+        conn: Conexión de escritura (sin transacción abierta)
+
+    Returns:
+        int: Versión del esquema después de migrar
+    """
+    version = version_esquema(conn)
+    ultima = MIGRACIONES[-1][0] if MIGRACIONES else 0
+
+    if version >= ultima:
+        if version > ultima:
+            logger.warning(f"El esquema (versión {version}) es más nuevo que esta versión del bot ({ultima})")
+        logger.debug(f"Esquema de base de datos al día (versión {version})")
+        return version
+
+    for numero, descripcion, funcion in MIGRACIONES:
+        if numero <= version:
+            continue
+
+        c = conn.cursor()
+        try:
+            c.execute('BEGIN IMMEDIATE')
+            # Otro proceso pudo haber migrado mientras se esperaba el lock
+            if version_esquema(conn) >= numero:
+                conn.rollback()
+                version = numero
+                continue
+
+            logger.info(f"Aplicando migración {numero}: {descripcion}")
+            funcion(c)
+            c.execute(f'PRAGMA user_version = {numero}')
+            conn.commit()
+            version = numero
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error en migración {numero} ({descripcion}): {e}")
+            raise
+        finally:
+            c.close()
+
+    logger.info(f"Esquema de base de datos migrado a la versión {version}")
+    return version
+
+
+# Llave de resumen_mensual calculada desde una fila de facturas (NEW u OLD en los triggers).
+# Las fechas vacías o no reconocidas quedan en anio = 0, mes = 0
+def _llave_resumen(fila: str) -> str:
+    return (f"{fila}.user_id, "
+            f"COALESCE(CAST(substr({fila}.fecha, 1, 4) AS INTEGER), 0), "
+            f"COALESCE(CAST(substr({fila}.fecha, 6, 2) AS INTEGER), 0), "
+            f"COALESCE({fila}.tipo_gasto, '')")
+
+
+# Cuerpos de los triggers de resumen_mensual. Reciben las columnas de monto de facturas
+# y de total del resumen porque las migraciones anteriores a la 9 usan las de entonces
+# (monto REAL, total REAL) y desde la 9 son enteras en centavos
+def _resumen_sumar(monto: str, total: str) -> str:
+    return f"""
+    INSERT INTO resumen_mensual (user_id, anio, mes, tipo_gasto, {total}, cantidad)
+    VALUES ({_llave_resumen('NEW')}, COALESCE(NEW.{monto}, 0), 1)
+    ON CONFLICT(user_id, anio, mes, tipo_gasto) DO UPDATE
+    SET {total} = {total} + excluded.{total}, cantidad = cantidad + 1;
+"""
+
+
+def _resumen_restar(monto: str, total: str) -> str:
+    return f"""
+    UPDATE resumen_mensual SET {total} = {total} - COALESCE(OLD.{monto}, 0), cantidad = cantidad - 1
+    WHERE (user_id, anio, mes, tipo_gasto) = ({_llave_resumen('OLD')});
+    DELETE FROM resumen_mensual
+    WHERE (user_id, anio, mes, tipo_gasto) = ({_llave_resumen('OLD')}) AND cantidad <= 0;
+"""
+
+
+def _crear_triggers_resumen(c: sqlite3.Cursor, monto: str, total: str):
+    sumar, restar = _resumen_sumar(monto, total), _resumen_restar(monto, total)
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_facturas_resumen_insert
+                  AFTER INSERT ON facturas
+                  BEGIN {sumar} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_facturas_resumen_delete
+                  AFTER DELETE ON facturas
+                  BEGIN {restar} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_facturas_resumen_update
+                  AFTER UPDATE OF user_id, fecha, tipo_gasto, {monto} ON facturas
+                  BEGIN {restar} {sumar} END''')
+
+
+def sql_agrupar_resumen(tabla: str, monto: str = 'monto_centavos') -> str:
+    """Consulta de los totales (user_id, anio, mes, tipo_gasto, total en centavos, cantidad) de una tabla de facturas"""
+    return f'''SELECT user_id,
+                     COALESCE(CAST(substr(fecha, 1, 4) AS INTEGER), 0),
+                     COALESCE(CAST(substr(fecha, 6, 2) AS INTEGER), 0),
+                     COALESCE(tipo_gasto, ''),
+                     SUM(COALESCE({monto}, 0)),
+                     COUNT(*)
+              FROM {tabla}
+              GROUP BY 1, 2, 3, 4'''
+
+
+def _sql_reconstruir_resumen(monto: str, total: str) -> str:
+    return (f'INSERT INTO resumen_mensual (user_id, anio, mes, tipo_gasto, {total}, cantidad) '
+            + sql_agrupar_resumen('facturas', monto))
+
+
+# Recalcula resumen_mensual completo desde facturas (después de vaciarla)
+SQL_RECONSTRUIR_RESUMEN = _sql_reconstruir_resumen('monto_centavos', 'total_centavos')
+
+
+@migracion(1, 'tablas de usuarios, facturas y proveedores')
+def _tablas_base(c: sqlite3.Cursor):
+    c.execute('''CREATE TABLE IF NOT EXISTS usuarios
+                 (user_id INTEGER PRIMARY KEY,
+                  nombre TEXT NOT NULL,
+                  telefono TEXT,
+                  created_at TEXT,
+                  updated_at TEXT)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS facturas
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  user_id INTEGER NOT NULL,
+                  fecha TEXT,
+                  nit_proveedor TEXT,
+                  nombre_proveedor TEXT,
+                  serie TEXT,
+                  numero TEXT,
+                  tipo_gasto TEXT,
+                  monto REAL,
+                  foto_path TEXT,
+                  created_at TEXT,
+                  FOREIGN KEY (user_id) REFERENCES usuarios (user_id))''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS proveedores
+                 (nit TEXT PRIMARY KEY,
+                  nombre TEXT NOT NULL,
+                  created_at TEXT,
+                  updated_at TEXT)''')
+
+
+@migracion(2, 'facturas multi-usuario')
+def _facturas_multi_usuario(c: sqlite3.Cursor):
+    # Bases de datos de la versión de un solo usuario: las facturas quedan del usuario 0
+    c.execute("PRAGMA table_info(facturas)")
+    columns = [col[1] for col in c.fetchall()]
+    if 'user_id' in columns:
+        return
+
+    c.execute('ALTER TABLE facturas ADD COLUMN user_id INTEGER')
+    c.execute('UPDATE facturas SET user_id = 0 WHERE user_id IS NULL')
+
+    c.execute("SELECT COUNT(*) FROM usuarios WHERE user_id = 0")
+    if c.fetchone()[0] == 0:
+        c.execute('''INSERT INTO usuarios (user_id, nombre, created_at)
+                     VALUES (0, 'Usuario Legacy', ?)''',
+                  (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+
+
+@migracion(3, 'fechas de facturas en formato ISO')
+def _fechas_iso(c: sqlite3.Cursor):
+    c.execute('''SELECT id, fecha FROM facturas
+                 WHERE fecha IS NOT NULL
+                   AND fecha NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]' ''')
+    actualizaciones = []
+    for factura_id, fecha in c.fetchall():
+        try:
+            actualizaciones.append((normalizar_fecha(fecha), factura_id))
+        except ValueError:
+            logger.warning(f"Factura #{factura_id} tiene una fecha no reconocida: '{fecha}'")
+
+    c.executemany('UPDATE facturas SET fecha = ? WHERE id = ?', actualizaciones)
+    if actualizaciones:
+        logger.info(f"Fechas normalizadas: {len(actualizaciones)}")
+
+
+@migracion(4, 'índices de facturas por usuario')
+def _indices_facturas(c: sqlite3.Cursor):
+    # Un solo índice compuesto cubre las consultas por usuario y por mes
+    c.execute('DROP INDEX IF EXISTS idx_facturas_user')
+    c.execute('DROP INDEX IF EXISTS idx_facturas_fecha')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_facturas_user_fecha
+                 ON facturas(user_id, fecha, tipo_gasto, monto)''')
+    # Paginación por llave (user_id, id) en la lista de facturas
+    c.execute('CREATE INDEX IF NOT EXISTS idx_facturas_user_id ON facturas(user_id, id)')
+
+
+@migracion(5, 'resumen mensual mantenido por triggers')
+def _resumen_mensual(c: sqlite3.Cursor):
+    c.execute('''CREATE TABLE IF NOT EXISTS resumen_mensual
+                 (user_id INTEGER NOT NULL,
+                  anio INTEGER NOT NULL,
+                  mes INTEGER NOT NULL,
+                  tipo_gasto TEXT NOT NULL,
+                  total REAL NOT NULL,
+                  cantidad INTEGER NOT NULL,
+                  PRIMARY KEY (user_id, anio, mes, tipo_gasto)) WITHOUT ROWID''')
+
+    _crear_triggers_resumen(c, 'monto', 'total')
+
+    c.execute('DELETE FROM resumen_mensual')
+    c.execute(_sql_reconstruir_resumen('monto', 'total'))
+
+
+@migracion(6, 'directorio de proveedores desde facturas')
+def _directorio_proveedores(c: sqlite3.Cursor):
+    # Para cada NIT se toma el nombre confirmado con más facturas
+    c.execute('''SELECT nit_proveedor, nombre_proveedor, COUNT(*) AS cantidad, MAX(id) AS ultimo
+                 FROM facturas
+                 WHERE nit_proveedor IS NOT NULL AND nit_proveedor != ''
+                   AND nombre_proveedor IS NOT NULL AND nombre_proveedor != ''
+                 GROUP BY nit_proveedor, nombre_proveedor
+                 ORDER BY cantidad DESC, ultimo DESC''')
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    directorio = {}
+    for nit, nombre, _, _ in c.fetchall():
+        directorio.setdefault(normalizar_nit(nit), nombre)
+
+    c.executemany('''INSERT OR IGNORE INTO proveedores (nit, nombre, created_at, updated_at)
+                     VALUES (?, ?, ?, ?)''',
+                  [(nit, nombre, now, now) for nit, nombre in directorio.items() if nit])
+    if directorio:
+        logger.info(f"Directorio de proveedores construido con {len(directorio)} NITs")
+
+
+# Fila de facturas_fts calculada desde una fila de facturas. El usuario se indexa como
+# un token ('u<user_id>') para acotar cada búsqueda a sus facturas dentro del índice
+def _valores_fts(fila: str) -> str:
+    return (f"{fila}.id, 'u' || {fila}.user_id, {fila}.nombre_proveedor, "
+            f"replace(replace(upper({fila}.nit_proveedor), '-', ''), ' ', ''), "
+            f"{fila}.serie, {fila}.numero")
+
+
+_FTS_INSERTAR = f"""
+    INSERT INTO facturas_fts (rowid, usuario, proveedor, nit, serie, numero)
+    VALUES ({_valores_fts('NEW')});
+"""
+
+_FTS_BORRAR = """
+    DELETE FROM facturas_fts WHERE rowid = OLD.id;
+"""
+
+
+@migracion(7, 'búsqueda de texto completo en facturas')
+def _busqueda_facturas(c: sqlite3.Cursor):
+    # Índices de prefijo de 2 y 3 caracteres para las búsquedas mientras se escribe
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS facturas_fts
+                 USING fts5(usuario, proveedor, nit, serie, numero,
+                            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')''')
+
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_facturas_fts_insert
+                  AFTER INSERT ON facturas
+                  BEGIN {_FTS_INSERTAR} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_facturas_fts_delete
+                  AFTER DELETE ON facturas
+                  BEGIN {_FTS_BORRAR} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_facturas_fts_update
+                  AFTER UPDATE OF user_id, nombre_proveedor, nit_proveedor, serie, numero ON facturas
+                  BEGIN {_FTS_BORRAR} {_FTS_INSERTAR} END''')
+
+    c.execute('DELETE FROM facturas_fts')
+    c.execute(f'''INSERT INTO facturas_fts (rowid, usuario, proveedor, nit, serie, numero)
+                  SELECT {_valores_fts('facturas')} FROM facturas''')
+
+
+@migracion(8, 'registro de archivos anuales')
+def _archivos_anuales(c: sqlite3.Cursor):
+    c.execute('''CREATE TABLE IF NOT EXISTS archivos
+                 (anio INTEGER PRIMARY KEY,
+                  ruta TEXT NOT NULL,
+                  facturas INTEGER NOT NULL,
+                  archivado_en TEXT)''')
+
+
+# Conversión de un monto REAL a centavos enteros (los montos se capturan con dos decimales)
+def _sql_centavos(columna: str) -> str:
+    return f'CAST(round({columna} * 100) AS INTEGER)'
+
+
+def actualizar_facturas_a_centavos(c: sqlite3.Cursor, esquema: str = 'main') -> bool:
+    """
+    Cambia facturas.monto (REAL) por facturas.monto_centavos (INTEGER) en un esquema
+
+    Se usa en la migración 9 y en los archivos anuales creados antes de ella.
+    No quita índices ni triggers: quien la llama debe quitar antes los que usan monto.
+
+    Returns:
+        bool: True si la tabla tenía la columna monto y se convirtió
+    """
+    c.execute(f'PRAGMA {esquema}.table_info(facturas)')
+    columnas = [col[1] for col in c.fetchall()]
+    if 'monto' not in columnas:
+        return False
+
+    c.execute(f'ALTER TABLE {esquema}.facturas ADD COLUMN monto_centavos INTEGER')
+    c.execute(f"UPDATE {esquema}.facturas SET monto_centavos = {_sql_centavos('monto')} WHERE monto IS NOT NULL")
+    c.execute(f'ALTER TABLE {esquema}.facturas DROP COLUMN monto')
+    return True
+
+
+@migracion(9, 'montos en centavos enteros')
+def _montos_en_centavos(c: sqlite3.Cursor):
+    # Los triggers del resumen y el índice de facturas usan monto: se quitan y se recrean
+    for trigger in ('insert', 'delete', 'update'):
+        c.execute(f'DROP TRIGGER IF EXISTS trg_facturas_resumen_{trigger}')
+    c.execute('DROP INDEX IF EXISTS idx_facturas_user_fecha')
+
+    actualizar_facturas_a_centavos(c)
+
+    # Los totales del resumen se convierten en su lugar: incluyen los años archivados,
+    # que ya no están en facturas
+    c.execute('ALTER TABLE resumen_mensual ADD COLUMN total_centavos INTEGER NOT NULL DEFAULT 0')
+    c.execute(f"UPDATE resumen_mensual SET total_centavos = {_sql_centavos('total')}")
+    c.execute('ALTER TABLE resumen_mensual DROP COLUMN total')
+
+    # Índice que cubre los totales por usuario y mes: se leen sin tocar la tabla
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_facturas_user_fecha
+                 ON facturas(user_id, fecha, tipo_gasto, monto_centavos)''')
+    _crear_triggers_resumen(c, 'monto_centavos', 'total_centavos')
+
+
+# Llave normalizada de una factura para detectar duplicados: NIT del emisor sin guiones
+# ni espacios, serie en mayúsculas sin espacios y número sin espacios ni ceros a la izquierda.
+# Recibe columnas o marcadores '?'; las consultas deben usar las mismas expresiones que el índice
+def sql_llave_duplicado(nit: str = 'nit_proveedor', serie: str = 'serie', numero: str = 'numero') -> List[str]:
+    return [f"replace(replace(upper({nit}), '-', ''), ' ', '')",
+            f"replace(upper({serie}), ' ', '')",
+            f"ltrim(replace({numero}, ' ', ''), '0')"]
+
+
+# Facturas que participan en la detección: con los tres datos y no guardadas a propósito como duplicado
+SQL_FACTURA_IDENTIFICABLE = ("duplicado_de IS NULL AND nit_proveedor != '' "
+                             "AND serie != '' AND numero != ''")
+
+
+@migracion(10, 'índice único de facturas por NIT, serie y número')
+def _facturas_unicas(c: sqlite3.Cursor):
+    # duplicado_de marca las facturas guardadas a propósito aunque repitan otra (id de la original)
+    c.execute('ALTER TABLE facturas ADD COLUMN duplicado_de INTEGER')
+
+    # Los duplicados que ya existen quedan marcados contra la primera factura de su grupo
+    llave = ', '.join(sql_llave_duplicado())
+    c.execute(f'''SELECT id, primera FROM
+                    (SELECT id, MIN(id) OVER (PARTITION BY {llave}) AS primera
+                     FROM facturas WHERE {SQL_FACTURA_IDENTIFICABLE})
+                  WHERE id != primera''')
+    duplicados = [(primera, factura_id) for factura_id, primera in c.fetchall()]
+    c.executemany('UPDATE facturas SET duplicado_de = ? WHERE id = ?', duplicados)
+    if duplicados:
+        logger.warning(f"Facturas duplicadas existentes marcadas: {len(duplicados)} "
+                       f"(ver python -m src.admin duplicados)")
+
+    c.execute(f'''CREATE UNIQUE INDEX IF NOT EXISTS idx_facturas_unica
+                  ON facturas({llave}) WHERE {SQL_FACTURA_IDENTIFICABLE}''')
+
+
+# Versión de los datos de un usuario en un mes: sube con cada factura insertada, borrada o
+# modificada en ese mes. Nunca baja, así que la suma de todos los meses sirve de versión
+# para "todas las facturas". La caché de exportaciones la compara para reutilizar un archivo
+def _version_subir(fila: str) -> str:
+    return f"""
+    INSERT INTO versiones_mes (user_id, anio, mes, version)
+    VALUES ({fila}.user_id,
+            COALESCE(CAST(substr({fila}.fecha, 1, 4) AS INTEGER), 0),
+            COALESCE(CAST(substr({fila}.fecha, 6, 2) AS INTEGER), 0), 1)
+    ON CONFLICT(user_id, anio, mes) DO UPDATE SET version = version + 1;
+"""
+
+
+@migracion(11, 'versión de datos por usuario y mes y caché de exportaciones')
+def _cache_exportaciones(c: sqlite3.Cursor):
+    c.execute('''CREATE TABLE IF NOT EXISTS versiones_mes
+                 (user_id INTEGER NOT NULL,
+                  anio INTEGER NOT NULL,
+                  mes INTEGER NOT NULL,
+                  version INTEGER NOT NULL,
+                  PRIMARY KEY (user_id, anio, mes)) WITHOUT ROWID''')
+
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_facturas_version_insert
+                  AFTER INSERT ON facturas
+                  BEGIN {_version_subir('NEW')} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_facturas_version_delete
+                  AFTER DELETE ON facturas
+                  BEGIN {_version_subir('OLD')} END''')
+    # Cualquier columna cambia el contenido del Excel; si cambia la fecha suben los dos meses
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_facturas_version_update
+                  AFTER UPDATE ON facturas
+                  BEGIN {_version_subir('OLD')} {_version_subir('NEW')} END''')
+
+    # Último Excel enviado por usuario y período ('AAAA-MM' o 'todas'): file_id de Telegram
+    # y datos del mensaje, válido mientras la versión de los datos no cambie
+    c.execute('''CREATE TABLE IF NOT EXISTS exportaciones
+                 (user_id INTEGER NOT NULL,
+                  periodo TEXT NOT NULL,
+                  version INTEGER NOT NULL,
+                  file_id TEXT NOT NULL,
+                  filename TEXT NOT NULL,
+                  cantidad INTEGER NOT NULL,
+                  total_centavos INTEGER NOT NULL,
+                  created_at TEXT,
+                  PRIMARY KEY (user_id, periodo)) WITHOUT ROWID''')
+
+
+# Versión del esquema de los archivos anuales: 1 = montos en centavos enteros, 2 = con
+# duplicado_de, 3 = índice de la llave de duplicados. Los archivos se actualizan al abrir la
+# base y se marcan aquí, así que cada uno se revisa una sola vez
+VERSION_ARCHIVO = 3
+
+
+@migracion(12, 'versión de esquema de los archivos anuales')
+def _version_archivos(c: sqlite3.Cursor):
+    c.execute('ALTER TABLE archivos ADD COLUMN esquema INTEGER NOT NULL DEFAULT 0')
@@ -0,0 +1,62 @@
+"""
+Módulo de Modelos
+Filas de facturas con atributos por nombre, creadas directamente por sqlite3
+"""
+
+import sqlite3
+from decimal import Decimal
+from typing import Optional
+
+
+class Factura:
+    """
+    Fila de la tabla facturas
+
+    Usa __slots__: no hay un diccionario por fila, así que ocupa menos memoria que
+    una tupla con nombres y mucho menos que un dict. Solo tiene los atributos de las
+    columnas que seleccionó la consulta; pedir otro lanza AttributeError en lugar
+    de devolver en silencio el valor de otra columna.
+    """
+
+    __slots__ = ('id', 'user_id', 'fecha', 'nit_proveedor', 'nombre_proveedor', 'serie', 'numero',
+                 'tipo_gasto', 'monto', 'foto_path', 'duplicado_de', 'created_at')
+
+    id: int
+    user_id: int
+    fecha: Optional[str]
+    nit_proveedor: Optional[str]
+    nombre_proveedor: Optional[str]
+    serie: Optional[str]
+    numero: Optional[str]
+    tipo_gasto: Optional[str]
+    monto: Optional[Decimal]
+    foto_path: Optional[str]
+    duplicado_de: Optional[int]
+    created_at: Optional[str]
+
+    def __init__(self, **campos):
+        for nombre, valor in campos.items():
+            setattr(self, nombre, valor)
+
+    def __repr__(self) -> str:
+        campos = ', '.join(f'{nombre}={getattr(self, nombre)!r}'
+                           for nombre in self.__slots__ if hasattr(self, nombre))
+        return f'Factura({campos})'
+
+    def __eq__(self, otra) -> bool:
+        if not isinstance(otra, Factura):
+            return NotImplemented
+        return all(getattr(self, nombre, None) == getattr(otra, nombre, None) for nombre in self.__slots__)
+
+
+def fila_factura(cursor: sqlite3.Cursor, fila: tuple) -> Factura:
+    """
+    row_factory de sqlite3 que devuelve Factura
+
+    Los atributos toman el nombre de las columnas de la consulta; con PARSE_COLNAMES
+    el alias 'monto [centavos]' llega como 'monto', ya convertido a Decimal.
+    """
+    factura = Factura.__new__(Factura)
+    for columna, valor in zip(cursor.description, fila):
+        setattr(factura, columna[0], valor)
+    return factura
@@ -3,20 +3,27 @@ Módulo de OCR mejorado para extracción de datos de facturas
 """
 
 import re
+import time
 import logging
-import numpy as np
-import cv2
 import pytesseract
-from PIL import Image, ImageEnhance, ImageFilter
-from typing import Dict, Optional, List, Tuple
-from .config import OCR_CONFIG, NIT_EMPRESA
+from PIL import Image
+from typing import Callable, Dict, Optional, List, Tuple
+from .config import (OCR_CONFIG, OCR_PIPELINES, OCR_ESTRATEGIAS, NIT_EMPRESA,
+                     TIPO_GASTO_PATRONES, TIPO_GASTO_MARGEN_MINIMO)
+from .preprocesamiento import aplicar_pipeline
 
 logger = logging.getLogger(__name__)
 
 
-def extraer_datos_factura(image_path: str) -> Optional[Dict[str, any]]:
+def extraer_datos_factura(image_path: str,
+                          buscar_proveedor: Optional[Callable[[str], Optional[str]]] = None) -> Optional[Dict[str, any]]:
     """
     Extrae datos de la factura usando OCR con múltiples estrategias
+
+    Args:
+        image_path: Ruta de la imagen
+        buscar_proveedor: Función opcional NIT -> nombre (directorio de proveedores).
+            Si el NIT está en el directorio se usa ese nombre y se omite la extracción.
     """
     try:
         logger.info(f"Procesando imagen: {image_path}")
@@ -25,25 +32,22 @@ def extraer_datos_factura(image_path: str) -> Optional[Dict[str, any]]:
 
         # Intentar con múltiples estrategias de preprocesamiento
         texto_completo = []
-        configs = [
-            ('basico', '--psm 6 --oem 3'),
-            ('basico', '--psm 4 --oem 3'),
-            ('avanzado', '--psm 6 --oem 3'),
-            ('original', '--psm 6 --oem 3'),  # Sin preprocesamiento
-        ]
-
-        for tipo, config in configs:
-            if tipo == 'avanzado':
-                img_procesada = _preprocesar_imagen_avanzado(img.copy())
-            elif tipo == 'basico':
-                img_procesada = _preprocesar_imagen_basico(img.copy())
-            else:
-                # Imagen original sin preprocesamiento
-                img_procesada = img.copy()
-
-            texto = pytesseract.image_to_string(img_procesada, lang=OCR_CONFIG['lang'], config=config)
+        imagenes_procesadas = {}
+
+        for pipeline, config in OCR_ESTRATEGIAS:
+            # Cada pipeline se aplica una sola vez aunque se use con varias configuraciones
+            if pipeline not in imagenes_procesadas:
+                img_procesada, tiempos = aplicar_pipeline(img, OCR_PIPELINES.get(pipeline, []))
+                imagenes_procesadas[pipeline] = img_procesada
+                logger.info(f"Preprocesamiento '{pipeline}': "
+                            f"{sum(tiempos.values()) * 1000:.0f}ms "
+                            f"({', '.join(f'{n}={t * 1000:.0f}ms' for n, t in tiempos.items()) or 'sin etapas'})")
+
+            inicio = time.perf_counter()
+            texto = pytesseract.image_to_string(imagenes_procesadas[pipeline], lang=OCR_CONFIG['lang'], config=config)
             texto_completo.append(texto)
-            logger.debug(f"Texto extraído con {tipo}/{config}: {len(texto)} caracteres")
+            logger.debug(f"Texto extraído con {pipeline}/{config}: {len(texto)} caracteres "
+                         f"en {(time.perf_counter() - inicio) * 1000:.0f}ms")
 
         # Combinar todos los textos para maximizar extracción
         texto_combinado = '\n'.join(texto_completo)
@@ -56,15 +60,22 @@ def extraer_datos_factura(image_path: str) -> Optional[Dict[str, any]]:
         texto_limpio = _limpiar_texto(texto_final)
 
         # Intentar extracción con todos los textos disponibles
+        nit = _extraer_nit_mejorado(lineas_combinadas, texto_combinado)
+        nombre_directorio = buscar_proveedor(nit) if (nit and buscar_proveedor) else None
+        if nombre_directorio:
+            logger.info(f"Nombre del proveedor tomado del directorio para NIT {nit}: {nombre_directorio}")
+
         datos = {
-            'nit': _extraer_nit_mejorado(lineas_combinadas, texto_combinado),
-            'nombre': _extraer_nombre_mejorado(lineas_combinadas, texto_combinado),
+            'nit': nit,
+            'nombre': nombre_directorio or _extraer_nombre_mejorado(lineas_combinadas, texto_combinado),
+            'nombre_desde_directorio': bool(nombre_directorio),
             'serie': _extraer_serie_mejorado(lineas_combinadas, texto_combinado),
             'numero': _extraer_numero_mejorado(lineas_combinadas, texto_combinado),
-            'monto': _extraer_monto_mejorado(lineas_combinadas, texto_combinado)
+            'monto': _extraer_monto_mejorado(lineas_combinadas, texto_combinado),
+            'tipo_gasto': _detectar_tipo_gasto(texto_combinado)
         }
 
-        logger.info(f"Datos extraídos: NIT={datos['nit']}, Nombre={datos['nombre'][:30] if datos['nombre'] else None}, Serie={datos['serie']}, Numero={datos['numero']}, Monto={datos['monto']}")
+        logger.info(f"Datos extraídos: NIT={datos['nit']}, Nombre={datos['nombre'][:30] if datos['nombre'] else None}, Serie={datos['serie']}, Numero={datos['numero']}, Monto={datos['monto']}, Tipo={datos['tipo_gasto']}")
 
         return datos
 
@@ -76,60 +87,6 @@ def extraer_datos_factura(image_path: str) -> Optional[Dict[str, any]]:
         return None
 
 
-def _preprocesar_imagen_avanzado(img: Image) -> Image:
-    """
-    Preprocesamiento avanzado de imagen con OpenCV
-    """
-    try:
-        img_array = np.array(img.convert('RGB'))
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-
-        denoised = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
-
-        thresh = cv2.adaptiveThreshold(
-            denoised, 255,
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY, 11, 2
-        )
-
-        kernel = np.ones((1, 1), np.uint8)
-        morph = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-
-        img_final = Image.fromarray(morph)
-
-        enhancer = ImageEnhance.Sharpness(img_final)
-        img_final = enhancer.enhance(1.5)
-
-        logger.debug("Imagen preprocesada con OpenCV")
-        return img_final
-
-    except Exception as e:
-        logger.warning(f"Error en preprocesamiento avanzado: {e}. Usando preprocesamiento basico")
-        return _preprocesar_imagen_basico(img)
-
-
-def _preprocesar_imagen_basico(img: Image) -> Image:
-    """
-    Preprocesamiento básico si OpenCV falla
-    """
-    try:
-        img = img.convert('L')
-
-        enhancer = ImageEnhance.Contrast(img)
-        img = enhancer.enhance(2.5)
-
-        img = img.filter(ImageFilter.SHARPEN)
-        img = img.filter(ImageFilter.MedianFilter(size=3))
-
-        enhancer = ImageEnhance.Brightness(img)
-        img = enhancer.enhance(1.3)
-
-        return img
-    except Exception as e:
-        logger.warning(f"Error en preprocesamiento basico: {e}")
-        return img
-
-
 def _limpiar_texto(texto: str) -> str:
     """
     Limpia y normaliza el texto extraido
@@ -489,3 +446,38 @@ def _extraer_monto_mejorado(lineas: List[str], texto_completo: str) -> Optional[
     except Exception as e:
         logger.error(f"Error extrayendo monto: {e}")
         return None
+
+
+def _detectar_tipo_gasto(texto_completo: str) -> Optional[str]:
+    """
+    Infiere el tipo de gasto contando coincidencias con patrones de gasolinera o restaurante.
+    Retorna None si no hay evidencia o si el tipo ganador no supera al otro por
+    TIPO_GASTO_MARGEN_MINIMO coincidencias (el bot pregunta el tipo).
+    """
+    try:
+        texto_upper = texto_completo.upper()
+        puntajes = {}
+
+        for tipo, patrones in TIPO_GASTO_PATRONES.items():
+            puntaje = 0
+            for patron in patrones:
+                coincidencias = len(re.findall(rf'\b(?:{patron})\b', texto_upper))
+                if coincidencias:
+                    puntaje += coincidencias
+                    logger.debug(f"Patrón '{patron}' ({tipo}) encontrado {coincidencias} veces")
+            puntajes[tipo] = puntaje
+
+        ordenados = sorted(puntajes.items(), key=lambda x: x[1], reverse=True)
+        mejor_tipo, mejor_puntaje = ordenados[0]
+        segundo_puntaje = ordenados[1][1] if len(ordenados) > 1 else 0
+
+        if mejor_puntaje - segundo_puntaje < TIPO_GASTO_MARGEN_MINIMO:
+            logger.info(f"No se pudo inferir el tipo de gasto (puntajes={puntajes})")
+            return None
+
+        logger.info(f"Tipo de gasto inferido: {mejor_tipo} (puntajes={puntajes})")
+        return mejor_tipo
+
+    except Exception as e:
+        logger.error(f"Error detectando tipo de gasto: {e}")
+        return None
@@ -0,0 +1,190 @@
+"""
+Módulo de Preprocesamiento de Imágenes para OCR
+Registro de etapas con nombre que se combinan en pipelines desde la configuración
+"""
+
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+import cv2
+from PIL import Image, ImageEnhance, ImageFilter
+
+logger = logging.getLogger(__name__)
+
+# Registro de etapas: nombre -> función (np.ndarray) -> np.ndarray
+ETAPAS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {}
+
+# Métricas acumuladas por etapa: nombre -> [ejecuciones, segundos totales]
+_metricas: Dict[str, List[float]] = {}
+_metricas_lock = threading.Lock()
+
+
+def registrar_etapa(nombre: str):
+    """
+    Decorador para registrar una etapa de preprocesamiento
+
+    Args:
+        nombre: Nombre con el que la etapa se referencia en los pipelines
+    """
+    def decorador(funcion: Callable[[np.ndarray], np.ndarray]):
+        ETAPAS[nombre] = funcion
+        return funcion
+    return decorador
+
+
+def aplicar_pipeline(img: Image.Image, etapas: List[str]) -> Tuple[Image.Image, Dict[str, float]]:
+    """
+    Aplica una secuencia de etapas registradas a una imagen
+
+    Args:
+        img: Imagen PIL original
+        etapas: Nombres de las etapas en orden de aplicación
+
+    Returns:
+        tuple: (imagen procesada, tiempos en segundos por etapa)
+    """
+    arr = np.array(img.convert('RGB'))
+    tiempos = {}
+
+    for nombre in etapas:
+        etapa = ETAPAS.get(nombre)
+        if etapa is None:
+            logger.warning(f"Etapa de preprocesamiento desconocida: '{nombre}'. Se omite")
+            continue
+
+        inicio = time.perf_counter()
+        try:
+            arr = etapa(arr)
+        except Exception as e:
+            logger.warning(f"Error en etapa '{nombre}': {e}. Se omite")
+        duracion = time.perf_counter() - inicio
+
+        tiempos[nombre] = duracion
+        _registrar_metrica(nombre, duracion)
+
+    logger.debug("Pipeline " + ", ".join(f"{n}={t * 1000:.1f}ms" for n, t in tiempos.items()))
+    return Image.fromarray(arr), tiempos
+
+
+def _registrar_metrica(nombre: str, duracion: float):
+    """Acumular tiempo de una etapa"""
+    with _metricas_lock:
+        acumulado = _metricas.setdefault(nombre, [0, 0.0])
+        acumulado[0] += 1
+        acumulado[1] += duracion
+
+
+def obtener_metricas() -> Dict[str, Dict[str, float]]:
+    """
+    Retorna las métricas acumuladas por etapa
+
+    Returns:
+        dict: {etapa: {'ejecuciones', 'total_ms', 'promedio_ms'}}
+    """
+    with _metricas_lock:
+        return {
+            nombre: {
+                'ejecuciones': int(ejecuciones),
+                'total_ms': total * 1000,
+                'promedio_ms': (total / ejecuciones) * 1000 if ejecuciones else 0.0
+            }
+            for nombre, (ejecuciones, total) in _metricas.items()
+        }
+
+
+def registrar_resumen_etapas(cantidad: int = 5):
+    """Escribe en el log las etapas que más tiempo acumulan"""
+    etapas = sorted(obtener_metricas().items(), key=lambda x: x[1]['total_ms'], reverse=True)
+    for nombre, datos in etapas[:cantidad]:
+        logger.info(f"Etapa {nombre}: {datos['ejecuciones']} ejecuciones, total {datos['total_ms']:.1f} ms, "
+                    f"promedio {datos['promedio_ms']:.1f} ms")
+
+
+def _a_gris(arr: np.ndarray) -> np.ndarray:
+    """Convertir a escala de grises si la imagen aún tiene color"""
+    if arr.ndim == 3:
+        return cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
+    return arr
+
+
+def _con_pil(arr: np.ndarray, operacion: Callable[[Image.Image], Image.Image]) -> np.ndarray:
+    """Aplicar una operación de PIL sobre un arreglo"""
+    return np.array(operacion(Image.fromarray(arr)))
+
+
+# ==================== ETAPAS BÁSICAS ====================
+
+@registrar_etapa('gris')
+def _etapa_gris(arr: np.ndarray) -> np.ndarray:
+    return _a_gris(arr)
+
+
+@registrar_etapa('contraste')
+def _etapa_contraste(arr: np.ndarray) -> np.ndarray:
+    return _con_pil(arr, lambda img: ImageEnhance.Contrast(img).enhance(2.5))
+
+
+@registrar_etapa('brillo')
+def _etapa_brillo(arr: np.ndarray) -> np.ndarray:
+    return _con_pil(arr, lambda img: ImageEnhance.Brightness(img).enhance(1.3))
+
+
+@registrar_etapa('enfocar')
+def _etapa_enfocar(arr: np.ndarray) -> np.ndarray:
+    return _con_pil(arr, lambda img: img.filter(ImageFilter.SHARPEN))
+
+
+@registrar_etapa('nitidez')
+def _etapa_nitidez(arr: np.ndarray) -> np.ndarray:
+    return _con_pil(arr, lambda img: ImageEnhance.Sharpness(img).enhance(1.5))
+
+
+# ==================== REDUCCIÓN DE RUIDO ====================
+
+@registrar_etapa('nlmeans')
+def _etapa_nlmeans(arr: np.ndarray) -> np.ndarray:
+    """Non-local means: la más precisa y la más costosa"""
+    return cv2.fastNlMeansDenoising(_a_gris(arr), None, 10, 7, 21)
+
+
+@registrar_etapa('bilateral')
+def _etapa_bilateral(arr: np.ndarray) -> np.ndarray:
+    """Suaviza ruido conservando bordes, mucho más barato que nlmeans"""
+    return cv2.bilateralFilter(_a_gris(arr), 9, 75, 75)
+
+
+@registrar_etapa('mediana')
+def _etapa_mediana(arr: np.ndarray) -> np.ndarray:
+    """Filtro de mediana 3x3, el más barato"""
+    return cv2.medianBlur(arr, 3)
+
+
+# ==================== BINARIZACIÓN ====================
+
+@registrar_etapa('umbral_adaptativo')
+def _etapa_umbral_adaptativo(arr: np.ndarray) -> np.ndarray:
+    return cv2.adaptiveThreshold(
+        _a_gris(arr), 255,
+        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY, 11, 2
+    )
+
+
+@registrar_etapa('otsu')
+def _etapa_otsu(arr: np.ndarray) -> np.ndarray:
+    """Umbral global de Otsu"""
+    _, binaria = cv2.threshold(_a_gris(arr), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binaria
+
+
+@registrar_etapa('sauvola')
+def _etapa_sauvola(arr: np.ndarray, ventana: int = 25, k: float = 0.2, r: float = 128.0) -> np.ndarray:
+    """Umbral local de Sauvola, robusto con sombras e iluminación desigual"""
+    gray = _a_gris(arr).astype(np.float32)
+    media = cv2.boxFilter(gray, -1, (ventana, ventana))
+    media_cuadrados = cv2.boxFilter(gray * gray, -1, (ventana, ventana))
+    desviacion = np.sqrt(np.maximum(media_cuadrados - media * media, 0))
+    umbral = media * (1 + k * (desviacion / r - 1))
+    return np.where(gray > umbral, 255, 0).astype(np.uint8)
@@ -0,0 +1,212 @@
+"""
+Módulo de Respaldos de la Base de Datos
+Copias en caliente con la API de respaldo de SQLite, rotación y restauración
+"""
+
+import os
+import time
+import sqlite3
+import logging
+from datetime import datetime
+from typing import List, Optional
+from .config import BACKUP_CONFIG, DATABASE_CONFIG
+from .database import Database
+
+logger = logging.getLogger(__name__)
+
+_FORMATO_FECHA = '%Y%m%d-%H%M%S'
+
+# Sufijo de las copias del estado anterior a una restauración
+_SUFIJO_RESTAURACION = '-antes-de-restaurar.db'
+
+
+def _nombre_base(db_path: str) -> str:
+    return os.path.splitext(os.path.basename(db_path))[0]
+
+
+def verificar_respaldo(ruta: str) -> bool:
+    """
+    Verifica la integridad de un archivo de respaldo
+
+    Args:
+        ruta: Ruta del respaldo
+
+    Returns:
+        bool: True si PRAGMA integrity_check responde 'ok'
+    """
+    try:
+        conn = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+        try:
+            resultado = conn.execute('PRAGMA integrity_check').fetchall()
+        finally:
+            conn.close()
+        if resultado == [('ok',)]:
+            return True
+        logger.error(f"Respaldo {ruta} dañado: {resultado[:5]}")
+        return False
+    except Exception as e:
+        logger.error(f"Error al verificar respaldo {ruta}: {e}")
+        return False
+
+
+def _archivo_unico(destino: sqlite3.Connection):
+    """Deja el respaldo en un solo archivo (la copia hereda el modo WAL del origen)"""
+    destino.execute('PRAGMA journal_mode=DELETE')
+
+
+def _copiar(origen_path: str, destino_path: str, archivo_unico: bool = False):
+    """Copia completa de una base de datos a otra con la API de respaldo (sin escrituras concurrentes)"""
+    origen = sqlite3.connect(origen_path, timeout=DATABASE_CONFIG['busy_timeout_ms'] / 1000)
+    destino = sqlite3.connect(destino_path, timeout=DATABASE_CONFIG['busy_timeout_ms'] / 1000)
+    try:
+        origen.backup(destino)
+        if archivo_unico:
+            _archivo_unico(destino)
+    except Exception as e:
+        logger.error(f"Error al copiar {origen_path} en {destino_path}: {e}")
+        raise
+    finally:
+        origen.close()
+        destino.close()
+
+
+def crear_respaldo(db: Database, directorio: Optional[str] = None, retencion: Optional[int] = None) -> str:
+    """
+    Crea un respaldo verificado de la base de datos sin detener el bot
+
+    El respaldo se escribe en un archivo temporal, se verifica con integrity_check
+    y solo entonces se renombra; después se eliminan los respaldos más antiguos.
+
+    Args:
+        db: Base de datos abierta (la del bot o la de un comando de administración)
+        directorio: Carpeta de respaldos (por defecto la configurada)
+        retencion: Respaldos que se conservan (por defecto la configurada)
+
+    Returns:
+        str: Ruta del respaldo creado
+
+    Raises:
+        RuntimeError: Si el respaldo no pasa la verificación de integridad
+    """
+    db_path = db.db_name
+    directorio = directorio or BACKUP_CONFIG['directorio']
+    retencion = BACKUP_CONFIG['retencion'] if retencion is None else retencion
+    os.makedirs(directorio, exist_ok=True)
+
+    marca = datetime.now().strftime(_FORMATO_FECHA)
+    ruta = os.path.join(directorio, f"{_nombre_base(db_path)}-{marca}.db")
+    temporal = f"{ruta}.tmp"
+
+    inicio = time.perf_counter()
+    destino = sqlite3.connect(temporal)
+    try:
+        db.respaldar(destino, BACKUP_CONFIG['paginas_por_paso'], BACKUP_CONFIG['pausa_ms'] / 1000)
+        _archivo_unico(destino)
+    except Exception as e:
+        logger.error(f"Error al respaldar {db_path}: {e}")
+        destino.close()
+        os.remove(temporal)
+        raise
+    destino.close()
+
+    if not verificar_respaldo(temporal):
+        os.remove(temporal)
+        raise RuntimeError(f"El respaldo de {db_path} no pasó la verificación de integridad")
+
+    os.replace(temporal, ruta)
+    duracion = time.perf_counter() - inicio
+    logger.info(f"Respaldo creado: {ruta} ({os.path.getsize(ruta) / 1024:.0f} KB en {duracion:.2f}s)")
+
+    rotar_respaldos(db_path, directorio, retencion)
+    return ruta
+
+
+def listar_respaldos(db_path: str, directorio: Optional[str] = None,
+                     restauraciones: Optional[bool] = None) -> List[str]:
+    """
+    Respaldos de una base de datos, del más reciente al más antiguo
+
+    Args:
+        restauraciones: True solo las copias previas a una restauración, False solo los
+                        respaldos periódicos, None ambos
+    """
+    directorio = directorio or BACKUP_CONFIG['directorio']
+    if not os.path.isdir(directorio):
+        return []
+
+    prefijo = f"{_nombre_base(db_path)}-"
+    nombres = [n for n in os.listdir(directorio) if n.startswith(prefijo) and n.endswith('.db')
+               and (restauraciones is None or n.endswith(_SUFIJO_RESTAURACION) == restauraciones)]
+    return [os.path.join(directorio, n) for n in sorted(nombres, reverse=True)]
+
+
+def rotar_respaldos(db_path: str, directorio: Optional[str] = None, retencion: Optional[int] = None,
+                    restauraciones: bool = False) -> List[str]:
+    """
+    Elimina los respaldos que exceden la retención
+
+    Los respaldos periódicos y las copias previas a una restauración se cuentan por
+    separado: restaurar varias veces no desplaza respaldos diarios, ni al revés.
+
+    Args:
+        restauraciones: Rotar las copias previas a una restauración en lugar de los respaldos
+
+    Returns:
+        list: Rutas eliminadas
+    """
+    if retencion is None:
+        retencion = BACKUP_CONFIG['retencion_restauraciones' if restauraciones else 'retencion']
+    if retencion <= 0:
+        return []
+
+    eliminados = []
+    for ruta in listar_respaldos(db_path, directorio, restauraciones)[retencion:]:
+        try:
+            os.remove(ruta)
+            eliminados.append(ruta)
+        except OSError as e:
+            logger.warning(f"No se pudo eliminar el respaldo {ruta}: {e}")
+
+    if eliminados:
+        logger.info(f"Respaldos antiguos eliminados: {len(eliminados)}")
+    return eliminados
+
+
+def restaurar_respaldo(ruta: str, db_path: str, directorio: Optional[str] = None) -> Optional[str]:
+    """
+    Reemplaza la base de datos con el contenido de un respaldo
+
+    El bot debe estar detenido. Antes de restaurar se respalda el estado actual para
+    poder deshacer la restauración; de esas copias se conservan las
+    BACKUP_CONFIG['retencion_restauraciones'] más recientes.
+
+    Args:
+        ruta: Respaldo a restaurar
+        db_path: Base de datos de destino
+        directorio: Carpeta donde guardar el respaldo del estado actual
+
+    Returns:
+        str: Ruta del respaldo del estado anterior (None si no existía la base de datos)
+
+    Raises:
+        FileNotFoundError: Si el respaldo no existe
+        RuntimeError: Si el respaldo no pasa la verificación de integridad
+    """
+    if not os.path.isfile(ruta):
+        raise FileNotFoundError(f"No existe el respaldo {ruta}")
+    if not verificar_respaldo(ruta):
+        raise RuntimeError(f"El respaldo {ruta} no pasó la verificación de integridad")
+
+    anterior = None
+    if os.path.exists(db_path):
+        directorio = directorio or BACKUP_CONFIG['directorio']
+        os.makedirs(directorio, exist_ok=True)
+        marca = datetime.now().strftime(_FORMATO_FECHA)
+        anterior = os.path.join(directorio, f"{_nombre_base(db_path)}-{marca}{_SUFIJO_RESTAURACION}")
+        _copiar(db_path, anterior, archivo_unico=True)
+        rotar_respaldos(db_path, directorio, restauraciones=True)
+
+    _copiar(ruta, db_path)
+
+    logger.info(f"Base de datos {db_path} restaurada desde {ruta}")
+    return anterior
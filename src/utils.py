@@ -5,7 +5,10 @@ Funciones auxiliares y configuración de logging
 
 import logging
 import os
-from datetime import datetime
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import List, Optional, Union
 
 
 def configurar_logging(nivel=logging.INFO):
@@ -45,7 +48,7 @@ def configurar_logging(nivel=logging.INFO):
     logger.info("=" * 60)
 
 
-def formatear_monto(monto: float) -> str:
+def formatear_monto(monto: Union[Decimal, float]) -> str:
     """
     Formatea un monto en formato de moneda
 
@@ -74,7 +77,10 @@ def truncar_texto(texto: str, max_len: int = 40) -> str:
     return texto[:max_len] + '...' if len(texto) > max_len else texto
 
 
-def validar_monto(monto_str: str) -> float:
+_CENTAVO = Decimal('0.01')
+
+
+def validar_monto(monto_str: str) -> Decimal:
     """
     Valida y convierte un string a monto
 
@@ -82,7 +88,7 @@ def validar_monto(monto_str: str) -> float:
         monto_str: String con el monto
 
     Returns:
-        float: Monto validado
+        Decimal: Monto validado, redondeado a centavos
 
     Raises:
         ValueError: Si el monto no es válido
@@ -90,16 +96,191 @@ def validar_monto(monto_str: str) -> float:
     try:
         # Limpiar string
         monto_limpio = monto_str.replace('Q', '').replace(',', '').strip()
-        monto = float(monto_limpio)
+        monto = Decimal(monto_limpio)
 
+        if not monto.is_finite():
+            raise ValueError("Formato de monto inválido")
         if monto < 0:
             raise ValueError("El monto no puede ser negativo")
 
-        return monto
-    except (ValueError, AttributeError):
+        return monto.quantize(_CENTAVO, rounding=ROUND_HALF_UP)
+    except (ValueError, AttributeError, InvalidOperation):
         raise ValueError("Formato de monto inválido")
 
 
+def a_centavos(monto: Union[Decimal, float, int, str, None]) -> Optional[int]:
+    """
+    Convierte un monto en quetzales a centavos enteros para guardarlo
+
+    Los float (por ejemplo los del OCR) pasan por su representación corta en texto,
+    así 0.1 se guarda como 10 centavos y no como 0.1000000000000000055...
+
+    Args:
+        monto: Monto en quetzales (None se conserva)
+
+    Returns:
+        int: Centavos, redondeando la mitad hacia arriba
+    """
+    if monto is None:
+        return None
+    return int((Decimal(str(monto)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def desde_centavos(centavos: Optional[int]) -> Optional[Decimal]:
+    """Convierte centavos enteros a Decimal en quetzales con dos decimales (None se conserva)"""
+    if centavos is None:
+        return None
+    return Decimal(centavos).scaleb(-2)
+
+
+def normalizar_nit(nit: Optional[str]) -> Optional[str]:
+    """Normaliza un NIT para usarlo como llave (sin guiones ni espacios, en mayúsculas)"""
+    if not nit:
+        return None
+    nit_normalizado = str(nit).upper().replace('-', '').replace(' ', '').strip()
+    return nit_normalizado or None
+
+
+def normalizar_fecha(fecha_str: str) -> str:
+    """
+    Convierte una fecha a formato ISO (AAAA-MM-DD) para almacenarla
+
+    Args:
+        fecha_str: Fecha en formato DD/MM/AAAA, DD-MM-AAAA, DD/MM/AA o AAAA-MM-DD
+
+    Returns:
+        str: Fecha en formato ISO
+
+    Raises:
+        ValueError: Si la fecha no es válida
+    """
+    try:
+        texto = fecha_str.strip()
+        for formato in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%d-%m-%y'):
+            try:
+                return datetime.strptime(texto, formato).strftime('%Y-%m-%d')
+            except ValueError:
+                continue
+    except AttributeError:
+        pass
+    raise ValueError("Formato de fecha inválido")
+
+
+def formatear_fecha(fecha_iso: str) -> str:
+    """
+    Formatea una fecha ISO para mostrarla al usuario
+
+    Args:
+        fecha_iso: Fecha en formato AAAA-MM-DD
+
+    Returns:
+        str: Fecha en formato DD/MM/AAAA (o el texto original si no es ISO)
+    """
+    if not fecha_iso:
+        return ""
+    # date.fromisoformat es mucho más rápido que strptime (se llama una vez por fila al exportar)
+    if isinstance(fecha_iso, str) and len(fecha_iso) == 10:
+        try:
+            fecha = date.fromisoformat(fecha_iso)
+            return f"{fecha.day:02d}/{fecha.month:02d}/{fecha.year:04d}"
+        except ValueError:
+            pass
+    return fecha_iso
+
+
+def parsear_mes_anio(texto: str) -> tuple:
+    """
+    Interpreta un período escrito como MM/AAAA o AAAA-MM
+
+    Args:
+        texto: Período escrito por el usuario
+
+    Returns:
+        tuple: (mes, anio)
+
+    Raises:
+        ValueError: Si el período no es válido
+    """
+    try:
+        texto = texto.strip()
+        if '/' in texto:
+            mes_str, anio_str = texto.split('/')
+        else:
+            anio_str, mes_str = texto.split('-')
+        mes, anio = int(mes_str), int(anio_str)
+    except (ValueError, AttributeError):
+        raise ValueError("Formato de período inválido")
+
+    if not 1 <= mes <= 12 or anio < 1000:
+        raise ValueError("Formato de período inválido")
+    return mes, anio
+
+
+def parsear_ids(texto: str, maximo: int) -> List[int]:
+    """
+    Interpreta una lista de números de factura con rangos, por ejemplo "12, 15, 20-31"
+
+    Args:
+        texto: Números separados por comas o espacios; los rangos van con guion
+        maximo: Cantidad máxima de números que se aceptan
+
+    Returns:
+        list: Números sin repetir, ordenados
+
+    Raises:
+        ValueError: Si el texto no es válido o pasa del máximo
+    """
+    ids = set()
+    partes = re.split(r'[,;\s]+', re.sub(r'\s*[-–]\s*', '-', texto or '').strip())
+    for parte in filter(None, partes):
+        match = re.fullmatch(r'#?(\d+)(?:-#?(\d+))?', parte)
+        if not match:
+            raise ValueError(f"Número de factura inválido: {parte}")
+        inicio = int(match.group(1))
+        fin = int(match.group(2)) if match.group(2) else inicio
+        if fin < inicio:
+            inicio, fin = fin, inicio
+        if fin - inicio + 1 + len(ids) > maximo:
+            raise ValueError(f"Se pueden indicar hasta {maximo} facturas a la vez")
+        ids.update(range(inicio, fin + 1))
+
+    if not ids:
+        raise ValueError("No se indicó ningún número de factura")
+    if len(ids) > maximo:
+        raise ValueError(f"Se pueden indicar hasta {maximo} facturas a la vez")
+    return sorted(ids)
+
+
+def eliminar_archivos(rutas: List[str], carpeta: str) -> int:
+    """
+    Elimina archivos que estén dentro de una carpeta (los que no existen se ignoran)
+
+    Args:
+        rutas: Archivos a eliminar
+        carpeta: Solo se eliminan archivos dentro de esta carpeta
+
+    Returns:
+        int: Archivos eliminados
+    """
+    logger = logging.getLogger(__name__)
+    base = os.path.realpath(carpeta)
+    eliminados = 0
+    for ruta in rutas:
+        if not ruta:
+            continue
+        if os.path.commonpath([base, os.path.realpath(ruta)]) != base:
+            logger.warning(f"No se elimina {ruta}: está fuera de {carpeta}")
+            continue
+        try:
+            os.remove(ruta)
+            eliminados += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"No se pudo eliminar {ruta}: {e}")
+    return eliminados
+
+
 def formatear_error(error: Exception) -> str:
     """
     Formatea un error para mostrarlo al usuario
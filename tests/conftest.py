@@ -0,0 +1,14 @@
+"""
+Fixtures compartidas de las pruebas
+"""
+
+import pytest
+from src.database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Base de datos vacía en un directorio temporal, con el esquema ya migrado"""
+    base = Database(str(tmp_path / 'viaticos.db'))
+    yield base
+    base.cerrar()
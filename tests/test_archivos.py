@@ -0,0 +1,102 @@
+"""
+Pruebas de los archivos anuales
+"""
+
+import sqlite3
+from decimal import Decimal
+import pytest
+from src.database import Database, FacturaDuplicada
+from src.modelos import Factura
+
+
+def test_archivo_anterior_a_centavos_se_convierte_una_sola_vez(tmp_path, monkeypatch):
+    ruta_db = str(tmp_path / 'viaticos.db')
+    ruta_archivo = str(tmp_path / 'viaticos-2020.db')
+    Database(ruta_db).cerrar()
+
+    # Archivo anual creado antes de la migración 9 (montos REAL)
+    conn = sqlite3.connect(ruta_archivo)
+    conn.execute('''CREATE TABLE facturas
+                    (id INTEGER PRIMARY KEY, user_id INTEGER, fecha TEXT, nit_proveedor TEXT,
+                     nombre_proveedor TEXT, serie TEXT, numero TEXT, tipo_gasto TEXT, monto REAL,
+                     foto_path TEXT, created_at TEXT)''')
+    conn.execute("INSERT INTO facturas VALUES (1, 1, '2020-03-01', '123', 'P', 'A', '1', 'Alimentación', "
+                 "12.5, 'f.jpg', '2020-03-01 10:00:00')")
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(ruta_db)
+    conn.execute('INSERT INTO archivos (anio, ruta, facturas) VALUES (2020, ?, 1)', (ruta_archivo,))
+    conn.commit()
+    conn.close()
+
+    revisados = []
+    actualizar = Database._actualizar_archivo
+    monkeypatch.setattr(Database, '_actualizar_archivo',
+                        lambda self, anio: (revisados.append(anio), actualizar(self, anio)))
+
+    for _ in range(2):
+        Database(ruta_db).cerrar()
+
+    assert revisados == [2020]
+    conn = sqlite3.connect(ruta_archivo)
+    assert conn.execute('SELECT monto_centavos, duplicado_de FROM facturas').fetchall() == [(1250, None)]
+    conn.close()
+
+
+def _insertar(db, user_id, fecha, numero, monto='10.00', duplicado_de=None):
+    return db.insertar_factura(user_id, fecha, '1234567', 'Proveedor', 'A1', numero, 'Alimentación',
+                               Decimal(monto), 'facturas/f.jpg', duplicado_de)
+
+
+def test_exportar_todas_con_mas_archivos_que_el_limite_de_sqlite(db, tmp_path):
+    # SQLite admite 10 bases adjuntas por conexión; aquí hay 12 años archivados
+    anios = list(range(2010, 2022))
+    for anio in anios:
+        _insertar(db, 1, f'{anio}-06-15', f'{anio}')
+        db.archivar_anio(anio, str(tmp_path / 'archivo'))
+    # Registradas después de archivar: una de un año archivado, una actual y una sin fecha
+    _insertar(db, 1, '2015-01-02', 'tarde')
+    _insertar(db, 1, '2024-03-01', 'actual')
+    _insertar(db, 1, None, 'sin-fecha')
+
+    fechas = [factura.fecha for factura in db.iterar_facturas(1)]
+
+    assert len(db.anios_archivados()) == 12
+    archivadas = [f'{anio}-06-15' for anio in anios]
+    assert fechas == [None] + sorted(archivadas + ['2015-01-02']) + ['2024-03-01']
+
+
+def test_duplicados_archivados_conservan_su_enlace(db, tmp_path):
+    original = _insertar(db, 1, '2020-05-01', '77')
+    copia = _insertar(db, 2, '2020-05-03', '077', duplicado_de=original)
+    db.archivar_anio(2020, str(tmp_path / 'archivo'))
+
+    grupos = db.obtener_duplicados()
+
+    assert [[(fila[0], fila[-1]) for fila in grupo] for grupo in grupos] == [[(original, None), (copia, original)]]
+
+
+def test_factura_de_un_anio_archivado_se_compara_con_su_archivo(db, tmp_path):
+    original = _insertar(db, 1, '2020-05-01', '77')
+    db.archivar_anio(2020, str(tmp_path / 'archivo'))
+
+    # Misma llave normalizada (ceros a la izquierda en el número)
+    with pytest.raises(FacturaDuplicada) as error:
+        _insertar(db, 1, '2020-05-01', '0077')
+    assert error.value.existente == (original, 1, '2020-05-01')
+
+    insertadas, duplicadas = db.importar_facturas(2, [
+        (2, Factura(fecha='2020-05-01', nit_proveedor='1234567', nombre_proveedor='Proveedor', serie='A1',
+                    numero='77', tipo_gasto='Alimentación', monto=Decimal('10.00'))),
+    ])
+    assert (insertadas, duplicadas) == (0, [(2, "ya registrada por otro usuario")])
+
+    # Guardada a propósito como duplicado sí se registra
+    assert _insertar(db, 1, '2020-05-01', '77', duplicado_de=original)
+
+
+def test_foto_de_una_factura_archivada_sigue_en_uso(db, tmp_path):
+    _insertar(db, 1, '2020-05-01', '77')
+    db.archivar_anio(2020, str(tmp_path / 'archivo'))
+
+    assert db.fotos_sin_uso(['facturas/f.jpg', 'facturas/otra.jpg']) == ['facturas/otra.jpg']
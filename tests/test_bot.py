@@ -0,0 +1,71 @@
+"""
+Pruebas de los handlers del bot (sin conexión con Telegram)
+"""
+
+import asyncio
+from types import SimpleNamespace
+import pytest
+from telegram.ext import Application, ConversationHandler
+from src.bot import SamanthaBot
+from src.config import BORRAR_ID, LISTA_PAGINA
+from src.database_async import DatabaseAsync
+
+USER_ID = 10
+
+
+class _Mensaje:
+    def __init__(self):
+        self.respuestas = []
+
+    async def reply_text(self, texto, **kwargs):
+        self.respuestas.append(texto)
+
+
+def _update():
+    return SimpleNamespace(message=_Mensaje(), effective_user=SimpleNamespace(id=USER_ID),
+                           effective_chat=SimpleNamespace(id=USER_ID))
+
+
+@pytest.fixture
+def bot(db, monkeypatch):
+    db.registrar_usuario(USER_ID, 'Ana')
+    bot = SamanthaBot.__new__(SamanthaBot)
+    bot.db = DatabaseAsync(db)
+    bot.setup_handlers(Application.builder().token('123:ABC').build())
+
+    async def recibir_foto(update, context):
+        update.message.respuestas.append('OCR')
+        return 'OCR'
+    monkeypatch.setattr(bot, 'recibir_foto', recibir_foto)
+    return bot
+
+
+def test_foto_fuera_de_conversacion_inicia_factura(bot):
+    update = _update()
+    estado = asyncio.run(bot.recibir_foto_directa(update, SimpleNamespace(user_data={})))
+    assert estado == 'OCR'
+
+
+def test_foto_durante_borrado_no_inicia_factura(bot):
+    borrar = bot._conversaciones_en_espera[0]
+    update = _update()
+    borrar._conversations[(USER_ID, USER_ID)] = BORRAR_ID
+
+    estado = asyncio.run(bot.recibir_foto_directa(update, SimpleNamespace(user_data={})))
+
+    assert estado == ConversationHandler.END
+    assert 'OCR' not in update.message.respuestas
+    assert '/cancelar' in update.message.respuestas[0]
+    # El borrado sigue esperando el id
+    assert borrar._conversations[(USER_ID, USER_ID)] == BORRAR_ID
+
+
+def test_foto_durante_lista_termina_la_navegacion(bot):
+    lista = bot._conversaciones_navegacion[0]
+    update = _update()
+    lista._conversations[(USER_ID, USER_ID)] = LISTA_PAGINA
+
+    estado = asyncio.run(bot.recibir_foto_directa(update, SimpleNamespace(user_data={})))
+
+    assert estado == 'OCR'
+    assert (USER_ID, USER_ID) not in lista._conversations
@@ -0,0 +1,44 @@
+"""
+Pruebas de la búsqueda de texto completo (/buscar)
+"""
+
+from decimal import Decimal
+
+
+def _insertar(db, user_id, nit, nombre, serie, numero):
+    return db.insertar_factura(user_id, '2025-03-10', nit, nombre, serie, numero,
+                               'Alimentación', Decimal('25.00'), 'facturas/f.jpg')
+
+
+def test_busca_por_proveedor_nit_serie_y_numero(db):
+    factura_id = _insertar(db, 1, '1234567-8', 'Pollo Campero', 'A1B2', '998877')
+
+    for texto in ('campero', 'poll', '1234567-8', '12345678', 'a1b2', '9988'):
+        facturas, _, _ = db.buscar_facturas(1, texto)
+        assert [f.id for f in facturas] == [factura_id], texto
+
+
+def test_no_devuelve_facturas_de_otro_usuario(db):
+    _insertar(db, 1, '1234567-8', 'Pollo Campero', 'A1B2', '1')
+    factura_id = _insertar(db, 2, '1234567-8', 'Pollo Campero', 'A1B2', '2')
+
+    facturas, _, _ = db.buscar_facturas(2, 'campero')
+    assert [f.id for f in facturas] == [factura_id]
+
+
+def test_el_token_del_usuario_no_coincide_con_la_busqueda(db):
+    # Regresión: 'u' y 'u1' eran prefijos del token oculto 'u1' de la columna usuario
+    _insertar(db, 1, '1234567-8', 'Pollo Campero', 'A1B2', '1')
+    _insertar(db, 1, '7654321', 'Despensa Familiar', 'C3D4', '2')
+
+    for texto in ('u', 'u1', 'U1'):
+        facturas, _, _ = db.buscar_facturas(1, texto)
+        assert facturas == [], texto
+
+
+def test_palabra_con_u_en_el_proveedor(db):
+    factura_id = _insertar(db, 1, '1234567-8', 'Uno Gasolinera', 'A1B2', '1')
+    _insertar(db, 1, '7654321', 'Despensa Familiar', 'C3D4', '2')
+
+    facturas, _, _ = db.buscar_facturas(1, 'u')
+    assert [f.id for f in facturas] == [factura_id]
@@ -0,0 +1,18 @@
+"""
+Pruebas de la apertura de la base de datos
+"""
+
+import os
+import sqlite3
+import pytest
+from src.database import Database
+
+
+def test_sqlite_anterior_a_3_35_se_rechaza_sin_tocar_la_base(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite3, 'sqlite_version_info', (3, 31, 1))
+    ruta = tmp_path / 'viaticos.db'
+
+    with pytest.raises(RuntimeError, match='3.35.0'):
+        Database(str(ruta))
+
+    assert not os.path.exists(ruta)
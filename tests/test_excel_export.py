@@ -0,0 +1,20 @@
+"""
+Pruebas de la exportación a Excel
+"""
+
+import pytest
+from src import excel_export
+from src.modelos import Factura
+
+
+def test_error_al_generar_no_deja_archivos(tmp_path, monkeypatch):
+    monkeypatch.setattr(excel_export, 'FACTURAS_FOLDER', str(tmp_path))
+
+    def fallar(sheet):
+        raise OSError("disco lleno")
+    monkeypatch.setattr(excel_export, '_ajustar_anchos', fallar)
+
+    with pytest.raises(OSError):
+        excel_export.generar_excel([Factura(fecha='2025-01-10', monto=None)], user_id=1)
+
+    assert list(tmp_path.iterdir()) == []
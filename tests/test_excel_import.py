@@ -0,0 +1,74 @@
+"""
+Pruebas de la importación de facturas desde .csv y .xlsx
+"""
+
+from decimal import Decimal
+import pytest
+from openpyxl import Workbook
+from src.config import EXCEL_CONFIG
+from src.excel_import import leer_facturas
+from src.modelos import Factura
+
+
+def _csv(tmp_path, montos, separador=';'):
+    ruta = tmp_path / 'facturas.csv'
+    filas = [separador.join(EXCEL_CONFIG['columns'])]
+    for i, monto in enumerate(montos, start=1):
+        filas.append(separador.join(['05/01/2025', '1234567', 'Proveedor', 'A1', str(i), 'Alimentación',
+                                     f'"{monto}"']))
+    ruta.write_text('\n'.join(filas) + '\n', encoding='utf-8')
+    return str(ruta)
+
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('1.234,50', Decimal('1234.50')),
+    ('1,234.50', Decimal('1234.50')),
+    ('Q 1.234,50', Decimal('1234.50')),
+    ('12,5', Decimal('12.50')),
+    ('12.50', Decimal('12.50')),
+    ('1.234.567', Decimal('1234567.00')),
+    ('1,234,567.89', Decimal('1234567.89')),
+])
+def test_montos_con_separadores(tmp_path, texto, esperado):
+    facturas, rechazadas = leer_facturas(_csv(tmp_path, [texto]))
+    assert rechazadas == []
+    assert [f.monto for _, f in facturas] == [esperado]
+
+
+@pytest.mark.parametrize('texto', ['1.234', '1,234'])
+def test_monto_ambiguo_es_error_de_fila(tmp_path, texto):
+    facturas, rechazadas = leer_facturas(_csv(tmp_path, [texto]))
+    assert facturas == []
+    assert len(rechazadas) == 1
+    fila, motivo = rechazadas[0]
+    assert fila == 2 and 'ambiguo' in motivo
+
+
+def test_monto_con_separadores_mezclados_es_invalido(tmp_path):
+    _, rechazadas = leer_facturas(_csv(tmp_path, ['1.23,45']))
+    assert 'inválido' in rechazadas[0][1]
+
+
+def test_montos_numericos_del_xlsx(tmp_path):
+    ruta = str(tmp_path / 'facturas.xlsx')
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(EXCEL_CONFIG['columns'])
+    sheet.append(['2025-01-05', '1234567', 'Proveedor', 'A1', '1', 'Alimentación', 1.234])
+    sheet.append(['2025-01-05', '1234567', 'Proveedor', 'A1', '2', 'Alimentación', 1234.5])
+    workbook.save(ruta)
+
+    facturas, rechazadas = leer_facturas(ruta)
+    assert rechazadas == []
+    assert [f.monto for _, f in facturas] == [Decimal('1.23'), Decimal('1234.50')]
+
+
+def test_duplicado_de_otro_usuario_no_muestra_su_factura(db):
+    db.insertar_factura(1, '2025-01-05', '1234567', 'Proveedor', 'A1', '1', 'Alimentación',
+                        Decimal('10.00'), 'facturas/f.jpg')
+    factura = Factura(fecha='2025-01-06', nit_proveedor='1234567', nombre_proveedor='Proveedor', serie='A1',
+                      numero='1', tipo_gasto='Alimentación', monto=Decimal('10.00'))
+
+    assert db.importar_facturas(2, [(2, factura)]) == (0, [(2, 'ya registrada por otro usuario')])
+    insertadas, duplicadas = db.importar_facturas(1, [(2, factura)])
+    assert insertadas == 0 and duplicadas[0][1].startswith('ya registrada como #')
@@ -0,0 +1,33 @@
+"""
+Pruebas de las métricas de consultas
+"""
+
+from src.instrumentacion import MetricasConsultas
+
+
+def test_percentiles_de_una_sola_muestra_no_pasan_del_maximo():
+    metricas = MetricasConsultas(umbral_lento_ms=1000)
+    metricas.registrar('obtener_usuario', 'SELECT 1', 1.3, 1, 0.0)
+
+    datos = metricas.resumen()['obtener_usuario']
+    assert datos['max_ms'] == 1.3
+    assert datos['p50_ms'] == 1.3
+    assert datos['p95_ms'] == 1.3
+
+
+def test_percentiles_usan_el_limite_del_intervalo_bajo_el_maximo():
+    metricas = MetricasConsultas(umbral_lento_ms=1000)
+    for duracion in (0.05, 0.06, 0.07, 0.08, 30.0):
+        metricas.registrar('listar', 'SELECT 1', duracion, 1, 0.0)
+
+    datos = metricas.resumen()['listar']
+    assert datos['p50_ms'] == 0.1
+    assert datos['p95_ms'] == 30.0
+    assert datos['p50_ms'] <= datos['p95_ms'] <= datos['max_ms']
+
+
+def test_percentil_en_el_ultimo_intervalo_es_el_maximo():
+    metricas = MetricasConsultas(umbral_lento_ms=100000)
+    metricas.registrar('lenta', 'SELECT 1', 2500.0, 1, 0.0)
+
+    assert metricas.resumen()['lenta']['p95_ms'] == 2500.0
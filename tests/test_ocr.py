@@ -0,0 +1,35 @@
+"""
+Pruebas de la inferencia del tipo de gasto desde el texto del OCR
+"""
+
+import pytest
+from src.ocr import _detectar_tipo_gasto
+
+
+@pytest.mark.parametrize('texto, esperado', [
+    # Gasolinera: tipo de combustible con galones y número de bomba
+    ('ESTACION DE SERVICIO LA PAZ\nBOMBA #3\nSUPER 8.532 GLS   Q 275.00\nTOTAL Q 275.00', 'COMBUSTIBLE'),
+    ('GASOLINERA PUMA\nDIESEL 10.00 GALONES\nTOTAL Q 310.00', 'COMBUSTIBLE'),
+    ('Shell V-Power\nREGULAR 5.2 GL\nEfectivo', 'COMBUSTIBLE'),
+    # Restaurante: mesa con número, mesero y propina
+    ('RESTAURANTE EL PORTAL\nMESA #12  MESERO: LUIS\n2 ALMUERZO EJECUTIVO\nPROPINA Q 10.00', 'ALIMENTACIÓN'),
+    ('Pollo Campero\nCOMBO 3 PIEZAS\nBEBIDA GRANDE', 'ALIMENTACIÓN'),
+])
+def test_facturas_con_evidencia_clara(texto, esperado):
+    assert _detectar_tipo_gasto(texto) == esperado
+
+
+@pytest.mark.parametrize('texto', [
+    # Supermercado: SUPER en el nombre del comercio no es combustible
+    'SUPER TIENDA LA BARATA\nDETERGENTE 1 KG\nJABON\nTOTAL Q 45.00',
+    # Ferretería con REGULAR y BOMBA sueltos y MESA en la dirección
+    'FERRETERIA EL MARTILLO\nBOMBA DE AGUA 1/2 HP\nPRECIO REGULAR\n4a. calle Mesa Redonda zona 1',
+    # Cena mencionada en una tienda
+    'ABARROTERIA\nVELAS PARA CENA\nTOTAL Q 12.00',
+    # Una sola coincidencia no alcanza el margen mínimo
+    'LIBRERIA\nCAFE 1 LB\nCUADERNOS',
+    # Evidencia de los dos tipos: la tienda de conveniencia de la gasolinera
+    'GASOLINERA TEXACO\nTIENDA STAR MART\nCAFE AMERICANO\nPIZZA PERSONAL',
+])
+def test_facturas_ambiguas_preguntan_el_tipo(texto):
+    assert _detectar_tipo_gasto(texto) is None
@@ -0,0 +1,21 @@
+"""
+Pruebas de los planes de las consultas frecuentes
+"""
+
+from decimal import Decimal
+from src.admin import ejecutar_consultas_frecuentes
+from src.instrumentacion import es_escaneo_completo
+
+
+def test_consultas_frecuentes_no_recorren_tablas_completas(db):
+    db.insertar_factura(1, '2025-01-10', '1234567-8', 'Proveedor', 'A1B2C3D4', '1', 'COMBUSTIBLE',
+                        Decimal('25.00'), 'facturas/f.jpg')
+    db._metricas.capturar_planes = True
+
+    ejecutar_consultas_frecuentes(db, 1)
+
+    planes = db._metricas.planes()
+    assert planes
+    escaneos = {consulta: paso for (consulta, _), plan in planes.items()
+                for paso in plan if es_escaneo_completo(paso)}
+    assert escaneos == {}
@@ -0,0 +1,26 @@
+"""
+Pruebas del directorio de proveedores
+"""
+
+from decimal import Decimal
+import pytest
+
+
+def test_factura_nueva_agrega_el_proveedor(db):
+    db.insertar_factura(1, '2025-03-10', '1234567-8', 'Pollo Campero', 'A1', '1', 'Alimentación',
+                        Decimal('25.00'), 'facturas/f.jpg')
+    assert db.obtener_nombre_proveedor('12345678') == 'Pollo Campero'
+
+
+def test_escritura_revertida_no_deja_el_proveedor_en_memoria(db):
+    def operacion(c):
+        db._agregar_proveedor_si_no_existe(c, '7654321', 'Proveedor Revertido')
+        raise ValueError("falla después de agregar el proveedor")
+
+    with pytest.raises(ValueError):
+        db._escribir_en_lote('prueba', operacion)
+
+    assert db.obtener_nombre_proveedor('7654321') is None
+    with db._lectura('prueba') as c:
+        c.execute("SELECT COUNT(*) FROM proveedores WHERE nit = '7654321'")
+        assert c.fetchone()[0] == 0
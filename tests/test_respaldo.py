@@ -0,0 +1,33 @@
+"""
+Pruebas de la rotación de respaldos
+"""
+
+import os
+from src.respaldo import listar_respaldos, rotar_respaldos
+
+
+def _crear(directorio, nombres):
+    for nombre in nombres:
+        (directorio / nombre).write_bytes(b'')
+
+
+def test_copias_previas_a_restaurar_no_cuentan_en_la_retencion(tmp_path):
+    diarios = [f'viaticos-2025010{d}-030000.db' for d in range(1, 6)]
+    restauraciones = [f'viaticos-2025010{d}-120000-antes-de-restaurar.db' for d in range(1, 5)]
+    _crear(tmp_path, diarios + restauraciones)
+
+    eliminados = rotar_respaldos('viaticos.db', str(tmp_path), retencion=3)
+
+    assert sorted(os.path.basename(r) for r in eliminados) == diarios[:2]
+    assert len(listar_respaldos('viaticos.db', str(tmp_path), restauraciones=True)) == 4
+
+
+def test_copias_previas_a_restaurar_se_rotan_aparte(tmp_path):
+    diarios = [f'viaticos-2025010{d}-030000.db' for d in range(1, 4)]
+    restauraciones = [f'viaticos-2025010{d}-120000-antes-de-restaurar.db' for d in range(1, 5)]
+    _crear(tmp_path, diarios + restauraciones)
+
+    eliminados = rotar_respaldos('viaticos.db', str(tmp_path), retencion=2, restauraciones=True)
+
+    assert sorted(os.path.basename(r) for r in eliminados) == restauraciones[:2]
+    assert len(listar_respaldos('viaticos.db', str(tmp_path), restauraciones=False)) == 3